@@ -0,0 +1,96 @@
+"""Benchmarks the .pho parser and serializer of ``PhonemeList`` against
+the previous implementation (a list of one object per phoneme, parsed and
+printed line by line), on synthetic inputs of 10k, 100k and 1M phonemes.
+
+Run with ``python benchmarks/bench_pho.py``."""
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+# run as a script, only the benchmarks' folder is in the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from voxpopuli import PhonemeList
+
+SIZES = (10_000, 100_000, 1_000_000)
+NAMES = ["a", "@", "e~", "l", "R", "s", "t", "_", "@U", "tS"]
+
+
+def make_pho(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(size):
+        points = " ".join("%d %d" % (percent, rng.randint(60, 200))
+                          for percent in sorted(rng.sample(range(101),
+                                                           rng.randint(0, 6))))
+        lines.append("%s\t%d\t%s" % (rng.choice(NAMES), rng.randint(10, 300),
+                                     points))
+    return "\n".join(lines)
+
+
+class ReferencePhoneme:
+    """The previous, object per phoneme, implementation"""
+
+    def __init__(self, name, duration, pitch_mods):
+        self.name = name
+        self.duration = duration
+        self.pitch_modifiers = pitch_mods
+
+    def __str__(self):
+        return self.name + "\t" \
+               + str(self.duration) + "\t" \
+               + " ".join([str(percent) + " " + str(pitch)
+                           for percent, pitch in self.pitch_modifiers])
+
+    @classmethod
+    def from_str(cls, pho_str):
+        split_pho = pho_str.split()
+        name = split_pho.pop(0)
+        duration = int(split_pho.pop(0))
+        points = iter(split_pho)
+        return cls(name, duration, [(int(percent), int(pitch))
+                                    for percent, pitch in zip(points, points)])
+
+
+def line_by_line_parse(pho: str) -> list:
+    return [ReferencePhoneme.from_str(line)
+            for line in pho.split("\n") if line.strip()]
+
+
+def line_by_line_str(phonemes: list) -> str:
+    return "\n".join([str(phoneme) for phoneme in phonemes])
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print("%10s %-22s %10s" % ("phonemes", "operation", "seconds"))
+    for size in SIZES:
+        pho = make_pho(size)
+        phonemes, parse_time = timed(PhonemeList.from_pho_str, pho)
+        reference, reference_parse_time = timed(line_by_line_parse, pho)
+        pho_bytes = pho.encode("utf-8")
+        _, bytes_time = timed(PhonemeList.from_pho_bytes, pho_bytes)
+        _, file_time = timed(PhonemeList.from_pho_file, io.BytesIO(pho_bytes))
+        serialized, str_time = timed(str, phonemes)
+        reference_str, reference_str_time = timed(line_by_line_str, reference)
+        _, write_time = timed(phonemes.write_pho, io.BytesIO())
+        assert serialized == reference_str
+        for operation, seconds in (("parse (line by line)", reference_parse_time),
+                                   ("from_pho_str", parse_time),
+                                   ("from_pho_bytes", bytes_time),
+                                   ("from_pho_file", file_time),
+                                   ("str (line by line)", reference_str_time),
+                                   ("str", str_time),
+                                   ("write_pho", write_time)):
+            print("%10d %-22s %10.3f" % (size, operation, seconds))
+
+
+if __name__ == "__main__":
+    main()
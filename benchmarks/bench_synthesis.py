@@ -0,0 +1,213 @@
+"""Benchmarks the synthesis hot paths on the corpora of ``corpora.py``:
+``Voice.to_phonemes``, ``Voice.to_audio`` (from a str and from a
+``PhonemeList``), ``PhonemeList.from_pho_str`` and ``str``, and
+``Voice._wav_format``.
+
+Each operation is timed call by call, and reported with its throughput,
+its latency percentiles, the peak RSS of the process (and of its children)
+and the number of subprocesses it started. With ``--stub``, espeak and
+mbrola are replaced by the shell scripts of ``benchmarks/stubs``, so that
+the Python overhead can be measured on its own.
+
+Run with ``python benchmarks/bench_synthesis.py [--stub] [--json FILE]``,
+and compare two runs with ``--compare OLD.json``."""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# run as a script, only the benchmarks' folder is in the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from corpora import SENTENCES, corpora
+from voxpopuli import PhonemeList, Voice
+from voxpopuli.cache import binary_version
+
+STUBS_FOLDER = Path(__file__).resolve().parent / "stubs"
+PERCENTILES = (50, 95, 99)
+OPERATIONS = ("to_phonemes", "to_audio_text", "to_audio_phonemes",
+              "from_pho_str", "pho_str", "wav_format")
+
+
+class SubprocessCounter:
+    """Counts the subprocesses started while it's installed, whatever the
+    module that started them"""
+
+    def __init__(self):
+        self.count = 0
+        self._execute_child = None
+
+    def install(self):
+        execute_child = self._execute_child = subprocess.Popen._execute_child
+
+        def counting_execute_child(popen, *args, **kwargs):
+            self.count += 1
+            return execute_child(popen, *args, **kwargs)
+
+        subprocess.Popen._execute_child = counting_execute_child
+
+    def uninstall(self):
+        subprocess.Popen._execute_child = self._execute_child
+
+
+def use_stubs(voices_folder: Path):
+    """Points ``Voice`` to the stub binaries, and to fake voices for all the
+    languages of the corpora"""
+    Voice.espeak_binary = str(STUBS_FOLDER / "espeak")
+    Voice.mbrola_binary = str(STUBS_FOLDER / "mbrola")
+    Voice.mbrola_voices_folder = str(voices_folder)
+    Voice.extra_mbrola_voices_folders = []
+    for lang in SENTENCES:
+        voice_folder = voices_folder / (lang + "1")
+        voice_folder.mkdir()
+        (voice_folder / (lang + "1")).write_bytes(b"")
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile"""
+    rank = max(int(round(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def peak_rss_kb(who: int) -> int:
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS, and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(func: Callable, inputs: List, counter: SubprocessCounter,
+            min_time: float, min_calls: int) -> Dict:
+    """Calls ``func`` on the inputs in turn, for at least ``min_calls``
+    calls and ``min_time`` seconds"""
+    latencies = []
+    subprocesses = counter.count
+    started = time.perf_counter()
+    while (len(latencies) < min_calls
+           or time.perf_counter() - started < min_time):
+        item = inputs[len(latencies) % len(inputs)]
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    latencies.sort()
+    result = {"calls": len(latencies),
+              "ops_per_sec": len(latencies) / total if total else None,
+              "subprocesses_per_call":
+                  (counter.count - subprocesses) / len(latencies),
+              "peak_rss_kb": peak_rss_kb(resource.RUSAGE_SELF),
+              "children_peak_rss_kb": peak_rss_kb(resource.RUSAGE_CHILDREN)}
+    for percent in PERCENTILES:
+        result["p%d_ms" % percent] = percentile(latencies, percent) * 1000
+    return result
+
+
+def operations(voice: Voice, texts: List[str]) -> Dict[str, tuple]:
+    """The benchmarked functions and their inputs, computed beforehand so
+    that only the operation itself is timed"""
+    phonemes = [voice.to_phonemes(text) for text in texts]
+    pho_strs = [str(phoneme_list) for phoneme_list in phonemes]
+    raw_wavs = [voice._render(phoneme_list) for phoneme_list in phonemes]
+    return {"to_phonemes": (voice.to_phonemes, texts),
+            "to_audio_text": (voice.to_audio, texts),
+            "to_audio_phonemes": (voice.to_audio, phonemes),
+            "from_pho_str": (PhonemeList.from_pho_str, pho_strs),
+            "pho_str": (str, phonemes),
+            "wav_format": (voice._wav_format, raw_wavs)}
+
+
+def run(langs: List[str], selected: List[str], min_time: float,
+        min_calls: int) -> List[Dict]:
+    counter = SubprocessCounter()
+    counter.install()
+    results = []
+    try:
+        for lang in langs:
+            try:
+                voice = Voice(lang=lang)
+            except Voice.InvalidVoiceParameters as error:
+                print("skipping %s: %s" % (lang, error), file=sys.stderr)
+                continue
+            for corpus, texts in corpora(lang).items():
+                for operation, (func, inputs) in operations(voice,
+                                                            texts).items():
+                    if operation not in selected:
+                        continue
+                    result = measure(func, inputs, counter, min_time,
+                                     min_calls)
+                    result.update(operation=operation, lang=lang,
+                                  corpus=corpus)
+                    results.append(result)
+                    print_result(result)
+    finally:
+        counter.uninstall()
+    return results
+
+
+def print_result(result: Dict, baseline: Optional[Dict] = None):
+    line = ("%-18s %-3s %-10s %10.1f ops/s  p50 %9.3f ms  p95 %9.3f ms  "
+            "p99 %9.3f ms  %4.1f procs/call  rss %7d kB"
+            % (result["operation"], result["lang"], result["corpus"],
+               result["ops_per_sec"] or 0, result["p50_ms"],
+               result["p95_ms"], result["p99_ms"],
+               result["subprocesses_per_call"], result["peak_rss_kb"]))
+    if baseline is not None and baseline.get("ops_per_sec"):
+        line += "  x%.2f" % ((result["ops_per_sec"] or 0)
+                             / baseline["ops_per_sec"])
+    print(line)
+
+
+def compare(results: List[Dict], baseline_path: str):
+    """Prints the speedup of each operation over a previous JSON report"""
+    with open(baseline_path) as baseline_file:
+        baseline = {(result["operation"], result["lang"], result["corpus"]):
+                    result for result in json.load(baseline_file)["results"]}
+    print("\ncompared to %s:" % baseline_path)
+    for result in results:
+        print_result(result, baseline.get((result["operation"],
+                                           result["lang"], result["corpus"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stub", action="store_true",
+                        help="use fake espeak and mbrola binaries")
+    parser.add_argument("--langs", nargs="+", default=list(SENTENCES),
+                        choices=list(SENTENCES))
+    parser.add_argument("--operations", nargs="+", default=list(OPERATIONS),
+                        choices=OPERATIONS)
+    parser.add_argument("--min-time", type=float, default=1.,
+                        help="minimum duration of each benchmark, in seconds")
+    parser.add_argument("--min-calls", type=int, default=5)
+    parser.add_argument("--json", help="writes the results to this file")
+    parser.add_argument("--compare", help="a previous JSON report")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as voices_folder:
+        if args.stub:
+            use_stubs(Path(voices_folder))
+        results = run(args.langs, args.operations, args.min_time,
+                      args.min_calls)
+        report = {"meta": {"python": sys.version.split()[0],
+                           "platform": platform.platform(),
+                           "stub": args.stub,
+                           "espeak": binary_version(Voice.espeak_binary,
+                                                    "--version"),
+                           "mbrola": binary_version(Voice.mbrola_binary, "-h"),
+                           "time": time.time()},
+                  "results": results}
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Fixed texts used by the synthesis benchmarks, for each language: short
+prompts, paragraphs and long documents"""
+from typing import Dict, List
+
+SENTENCES = {
+    "fr": ["Bonjour, comment allez-vous ?",
+           "Le train de dix heures est annulé.",
+           "Il fait beau aujourd'hui sur la côte.",
+           "Merci de patienter quelques instants.",
+           "La réunion commence dans cinq minutes.",
+           "Veuillez répéter votre numéro de dossier."],
+    "en": ["Hello, how are you today?",
+           "The ten o'clock train has been cancelled.",
+           "It is a sunny day on the coast.",
+           "Please hold on for a few moments.",
+           "The meeting starts in five minutes.",
+           "Could you repeat your account number?"],
+    "de": ["Guten Tag, wie geht es Ihnen?",
+           "Der Zug um zehn Uhr fällt heute aus.",
+           "An der Küste scheint heute die Sonne.",
+           "Bitte warten Sie einen Augenblick.",
+           "Die Besprechung beginnt in fünf Minuten.",
+           "Wiederholen Sie bitte Ihre Kundennummer."],
+    "es": ["Hola, ¿cómo está usted?",
+           "El tren de las diez ha sido cancelado.",
+           "Hoy hace sol en la costa.",
+           "Por favor, espere unos momentos.",
+           "La reunión empieza en cinco minutos.",
+           "¿Puede repetir su número de cliente?"],
+    "it": ["Buongiorno, come sta?",
+           "Il treno delle dieci è stato cancellato.",
+           "Oggi c'è il sole sulla costa.",
+           "La preghiamo di attendere qualche istante.",
+           "La riunione inizia tra cinque minuti.",
+           "Può ripetere il suo numero di pratica?"],
+}
+
+PARAGRAPH_SENTENCES = 5
+LONG_DOCUMENT_PARAGRAPHS = 20
+
+
+def _paragraphs(sentences: List[str]) -> List[str]:
+    """Every paragraph starts at a different sentence, so that they
+    aren't all the same"""
+    return [" ".join(sentences[(start + offset) % len(sentences)]
+                     for offset in range(PARAGRAPH_SENTENCES))
+            for start in range(len(sentences))]
+
+
+def corpora(lang: str) -> Dict[str, List[str]]:
+    """The short prompts, paragraphs and long documents of a language"""
+    sentences = SENTENCES[lang]
+    paragraphs = _paragraphs(sentences)
+    long_documents = ["\n".join(paragraphs[(start + offset) % len(paragraphs)]
+                                for offset in range(LONG_DOCUMENT_PARAGRAPHS))
+                      for start in range(2)]
+    return {"short": sentences,
+            "paragraph": paragraphs,
+            "long": long_documents}
@@ -34,6 +34,7 @@ setup(
     keywords='tts speech phonemes audio',
     packages=find_packages(),
     install_requires=[],
+    extras_require={'numpy': ['numpy']},
     include_package_data=True,
     test_suite='nose.collector',
     tests_require=['nose'])
@@ -1,8 +1,42 @@
+import asyncio
+import functools
+import hashlib
+import io
+import json
+import tempfile
 import unittest
+import os
+import struct
+import subprocess
 from os import path
+from pathlib import Path
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from voxpopuli.aio import AsyncVoice
+from voxpopuli.cache import SynthesisCache, binary_version
+from voxpopuli.conversion import OutputFormat
+from voxpopuli.ensemble import VoiceEnsemble
+from voxpopuli.errors import RetryPolicy
+from voxpopuli.incremental import IncrementalRenderer
+from voxpopuli.metrics import Histogram, MetricsCollector
 from voxpopuli.main import Voice
-from voxpopuli.phonemes import PhonemeList
+from voxpopuli.playback import FileSink, NullSink, PlaybackEngine
+from voxpopuli.pool import ProcessPool
+from voxpopuli.registry import VoiceRegistry
+from voxpopuli.render import read_corpus, render_corpus
+from voxpopuli.phonemes import PhonemeList, Phoneme, BritishEnglishPhonemes, \
+    FrenchPhonemes, ItalianPhonemes, iter_pho
+from voxpopuli.segment import split_sentences
+from voxpopuli.timing import TimingIndex
+from voxpopuli.server import SynthesisServer, VoiceClient, VoiceKey
+from voxpopuli import espeak_lib, voice_install
 
 logging.getLogger().setLevel(logging.DEBUG)
 
@@ -26,6 +60,46 @@ class TestStrToPhonemes(unittest.TestCase):
         self.assertEqual(voice.to_phonemes("hallo").phonemes_str, "halo:__")
 
 
+class TestEspeakLibrary(unittest.TestCase):
+
+    @unittest.skipIf(espeak_lib.load() is None, "the espeak library isn't installed")
+    def test_phonemes(self):
+        self.assertEqual(Voice(lang="fr", espeak_library=True).to_phonemes("bonjour").phonemes_str,
+                         "bo~ZuR__")
+        self.assertEqual(Voice(lang="en", espeak_library=True).to_phonemes("second").phonemes_str,
+                         "sek@nd__")
+        self.assertEqual(Voice(lang="de", voice_id=4, espeak_library=True).to_phonemes("hallo").phonemes_str,
+                         "halo:__")
+
+    @unittest.skipIf(espeak_lib.load() is None, "the espeak library isn't installed")
+    def test_same_as_subprocess(self):
+        text = "Salut les amis, comment allez vous ?"
+        for params in ({"lang": "fr"}, {"lang": "fr", "voice_id": 4, "speed": 120, "pitch": 80}):
+            voice = Voice(**params)
+            library_voice = Voice(espeak_library=True, **params)
+            self.assertEqual(str(library_voice.to_phonemes(text)), str(voice.to_phonemes(text)))
+            self.assertEqual(library_voice.to_audio(text), voice.to_audio(text))
+
+    def test_wiring(self):
+        text = "Salut les amis"
+        subprocess_voice = Voice(lang="fr", voice_id=1, speed=120, pitch=80)
+        pho = str(subprocess_voice.to_phonemes(text)).encode("utf-8")
+        calls = []
+
+        class FakeLibrary:
+            def phonemize(self, text, voice_name, speed, pitch):
+                calls.append((text, voice_name, speed, pitch))
+                return pho
+
+        voice = Voice(lang="fr", voice_id=1, speed=120, pitch=80, espeak_library=True)
+        voice._loaded_espeak_library = FakeLibrary
+        self.assertEqual(str(voice.to_phonemes(text)), pho.decode("utf-8"))
+        self.assertEqual(voice.to_audio(text), subprocess_voice.to_audio(text))
+        self.assertEqual(calls, [(text, voice._espeak_voice_name(), 120, 80)] * 2)
+        # the library is only used when asked for
+        self.assertIsNone(Voice(lang="fr")._loaded_espeak_library())
+
+
 class TestStrToAudio(unittest.TestCase):
     data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
 
@@ -41,6 +115,20 @@ class TestStrToAudio(unittest.TestCase):
         with open(path.join(self.data_folder, "hallo.wav"), "rb") as wavfile:
             self.assertEqual(wavfile.read(), wav_byte)
 
+    def test_stdin_as_argv(self):
+        # the text fed over stdin gives what it gave on the command line
+        for voice, text, expected in ((Voice(lang="fr", voice_id=1), "Salut les amis", "salut.wav"),
+                                      (Voice(lang="de", voice_id=4), "Hallo Freunde", "hallo.wav")):
+            args = [arg for arg in voice._espeak_args() if arg != "--stdin"] + [text]
+            argv_pho = subprocess.run(args, stdout=subprocess.PIPE, check=True,
+                                      env=voice._subprocess_env()).stdout
+            argv_phonemes = PhonemeList.from_pho_str(argv_pho.decode("utf-8").strip())
+            self.assertEqual(str(voice.to_phonemes(text)), str(argv_phonemes))
+            with open(path.join(self.data_folder, expected), "rb") as wavfile:
+                expected_wav = wavfile.read()
+            self.assertEqual(voice.to_audio(argv_phonemes), expected_wav)
+            self.assertEqual(voice.to_audio(text), expected_wav)
+
 
 class TestPhonemesToAudio(unittest.TestCase):
     data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
@@ -70,3 +158,887 @@ class TestVoiceParams(unittest.TestCase):
         wav_byte = voice.to_audio("PK LA VIE")
         with open(path.join(self.data_folder, "params_all.wav"), "rb") as wavfile:
             self.assertEqual(wavfile.read(), wav_byte)
+
+
+class TestProcessPool(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def test_pooled_salut(self):
+        with ProcessPool() as pool:
+            voice = Voice(lang="fr", voice_id=1, pool=pool)
+            with open(path.join(self.data_folder, "salut.wav"), "rb") as wavfile:
+                expected = wavfile.read()
+            for _ in range(3):
+                self.assertEqual(expected, voice.to_audio("Salut les amis"))
+            self.assertEqual(pool.stats()["mbrola"]["calls"], 3)
+
+    def test_standby_limits(self):
+        with ProcessPool(size=1, max_commands=2) as pool:
+            with ThreadPoolExecutor(8) as executor:
+                list(executor.map(lambda _: pool.run(["cat"], b"a", "espeak"), range(8)))
+            # concurrent calls don't start more workers than the pool's size
+            self.assertEqual(len(pool._standby[("cat",)]), 1)
+            for args in (["cat", "-"], ["cat", "-u"]):
+                self.assertEqual(pool.run(args, b"a", "espeak").stdout, b"a")
+            # the workers of the least recently used command line are killed
+            self.assertEqual(list(pool._standby), [("cat", "-"), ("cat", "-u")])
+            self.assertEqual(pool.stats()["espeak"]["calls"], 10)
+
+
+class TestBatch(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def test_audio_many(self):
+        voice = Voice(lang="fr", voice_id=1)
+        results = list(voice.to_audio_many(["Salut les amis", None,
+                                            "Salut les amis"], max_workers=2))
+        self.assertEqual([result.index for result in results], [0, 1, 2])
+        self.assertFalse(results[1].ok)
+        with open(path.join(self.data_folder, "salut.wav"), "rb") as wavfile:
+            expected = wavfile.read()
+        self.assertEqual(results[0].value, expected)
+        self.assertEqual(results[2].value, expected)
+
+
+class TestAsyncVoice(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def test_salut(self):
+        voice = AsyncVoice(lang="fr", voice_id=1, max_concurrency=2)
+        wav_bytes = asyncio.run(self._render_many(voice, "Salut les amis", 4))
+        with open(path.join(self.data_folder, "salut.wav"), "rb") as wavfile:
+            expected = wavfile.read()
+        for wav_byte in wav_bytes:
+            self.assertEqual(expected, wav_byte)
+
+    @staticmethod
+    async def _render_many(voice, text, count):
+        return await asyncio.gather(*[voice.ato_audio(text)
+                                      for _ in range(count)])
+
+
+class TestSynthesisCache(unittest.TestCase):
+
+    def test_memory_lru(self):
+        cache = SynthesisCache(max_memory_bytes=10)
+        cache.put("a", b"12345")
+        cache.put("b", b"12345")
+        self.assertEqual(cache.get("a"), b"12345")
+        cache.put("c", b"12345")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"12345")
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 1,
+                                         "memory_evictions": 1,
+                                         "disk_evictions": 0})
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = SynthesisCache(max_memory_bytes=5, folder=folder,
+                                   max_disk_bytes=10)
+            for key in "abc":
+                cache.put(key, b"12345")
+            self.assertEqual(cache.disk.evictions, 1)
+            cache = SynthesisCache(folder=folder)
+            self.assertEqual(cache.get("c"), b"12345")
+            self.assertEqual(cache.disk.size, 10)
+
+    def test_key_inputs(self):
+        voice = Voice(lang="fr", voice_id=1)
+        key = SynthesisCache.key("audio", "Salut", voice)
+        # a reinstalled voice database
+        stat = os.stat(str(voice._voice_database))
+        with tempfile.TemporaryDirectory() as folder:
+            database = path.join(folder, "fr1")
+            with open(str(voice._voice_database), "rb") as source, \
+                    open(database, "wb") as copy:
+                copy.write(source.read())
+            voice._voice_database = database
+            os.utime(database, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            moved = SynthesisCache.key("audio", "Salut", voice)
+            self.assertNotEqual(key, moved)
+            os.utime(database, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertNotEqual(moved, SynthesisCache.key("audio", "Salut", voice))
+
+        class FakeLibrary:
+            version = "1.51"
+
+        voice = Voice(lang="fr", voice_id=1)
+        voice._loaded_espeak_library = lambda: FakeLibrary
+        self.assertNotEqual(key, SynthesisCache.key("audio", "Salut", voice))
+
+    def test_binary_upgrade(self):
+        with tempfile.TemporaryDirectory() as folder:
+            binary = path.join(folder, "fake-espeak")
+            for version in ("1.48", "1.51"):
+                with open(binary, "w") as script:
+                    script.write("#!/bin/sh\necho %s\n" % version)
+                os.chmod(binary, 0o755)
+                mtime = os.stat(binary).st_mtime_ns
+                os.utime(binary, ns=(mtime, mtime + int(float(version) * 10**9)))
+                self.assertEqual(binary_version(binary, "--version"), version)
+
+
+class TestStreamAudio(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def test_salut(self):
+        voice = Voice(lang="fr", voice_id=1)
+        chunks = list(voice.stream_audio("Salut les amis", chunk_size=1024))
+        self.assertEqual(len(chunks[0]), 44)
+        self.assertTrue(all(len(chunk) <= 1024 for chunk in chunks[1:]))
+        with open(path.join(self.data_folder, "salut.wav"), "rb") as wavfile:
+            self.assertEqual(wavfile.read()[44:], b"".join(chunks)[44:])
+
+    def test_salut_to_file(self):
+        voice = Voice(lang="fr", voice_id=1)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = path.join(folder, "salut.wav")
+            voice.stream_to_file("Salut les amis", filename)
+            with open(filename, "rb") as streamed, \
+                    open(path.join(self.data_folder, "salut.wav"), "rb") as wavfile:
+                self.assertEqual(wavfile.read(), streamed.read())
+
+
+class TestLongText(unittest.TestCase):
+
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences("Salut les amis. Ça va ? Oui !"),
+                         ["Salut les amis.", "Ça va ?", "Oui !"])
+        self.assertEqual(split_sentences("un, deux, trois, quatre.",
+                                         max_length=12),
+                         ["un, deux,", "trois,", "quatre."])
+
+    def test_to_audio_long(self):
+        voice = Voice(lang="fr", voice_id=1)
+        rendered = voice.to_audio_long("Salut les amis. Salut les amis.",
+                                       max_workers=2)
+        single = voice.to_audio("Salut les amis.")
+        self.assertEqual(len(rendered.wav), 2 * len(single) - 44)
+        self.assertEqual([(segment.start, segment.end)
+                          for segment in rendered.segments],
+                         [(44, len(single)),
+                          (len(single), 2 * len(single) - 44)])
+
+
+class TestPhonemeList(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def test_pho_round_trip(self):
+        pho_list = PhonemeList.from_pho_str("h\t109\n@\t58\t0 74 100 79\n_\t1")
+        self.assertEqual(str(pho_list), "h\t109\t\n@\t58\t0 74 100 79\n_\t1\t")
+        self.assertEqual(pho_list.phonemes_str, "h@_")
+
+    def test_views(self):
+        with open(path.join(self.data_folder, "hello.pho")) as pho_file:
+            pho_list = PhonemeList.from_pho_str(pho_file.read())
+        for phoneme in pho_list:
+            phoneme.duration *= 2
+        self.assertEqual(pho_list[0].duration, 218)
+        view = pho_list[1]
+        pho_list.insert(0, Phoneme("a", 10))
+        view.duration = 1.5
+        self.assertEqual(str(pho_list[2]), "@\t1.5\t0 74 20 75 40 76 59 78 80 79 100 79")
+        pho_list[0].set_from_pitches_list([100, 120])
+        self.assertEqual(pho_list[0].pitch_modifiers, [(0.0, 100), (100.0, 120)])
+        self.assertEqual(pho_list.phonemes_str, "ah@l@U__")
+
+    def test_list_api(self):
+        pho_list = PhonemeList.from_pho_str("a\t10\t0 100\nb\t20\nc\t30")
+        self.assertEqual(pho_list.index(pho_list[1]), 1)
+        self.assertIn(pho_list[0], pho_list)
+        pho_list.remove(pho_list[0])
+        self.assertEqual(pho_list.phonemes_str, "bc")
+        pho_list[0].pitch_modifiers.append((50, 200))
+        pho_list[1].pitch_modifiers = [(0, 100)]
+        pho_list[1].pitch_modifiers[0] = (0, 120)
+        self.assertEqual(str(pho_list), "b\t20\t50 200\nc\t30\t0 120")
+
+    def test_shared_phoneme(self):
+        phoneme = Phoneme("a", 100)
+        first, second = PhonemeList([phoneme]), PhonemeList([])
+        second.append(phoneme)
+        phoneme.duration = 5
+        self.assertEqual((first[0].duration, second[0].duration), (5, 5))
+        second[0].pitch_modifiers.append((0, 90))
+        self.assertEqual(first[0].pitch_modifiers, [(0, 90)])
+        self.assertIn(phoneme, second)
+        copied = first.copy()
+        copied[0].duration = 1
+        self.assertEqual(first[0].duration, 5)
+
+    def test_shared_storage(self):
+        pho_list = PhonemeList.from_pho_str("a\t10\t0 100\nb\t20\nc\t30")
+        doubled = pho_list + pho_list
+        doubled[0].duration = 5
+        self.assertEqual((pho_list[0].duration, doubled[3].duration), (5, 5))
+        sliced = PhonemeList(pho_list[1:])
+        sliced[0].name = "d"
+        self.assertEqual(pho_list.phonemes_str, "adc")
+        # unrelated lists are copied
+        other = PhonemeList.from_pho_str("e\t40")
+        joined = pho_list + other
+        joined[0].duration = 1
+        self.assertEqual(pho_list[0].duration, 5)
+        self.assertEqual(joined.phonemes_str, "adce")
+        # a copy only holds the phonemes still in the list
+        pho_list[0].pitch_modifiers = [(0, 100), (50, 120)]
+        pho_list.reverse()
+        del pho_list[0]
+        copied = pho_list.copy()
+        self.assertEqual(str(copied), str(pho_list))
+        self.assertEqual(len(copied._store), 2)
+
+    def test_many_names(self):
+        pho_list = PhonemeList.from_pho_str("\n".join("n%d\t10" % index
+                                                       for index in range(70000)))
+        self.assertEqual(pho_list[-1].name, "n69999")
+
+    def test_pho_files(self):
+        with open(path.join(self.data_folder, "hello.pho"), "rb") as pho_file:
+            pho_bytes = pho_file.read()
+        expected = str(PhonemeList.from_pho_str(pho_bytes.decode("utf-8")))
+        self.assertEqual(str(PhonemeList.from_pho_bytes(memoryview(pho_bytes))),
+                         expected)
+        self.assertEqual(str(PhonemeList.from_pho_file(io.BytesIO(pho_bytes),
+                                                       batch_size=4)), expected)
+        pho_list = PhonemeList.from_pho_file(path.join(self.data_folder, "hello.pho"))
+        self.assertEqual(str(pho_list), expected)
+        self.assertEqual([len(batch) for batch in
+                          iter_pho(io.BytesIO(pho_bytes), batch_size=4)], [4, 2])
+        buffer = io.StringIO()
+        pho_list.write_pho(buffer, batch_size=4)
+        self.assertEqual(buffer.getvalue(), expected)
+        self.assertEqual(pho_list.to_pho_bytes(), expected.encode("utf-8"))
+
+    def test_classify(self):
+        pho_list = PhonemeList.from_pho_str('_\t10\nb\t50\na\t60\nQ\t40\n"a\t30')
+        bits = FrenchPhonemes.CLASS_BITS
+        masks = pho_list.classify("fr")
+        self.assertEqual(masks[0], 0)
+        self.assertEqual(masks[1], bits["PLOSIVES"] | bits["CONSONANTS"])
+        self.assertTrue(masks[2] & bits["VOWELS"])
+        self.assertEqual(masks[4], masks[2])
+        self.assertEqual(pho_list.validate("fr"), [3])
+        self.assertEqual(pho_list.validate(BritishEnglishPhonemes), [2, 4])
+        self.assertIn("a", ItalianPhonemes)
+        self.assertIs(FrenchPhonemes.all, FrenchPhonemes.all)
+
+
+@unittest.skipIf(numpy is None, "numpy isn't installed")
+class TestProsody(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def setUp(self):
+        with open(path.join(self.data_folder, "hello.pho")) as pho_file:
+            self.pho_list = PhonemeList.from_pho_str(pho_file.read())
+
+    def test_durations(self):
+        stretched = self.pho_list.copy()
+        stretched.scale_durations(2, BritishEnglishPhonemes.VOWELS)
+        self.assertEqual([phoneme.duration for phoneme in stretched],
+                         [109, 116, 103, 756, 718, 1])
+        self.assertEqual(self.pho_list[1].duration, 58)
+
+    def test_pitches(self):
+        self.pho_list.shift_pitch(10)
+        self.pho_list.scale_pitch(0.5, {"@U"})
+        self.assertEqual(self.pho_list[3].pitch_modifiers,
+                         [(0, 46), (80, 33), (100, 33)])
+        self.pho_list.fit_pitch_contour([100, 100])
+        self.assertEqual(self.pho_list[1].pitch_modifiers,
+                         [(percent, 100) for percent in (0, 20, 40, 59, 80, 100)])
+
+
+class TestVoiceRegistry(unittest.TestCase):
+
+    @staticmethod
+    def _install(folder, voice_name):
+        os.makedirs(path.join(folder, voice_name))
+        open(path.join(folder, voice_name, voice_name), "wb").close()
+
+    def test_scan(self):
+        with tempfile.TemporaryDirectory() as first, \
+                tempfile.TemporaryDirectory() as second:
+            self._install(first, "fr4")
+            self._install(second, "fr1")
+            self._install(second, "fr4")
+            os.makedirs(path.join(second, "en1"))
+            registry = VoiceRegistry([first, second])
+            self.assertEqual(registry.voice_ids("fr"), [1, 4])
+            self.assertEqual(registry.voice_ids("en"), [])
+            self.assertEqual(registry.find("fr", 4),
+                             Path(first) / "fr4" / "fr4")
+            version = registry.voices and registry.version
+            self.assertEqual(registry.voices and registry.version, version)
+            registry.refresh()
+            self._install(first, "de4")
+            self.assertEqual(registry.voice_ids("de"), [4])
+            self.assertEqual(registry.version, version + 1)
+
+    def test_database_after_folder(self):
+        with tempfile.TemporaryDirectory() as folder:
+            registry = VoiceRegistry([folder])
+            os.makedirs(path.join(folder, "fr1"))
+            self.assertEqual(registry.voice_ids("fr"), [])
+            open(path.join(folder, "fr1", "fr1"), "wb").close()
+            self.assertEqual(registry.voice_ids("fr"), [1])
+
+    def test_voices_for_lang(self):
+        voices = Voice.get_voices_for_lang("fr")
+        self.assertEqual([voice.voice_id for voice in voices],
+                         Voice.registry().voice_ids("fr"))
+        voices[0].speed = 100
+        self.assertEqual(Voice.get_voices_for_lang("fr")[0].speed, 160)
+
+
+class TestPCM(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def setUp(self):
+        with open(path.join(self.data_folder, "salut.wav"), "rb") as wavfile:
+            self.expected = wavfile.read()
+
+    def test_pcm(self):
+        voice = Voice(lang="fr", voice_id=1)
+        self.assertEqual(bytes(voice.to_pcm("Salut les amis")), self.expected[44:])
+
+    @unittest.skipIf(numpy is None, "numpy isn't installed")
+    def test_numpy(self):
+        samples = Voice(lang="fr", voice_id=1).to_numpy("Salut les amis")
+        self.assertEqual(samples.dtype, numpy.int16)
+        self.assertEqual(samples.tobytes(), self.expected[44:])
+
+    def test_to_file(self):
+        voice = Voice(lang="fr", voice_id=1)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = path.join(folder, "salut.wav")
+            voice.to_audio("Salut les amis", filename)
+            with open(filename, "rb") as wavfile:
+                self.assertEqual(wavfile.read(), self.expected)
+
+
+@unittest.skipIf(numpy is None, "numpy isn't installed")
+class TestOutputFormat(unittest.TestCase):
+    data_folder = path.join(path.dirname(path.realpath(__file__)), "data")
+
+    def setUp(self):
+        samples = numpy.sin(numpy.arange(16000) * 2 * numpy.pi * 440 / 16000)
+        self.pcm = (samples * 10000).astype('<i2').tobytes()
+
+    def test_chunked_conversion(self):
+        for output_format in (OutputFormat(8000), OutputFormat(22050, 2),
+                              OutputFormat(encoding="mulaw")):
+            converter = output_format.converter(16000)
+            whole = converter.process(self.pcm) + converter.flush()
+            converter = output_format.converter(16000)
+            chunked = b"".join(converter.process(self.pcm[i:i + 777])
+                               for i in range(0, len(self.pcm), 777))
+            self.assertEqual(chunked + converter.flush(), whole)
+
+    def test_resampling(self):
+        converter = OutputFormat(8000, encoding="float32").converter(16000)
+        samples = numpy.frombuffer(converter.process(self.pcm)
+                                   + converter.flush(), dtype='<f4')
+        self.assertEqual(len(samples), 8000)
+        self.assertAlmostEqual(float(numpy.abs(samples).max()), 0.305, 2)
+
+    def test_voice(self):
+        voice = Voice(lang="fr", voice_id=1,
+                      output_format=OutputFormat(8000, 2))
+        samples = voice.to_numpy("Salut les amis")
+        self.assertEqual(samples.shape[1], 2)
+        wav = voice.to_audio("Salut les amis")
+        self.assertEqual(wav[22:28], b"\x02\x00\x40\x1f\x00\x00")
+        self.assertEqual(b"".join(voice.stream_audio("Salut les amis"))[44:],
+                         wav[44:])
+
+    def test_invalid_format(self):
+        for output_format in (OutputFormat(0), OutputFormat(channels=0),
+                              OutputFormat(encoding="int8")):
+            with self.assertRaises(ValueError):
+                Voice(lang="fr", voice_id=1, output_format=output_format)
+
+    def test_non_pcm_header(self):
+        voice = Voice(lang="fr", voice_id=1,
+                      output_format=OutputFormat(8000, 2, encoding="mulaw"))
+        wav = voice.to_audio("Salut les amis")
+        # format chunk with cbSize, then the fact chunk
+        self.assertEqual(wav[16:20], struct.pack('<I', 18))
+        self.assertEqual(wav[36:46], b"\x00\x00fact\x04\x00\x00\x00")
+        self.assertEqual(struct.unpack('<I', wav[46:50])[0], (len(wav) - 58) // 2)
+        self.assertEqual(wav[50:54], b"data")
+        self.assertEqual(struct.unpack('<II', wav[4:8] + wav[54:58]),
+                         (len(wav) - 8, len(wav) - 58))
+        self.assertEqual(len(voice.to_pcm("Salut les amis")), len(wav) - 58)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = path.join(folder, "salut.wav")
+            voice.stream_to_file("Salut les amis", filename)
+            with open(filename, "rb") as wavfile:
+                self.assertEqual(wavfile.read(), wav)
+
+
+class TestVoiceEnsemble(unittest.TestCase):
+
+    def test_single_phonemization(self):
+        with ProcessPool() as pool:
+            voices = [Voice(lang="fr", voice_id=1, pool=pool),
+                      Voice(lang="fr", voice_id=1, volume=2, pool=pool)]
+            wavs = VoiceEnsemble(voices).to_audio("Salut les amis")
+            self.assertEqual(list(wavs), voices)
+            self.assertEqual(pool.stats()["espeak"]["calls"], 1)
+            self.assertEqual(pool.stats()["mbrola"]["calls"], 2)
+
+    def test_concatenated(self):
+        voices = [Voice(lang="fr", voice_id=1), Voice(lang="fr", voice_id=1)]
+        wav = VoiceEnsemble(voices).to_audio_concatenated("Salut les amis",
+                                                          pause=0)
+        single = voices[0].to_audio("Salut les amis")
+        self.assertEqual(wav[44:], single[44:] * 2)
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram([1, 2, 4, 8])
+        for value in (0.5, 1.5, 3, 3, 20):
+            histogram.add(value)
+        self.assertEqual(histogram.counts, [1, 1, 2, 0, 1])
+        self.assertEqual(histogram.percentile(50), 4)
+        self.assertEqual(histogram.percentile(100), 20)
+
+    def test_voice_stages(self):
+        metrics = MetricsCollector()
+        voice = Voice(lang="fr", voice_id=1, cache=SynthesisCache(),
+                      instrumentation=metrics)
+        voice.to_phonemes("Salut les amis")
+        voice.to_audio("Salut les amis")
+        voice.to_audio("Salut les amis")
+        snapshot = metrics.snapshot()
+        self.assertEqual(set(snapshot["stages"]),
+                         {"espeak", "mbrola", "parse", "pipeline", "wav_fixup"})
+        self.assertEqual(snapshot["stages"]["pipeline"]["count"], 1)
+        # the pipeline's processes are timed separately too
+        self.assertEqual(snapshot["stages"]["espeak"]["count"], 2)
+        self.assertEqual(snapshot["stages"]["mbrola"]["count"], 1)
+        self.assertGreater(snapshot["stages"]["espeak"]["bytes_out"], 0)
+        self.assertEqual(snapshot["cache"],
+                         {"phonemes": {"hits": 0, "misses": 1},
+                          "text_audio": {"hits": 1, "misses": 1}})
+
+
+class TestSynthesisErrors(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.phonemes = PhonemeList.from_pho_str("_\t10\na\t50\n_\t10")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def fake_mbrola(self, script: str, cache: SynthesisCache = None) -> Voice:
+        binary = path.join(self.folder.name, "mbrola")
+        with open(binary, "w") as binary_file:
+            binary_file.write("#!/bin/sh\ncat > /dev/null\n" + script)
+        os.chmod(binary, 0o755)
+        voice = Voice(lang="fr", voice_id=1, cache=cache, timeout=0.5)
+        voice.mbrola_binary = binary
+        return voice
+
+    def test_unknown_diphone(self):
+        voice = self.fake_mbrola("echo 'Fatal error: diphone a-b unknown' >&2"
+                                 "\nexit 1")
+        with self.assertRaises(Voice.UnknownDiphone) as context:
+            voice.to_audio(self.phonemes)
+        self.assertEqual(context.exception.returncode, 1)
+        self.assertIn("a-b", context.exception.stderr)
+
+    def test_piped_failure(self):
+        # mbrola exits without reading its input, and espeak is killed
+        # by the broken pipe
+        voice = self.fake_mbrola("exit 1")
+        with open(voice.mbrola_binary, "w") as binary_file:
+            binary_file.write("#!/bin/sh\necho 'Fatal error: diphone a-b unknown' >&2\n"
+                              "exit 1\n")
+        espeak = path.join(self.folder.name, "espeak")
+        with open(espeak, "w") as binary_file:
+            binary_file.write("#!/bin/sh\ncat > /dev/null\nsleep 0.2\n"
+                              "exec yes 'a\t50'\n")
+        os.chmod(espeak, 0o755)
+        voice.espeak_binary = espeak
+        with self.assertRaises(Voice.UnknownDiphone):
+            voice.to_audio("salut")
+        async_voice = AsyncVoice(lang="fr", voice_id=1, timeout=0.5)
+        async_voice.espeak_binary, async_voice.mbrola_binary = espeak, voice.mbrola_binary
+        with self.assertRaises(Voice.UnknownDiphone):
+            asyncio.run(async_voice.ato_audio("salut"))
+
+    def test_strict_cache(self):
+        # a strict voice must not get the audio cached by a lenient one
+        speech = str(self.phonemes)
+        lenient, strict = Voice(lang="fr", voice_id=1), Voice(lang="fr", voice_id=1, strict=True)
+        self.assertNotEqual(SynthesisCache.key("phonemes_audio", speech, lenient),
+                            SynthesisCache.key("phonemes_audio", speech, strict))
+
+    def test_empty_output(self):
+        voice = self.fake_mbrola("exit 0", SynthesisCache())
+        with self.assertRaises(Voice.SynthesisError):
+            voice.to_audio(self.phonemes)
+        self.assertEqual(voice.cache.memory.size, 0)
+
+    def test_warnings(self):
+        # a run that succeeds is never failed for its error output
+        wav_path = path.join(path.dirname(path.realpath(__file__)), "data", "salut.wav")
+        voice = self.fake_mbrola("echo \"Warning: can't open file\" >&2\ncat '%s'" % wav_path)
+        self.assertTrue(voice.to_audio(self.phonemes).startswith(b"RIFF"))
+        # but it tells why it returned no audio
+        voice = self.fake_mbrola("echo \"can't open voice\" >&2")
+        with self.assertRaises(Voice.MissingVoice):
+            voice.to_audio(self.phonemes)
+
+    def test_timeout(self):
+        voice = self.fake_mbrola("exec sleep 5")
+        with self.assertRaises(Voice.Timeout):
+            voice.to_audio(self.phonemes)
+
+    def test_retry_policy(self):
+        calls = []
+
+        def flaky():
+            calls.append(None)
+            if len(calls) < 3:
+                raise Voice.SynthesisError("mbrola crashed", "mbrola", -9)
+            return b"ok"
+
+        self.assertEqual(RetryPolicy(3, 0).call(flaky), b"ok")
+        self.assertEqual(len(calls), 3)
+
+        def missing_voice():
+            calls.append(None)
+            raise Voice.MissingVoice("no voice", "mbrola", 1)
+
+        with self.assertRaises(Voice.MissingVoice):
+            RetryPolicy(3, 0).call(missing_voice)
+        self.assertEqual(len(calls), 4)
+
+
+class TestVoiceInstall(unittest.TestCase):
+
+    def setUp(self):
+        self.mirror = tempfile.TemporaryDirectory()
+        self.folder = tempfile.TemporaryDirectory()
+        self.voices = {}
+        for voice_name in ("fr1", "fr2"):
+            os.mkdir(path.join(self.mirror.name, voice_name))
+            self.voices[voice_name] = os.urandom(200000)
+            with open(path.join(self.mirror.name, voice_name, voice_name),
+                      "wb") as voice_file:
+                voice_file.write(self.voices[voice_name])
+        self.checksums = {name: hashlib.sha256(data).hexdigest()
+                          for name, data in self.voices.items()}
+
+    def tearDown(self):
+        self.mirror.cleanup()
+        self.folder.cleanup()
+
+    def installed(self, voice_name: str) -> bytes:
+        with open(path.join(self.folder.name, voice_name, voice_name),
+                  "rb") as voice_file:
+            return voice_file.read()
+
+    def test_http_mirror(self):
+        class QuietHandler(SimpleHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        handler = functools.partial(QuietHandler, directory=self.mirror.name)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            mirror = "http://127.0.0.1:%d/" % server.server_address[1]
+            installed = voice_install.install_voice_names(
+                ["fr1", "fr2"], self.folder.name, mirror,
+                checksums=self.checksums)
+            self.assertEqual(installed, ["fr1", "fr2"])
+            # already installed voices are skipped
+            self.assertEqual(voice_install.install_voice_names(
+                ["fr1", "fr2"], self.folder.name, mirror), [])
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(self.installed("fr2"), self.voices["fr2"])
+
+    def test_resume(self):
+        os.mkdir(path.join(self.folder.name, "fr1"))
+        with open(path.join(self.folder.name, "fr1", ".fr1.part"),
+                  "wb") as partial_file:
+            partial_file.write(self.voices["fr1"][:1000])
+        self.assertTrue(voice_install.install_voice(
+            "fr1", self.folder.name, self.mirror.name, self.checksums["fr1"]))
+        self.assertEqual(self.installed("fr1"), self.voices["fr1"])
+        self.assertEqual(os.listdir(path.join(self.folder.name, "fr1")),
+                         ["fr1"])
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(voice_install.ChecksumMismatch):
+            voice_install.install_voice("fr1", self.folder.name,
+                                        self.mirror.name, "0" * 64)
+        self.assertEqual(os.listdir(path.join(self.folder.name, "fr1")), [])
+
+
+class TestPlayback(unittest.TestCase):
+
+    def test_file_sink(self):
+        voice = Voice(lang="fr", voice_id=1)
+        with tempfile.TemporaryDirectory() as folder:
+            filename = path.join(folder, "played.wav")
+            with PlaybackEngine(FileSink(filename)) as engine:
+                first = engine.say_async(voice, "Salut les amis")
+                second = engine.play(voice.to_audio("Bonjour"))
+                self.assertTrue(engine.drain(10))
+                self.assertTrue(first.done and second.done)
+            with open(filename, "rb") as wavfile:
+                played = wavfile.read()
+        self.assertEqual(played[44:],
+                         voice.to_audio("Salut les amis")[44:]
+                         + voice.to_audio("Bonjour")[44:])
+
+    def test_interrupt(self):
+        voice = Voice(lang="fr", voice_id=1)
+        sink = NullSink(realtime=True)
+        with PlaybackEngine(sink, buffer_seconds=0.1) as engine:
+            interrupted = engine.say_async(voice, "Salut les amis " * 10)
+            following = engine.say_async(voice, "Bonjour")
+            interrupted.wait(0.2)
+            engine.interrupt()
+            self.assertTrue(interrupted.wait(1))
+            self.assertTrue(following.wait(10))
+        self.assertLess(sink.played, len(voice.to_audio("Salut les amis " * 10)))
+
+    def test_interrupt_before_header(self):
+        wav = Voice(lang="fr", voice_id=1).to_audio("Bonjour")
+        started = threading.Event()
+
+        def slow_chunks():
+            started.set()
+            threading.Event().wait(0.2)
+            yield wav
+
+        with PlaybackEngine(NullSink()) as engine:
+            interrupted = engine.play(slow_chunks())
+            started.wait(1)
+            engine.interrupt()
+            self.assertTrue(interrupted.wait(1))
+            self.assertTrue(engine.play(wav).wait(10))
+
+    def test_sink_failure(self):
+        class FailingSink(NullSink):
+            failures = 1
+
+            def open(self, wave_format, pull):
+                if self.failures:
+                    self.failures -= 1
+                    raise OSError("no sound card")
+                super().open(wave_format, pull)
+
+        wav = Voice(lang="fr", voice_id=1).to_audio("Bonjour")
+        with PlaybackEngine(FailingSink()) as engine:
+            with self.assertRaises(OSError):
+                engine.play(wav).wait(10)
+            # the sink is opened again for the next utterance
+            self.assertTrue(engine.play(wav).wait(10))
+
+
+class TestIncremental(unittest.TestCase):
+    text = ("Bonjour, comment allez vous ? Le train de dix heures est annulé. "
+            "Merci de patienter.")
+
+    def test_edit(self):
+        voice = Voice(lang="fr", voice_id=1)
+        renderer = IncrementalRenderer(voice)
+        renderer.render(self.text)
+        self.assertEqual(renderer.reused, 0)
+        edited = self.text.replace("dix", "onze")
+        wav = renderer.render(edited)
+        self.assertEqual(renderer.rendered, 1)
+        self.assertEqual(renderer.reused, len(renderer.windows) - 1)
+        self.assertEqual(wav, IncrementalRenderer(voice).render(edited))
+        self.assertEqual(len(renderer.phonemes),
+                         sum(len(voice.to_phonemes(sentence))
+                             for sentence in split_sentences(edited)))
+
+
+class TestServer(unittest.TestCase):
+
+    def serve(self, address):
+        server = SynthesisServer(address, max_delay=0.05)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(server.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_client(self):
+        server = self.serve(("localhost", 0))
+        voice = Voice(lang="fr", voice_id=1)
+        client = VoiceClient(server.address, lang="fr", voice_id=1)
+        self.assertEqual(client.to_audio("Salut les amis"),
+                         voice.to_audio("Salut les amis"))
+        phonemes = voice.to_phonemes("Bonjour")
+        self.assertEqual(str(client.to_phonemes("Bonjour")), str(phonemes))
+        self.assertEqual(client.to_audio(phonemes), voice.to_audio(phonemes))
+        streamed = b"".join(client.stream_audio("Salut les amis"))
+        self.assertEqual(streamed[44:], voice.to_audio("Salut les amis")[44:])
+        with self.assertRaises(Voice.InvalidVoiceParameters):
+            VoiceClient(server.address, lang="xx").to_audio("Salut")
+
+    def test_micro_batching(self):
+        with tempfile.TemporaryDirectory() as folder:
+            server = self.serve(path.join(folder, "voxpopuli.sock"))
+            client = VoiceClient(server.address, lang="fr", voice_id=1)
+            with ThreadPoolExecutor(8) as executor:
+                wavs = list(executor.map(client.to_audio, ["Salut"] * 8))
+            self.assertEqual(wavs, [Voice(lang="fr", voice_id=1).to_audio("Salut")] * 8)
+            batcher = server.batcher(client.key)
+            self.assertLess(batcher.renderings, 8)
+
+    def test_unexpected_error(self):
+        server = self.serve(("localhost", 0))
+
+        def broken_batcher(key):
+            raise RuntimeError("oops")
+
+        server.batcher = broken_batcher
+        client = VoiceClient(server.address, lang="fr", voice_id=1)
+        with self.assertLogs(level=logging.ERROR):
+            with self.assertRaisesRegex(Voice.SynthesisError, "oops"):
+                client.to_audio("Salut")
+
+    def test_stream_error(self):
+        server = self.serve(("localhost", 0))
+
+        class BrokenVoice:
+            def stream_audio(self, speech):
+                raise Voice.MissingVoice("no voice", "mbrola", 1)
+                yield b""
+
+        server.voice = lambda key: BrokenVoice()
+        client = VoiceClient(server.address, lang="fr", voice_id=1)
+        with self.assertRaises(Voice.MissingVoice):
+            list(client.stream_audio("Salut"))
+
+    def test_bad_request(self):
+        server = self.serve(("localhost", 0))
+        connection = HTTPConnection(*server.address)
+        connection.request("POST", "/audio", b"[1, 2]")
+        response = connection.getresponse()
+        self.assertEqual(response.status, 400)
+        self.assertEqual(json.loads(response.read())["error"], "ValueError")
+        connection.close()
+
+    def test_voice_eviction(self):
+        server = SynthesisServer(("localhost", 0), max_voices=1)
+        self.addCleanup(server.close)
+        first = VoiceKey("fr", 1)
+        batcher = server.batcher(first)
+        server.batcher(VoiceKey("fr", 1, speed=120))
+        self.assertEqual(list(server._voices), [VoiceKey("fr", 1, speed=120)])
+        self.assertFalse(batcher._thread.is_alive())
+        # a request racing the eviction is still rendered
+        self.assertEqual(batcher.submit("text", "Salut").result(),
+                         Voice(lang="fr", voice_id=1).to_audio("Salut"))
+        self.assertIsNot(server.batcher(first), batcher)
+
+
+class TestRender(unittest.TestCase):
+
+    def test_render_corpus(self):
+        with tempfile.TemporaryDirectory() as folder:
+            corpus_path = path.join(folder, "corpus.csv")
+            with open(corpus_path, "w") as corpus_file:
+                corpus_file.write("id,text,voice_id\nsalut,Salut les amis,1\n"
+                                  "bonjour,Bonjour,\n../out,Bonjour,\n")
+            output = path.join(folder, "output")
+            manifest = io.StringIO()
+            summary = render_corpus(read_corpus(corpus_path), output, manifest,
+                                    max_workers=2, defaults={"lang": "fr"})
+            self.assertEqual(summary, (2, 0, 1))
+            records = {record["id"]: record for record in
+                       map(json.loads, manifest.getvalue().splitlines())}
+            self.assertIn("error", records["../out"])
+            with open(records["salut"]["path"], "rb") as wavfile:
+                self.assertEqual(wavfile.read(),
+                                 Voice(lang="fr", voice_id=1).to_audio("Salut les amis"))
+            self.assertEqual(records["salut"]["size"], path.getsize(records["salut"]["path"]))
+            self.assertGreater(records["bonjour"]["duration"], 0)
+
+            summary = render_corpus(read_corpus(corpus_path), output, io.StringIO(),
+                                    max_workers=2, defaults={"lang": "fr"})
+            self.assertEqual(summary, (0, 2, 1))
+
+    def test_unreadable_lines(self):
+        with tempfile.TemporaryDirectory() as folder:
+            csv_path = path.join(folder, "corpus.csv")
+            with open(csv_path, "w") as corpus_file:
+                corpus_file.write("id,text,voice_id\nsalut,Salut,one\n"
+                                  "bonjour,Bonjour,1\n")
+            jsonl_path = path.join(folder, "corpus.jsonl")
+            with open(jsonl_path, "w") as corpus_file:
+                corpus_file.write('{"id": "salut", "text": "Salut"}\n'
+                                  '{"id": \n\n[1, 2]\n')
+            self.assertEqual([item.get("line") for item in read_corpus(csv_path)],
+                             [2, None])
+            items = list(read_corpus(jsonl_path))
+            self.assertEqual([item.get("line") for item in items], [None, 2, 4])
+            self.assertIn("JSONDecodeError", items[1]["error"])
+            manifest = io.StringIO()
+            summary = render_corpus(read_corpus(csv_path), path.join(folder, "output"),
+                                    manifest, max_workers=1, defaults={"lang": "fr"})
+            self.assertEqual(summary, (1, 0, 1))
+            records = [json.loads(line) for line in manifest.getvalue().splitlines()]
+            self.assertEqual(records[0]["id"], "salut")
+            self.assertEqual(records[0]["line"], 2)
+
+
+class TestTiming(unittest.TestCase):
+
+    def test_timing_index(self):
+        voice = Voice(lang="fr", voice_id=1)
+        text = "Bonjour, comment allez vous ?"
+        wav, timing = voice.to_audio(text, timing=True)
+        self.assertEqual(wav, voice.to_audio(text))
+        self.assertEqual(timing.total_samples, (len(wav) - 44) // 2)
+        self.assertEqual(len(timing), len(voice.to_phonemes(text)))
+        self.assertEqual(timing.phoneme_at(0), 0)
+        self.assertEqual(timing.phoneme_at(timing.total_samples), -1)
+        start, end = timing.phoneme_span(3)
+        self.assertEqual(timing.phoneme_at(start), 3)
+        self.assertEqual(timing.phoneme_at(end - 1), 3)
+        for phrase in range(len(timing.phrase_starts)):
+            start, end = timing.phrase_span(phrase)
+            self.assertEqual(timing.phrase_at(start), phrase)
+            self.assertEqual(timing.phrase_at(end - 1), phrase)
+        # the pauses between the phrases belong to none of them
+        self.assertEqual(timing.phrase_at(timing.phrase_span(0)[1]), -1)
+        _, timing = voice.to_audio("Bonjour, salut !", timing=True)
+        self.assertEqual(timing.phrase_texts, ["Bonjour", "salut"])
+        self.assertEqual(timing.word_texts, ["Bonjour", "salut"])
+        self.assertEqual(timing.word_span(1), timing.phrase_span(1))
+
+    def test_word_estimate(self):
+        phonemes = PhonemeList.from_pho_str(
+            "_ 50\nb 100\no 100\nn 100\nj 100\nu 100\nr 100\n"
+            "l 100\ne 100\n_ 50")
+        timing = TimingIndex(phonemes, 1000, text="Bonjour le")
+        # no pause between the words: they share the phrase's phonemes
+        self.assertEqual(timing.word_texts, ["Bonjour", "le"])
+        self.assertEqual(list(timing.word_starts), [1, 7])
+        self.assertEqual(list(timing.word_ends), [7, 9])
+        self.assertEqual(timing.word_at(650), 1)
+        self.assertEqual(timing.word_at(20), -1)
+        self.assertEqual(timing.word_span(0), (50, 650))
+        timing = TimingIndex(phonemes, 16000, total_samples=8000)
+        self.assertIsNone(timing.word_texts)
+        self.assertEqual(list(timing.starts),
+                         [round(offset * 8000 / 900) for offset
+                          in (0, 50, 150, 250, 350, 450, 550, 650, 750, 850, 900)])
@@ -1,5 +1,18 @@
+from .batch import BatchResult
+from .cache import SynthesisCache
+from .conversion import OutputFormat
 from .main import Voice
+from .metrics import Instrumentation, MetricsCollector
+from .aio import AsyncVoice
+from .ensemble import VoiceEnsemble
+from .errors import RetryPolicy
+from .incremental import IncrementalRenderer
+from .playback import FileSink, NullSink, PlaybackEngine, PyAudioSink
+from .pool import ProcessPool
+from .server import SynthesisServer, VoiceClient
+from .segment import Segment, SegmentedAudio, split_sentences
+from .timing import TimedAudio, TimingIndex
 from .phonemes import (PhonemeList, Phoneme, FrenchPhonemes,
                        BritishEnglishPhonemes, GreekPhonemes, ArabicPhonemes,
                        SpanishPhonemes, GermanPhonemes, ItalianPhonemes,
-                       PortuguesePhonemes, AmericanEnglishPhonemes)
+                       PortuguesePhonemes, AmericanEnglishPhonemes, iter_pho)
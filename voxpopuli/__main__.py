@@ -0,0 +1,76 @@
+"""Command line entry point: ``python -m voxpopuli <command>``"""
+import argparse
+import logging
+import os
+import time
+
+from .cache import SynthesisCache
+from .render import read_corpus, render_corpus
+from .server import SynthesisServer
+
+argparser = argparse.ArgumentParser(prog="voxpopuli")
+subparsers = argparser.add_subparsers(dest="command", required=True)
+
+serve_parser = subparsers.add_parser(
+    "serve", help="Run a synthesis server shared by local processes")
+serve_parser.add_argument("--host", default="localhost", help="Host to listen on")
+serve_parser.add_argument("--port", type=int, default=8999, help="Port to listen on")
+serve_parser.add_argument("--socket", help="Listen on this Unix socket instead of a port")
+serve_parser.add_argument("--pool-size", type=int, default=1, help="Warm espeak and mbrola workers per voice")
+serve_parser.add_argument("--cache-dir", help="Folder of an on-disk cache of the renderings")
+serve_parser.add_argument("--timeout", type=float, help="Maximum duration of an espeak or mbrola run, in seconds")
+serve_parser.add_argument("--max-batch", type=int, default=32, help="Maximum number of requests rendered in a batch")
+serve_parser.add_argument("--max-delay", type=float, default=0.005, help="Time a request waits for others to batch with, in seconds")
+serve_parser.add_argument("--workers", type=int, help="Concurrent renderings per voice (defaults to the number of cores)")
+serve_parser.add_argument("--verbose", action="store_true", help="Log every request")
+
+render_parser = subparsers.add_parser(
+    "render", help="Render a corpus of texts or .pho strings to wave files")
+render_parser.add_argument("corpus", help="JSON lines or CSV (.csv) file, with an id and a text or pho per item, "
+                                          "and optionally lang, voice_id, speed, pitch and volume")
+render_parser.add_argument("--output", required=True, help="Folder the <id>.wav files are written to")
+render_parser.add_argument("--manifest", help="JSON lines file the renderings are appended to "
+                                              "(defaults to manifest.jsonl in the output folder)")
+render_parser.add_argument("--workers", type=int, help="Number of worker processes (defaults to the number of cores)")
+render_parser.add_argument("--no-resume", action="store_true", help="Render again the items whose file already exists")
+render_parser.add_argument("--lang", default="fr", help="Language of the items that don't set one")
+render_parser.add_argument("--voice-id", type=int, help="Voice id of the items that don't set one")
+render_parser.add_argument("--speed", type=int, default=160, help="Speed of the items that don't set one")
+render_parser.add_argument("--pitch", type=int, default=50, help="Pitch of the items that don't set one")
+
+
+def serve(args):
+    address = args.socket or (args.host, args.port)
+    with SynthesisServer(address, args.pool_size, SynthesisCache(folder=args.cache_dir),
+                         args.timeout, args.max_batch, args.max_delay,
+                         args.workers) as server:
+        print("Serving on %s" % (server.address if args.socket
+                                 else "http://%s:%d" % server.address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def render(args):
+    manifest_path = args.manifest or os.path.join(args.output, "manifest.jsonl")
+    os.makedirs(args.output, exist_ok=True)
+    defaults = {"lang": args.lang, "speed": args.speed, "pitch": args.pitch}
+    if args.voice_id is not None:
+        defaults["voice_id"] = args.voice_id
+    start = time.perf_counter()
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        summary = render_corpus(read_corpus(args.corpus), args.output, manifest,
+                                args.workers, defaults, not args.no_resume)
+    print("Rendered %d items (%d failed, %d already rendered) in %.1fs"
+          % (summary.rendered, summary.failed, summary.skipped,
+             time.perf_counter() - start))
+
+
+COMMANDS = {"serve": serve, "render": render}
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if getattr(args, "verbose", False)
+                        else logging.WARNING)
+    COMMANDS[args.command](args)
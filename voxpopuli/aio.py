@@ -0,0 +1,159 @@
+"""An asyncio front end to the espeak and mbrola synthesis"""
+import asyncio
+import logging
+import os
+from asyncio.subprocess import PIPE
+from typing import Union
+
+from .errors import check_run
+from .main import Voice
+from .phonemes import PhonemeList
+
+
+class AsyncVoice(Voice):
+    """A ``Voice`` whose synthesis methods are coroutines. The espeak and
+    mbrola processes are run with ``asyncio`` subprocesses, so they don't
+    block the event loop. At most ``max_concurrency`` renderings run at the
+    same time (defaults to the number of cores), and cancelling a rendering
+    kills its processes."""
+
+    def __init__(self, *args, max_concurrency: int = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # created lazily, so that it belongs to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @staticmethod
+    async def _kill(*processes: asyncio.subprocess.Process):
+        """Kills the processes still running, and waits for them"""
+        for process in processes:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def _communicate(self, stage: str, awaitable):
+        """Awaits the communication with the processes of a stage, for at
+        most the voice's timeout"""
+        try:
+            return await asyncio.wait_for(awaitable, self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timeout_error(stage) from None
+
+    async def ato_phonemes(self, text: str) -> PhonemeList:
+        """Renders a str to a ``PhonemeList`` object."""
+        args = self._espeak_args()
+        logging.debug("Running espeak command %s" % " ".join(args))
+        text = self._espeak_input(text)
+        async with self.semaphore:
+            with self._measure("espeak", len(text)) as measure:
+                espeak = await asyncio.create_subprocess_exec(
+                    *args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                    env=self._subprocess_env())
+                try:
+                    stdout, stderr = await self._communicate(
+                        "espeak", espeak.communicate(text))
+                finally:
+                    await self._kill(espeak)
+                measure.bytes_out = len(stdout)
+                measure.stderr_bytes = len(stderr)
+                check_run("espeak", espeak.returncode, stderr)
+        return self._parse_phonemes(stdout)
+
+    async def _apipe_to_audio(self, text: str) -> bytes:
+        """Runs espeak with its stdout plugged straight into mbrola's
+        stdin, the phonemes never going through Python."""
+        espeak_args, mbrola_args = (self._espeak_args(),
+                                    self._mbrola_args())
+        logging.debug("Running espeak command %s | mbrola command %s"
+                      % (" ".join(espeak_args), " ".join(mbrola_args)))
+        env = self._subprocess_env()
+        text = self._espeak_input(text)
+        with self._measure("pipeline", len(text)) as measure:
+            read_fd, write_fd = os.pipe()
+            espeak, mbrola = None, None
+            try:
+                try:
+                    mbrola = await asyncio.create_subprocess_exec(
+                        *mbrola_args, stdin=read_fd, stdout=PIPE,
+                        stderr=PIPE, env=env)
+                    espeak = await asyncio.create_subprocess_exec(
+                        *espeak_args, stdin=PIPE, stdout=write_fd,
+                        stderr=PIPE, env=env)
+                finally:
+                    # the children hold their own copies of the pipe's ends
+                    os.close(read_fd)
+                    os.close(write_fd)
+                (_, espeak_stderr), (stdout, stderr) = await self._communicate(
+                    "pipeline", asyncio.gather(espeak.communicate(text),
+                                               mbrola.communicate()))
+            finally:
+                await self._kill(espeak, mbrola)
+            measure.bytes_out = len(stdout)
+            measure.stderr_bytes = len(espeak_stderr) + len(stderr)
+            if mbrola.returncode:
+                # espeak then dies of a broken pipe: mbrola's error is
+                # the actual cause
+                check_run("mbrola", mbrola.returncode, stderr)
+            check_run("espeak", espeak.returncode, espeak_stderr)
+            self._check_audio("mbrola", stdout, stderr)
+        return self._wav_format(stdout)
+
+    async def _aphonemes_to_audio(self, phonemes: PhonemeList) -> bytes:
+        args = self._mbrola_args()
+        logging.debug("Running mbrola command %s" % " ".join(args))
+        pho = str(phonemes).encode("utf-8")
+        with self._measure("mbrola", len(pho)) as measure:
+            mbrola = await asyncio.create_subprocess_exec(
+                *args, stdin=PIPE, stdout=PIPE, stderr=PIPE,
+                env=self._subprocess_env())
+            try:
+                stdout, stderr = await self._communicate(
+                    "mbrola", mbrola.communicate(pho))
+            finally:
+                await self._kill(mbrola)
+            measure.bytes_out = len(stdout)
+            measure.stderr_bytes = len(stderr)
+            check_run("mbrola", mbrola.returncode, stderr)
+            self._check_audio("mbrola", stdout, stderr)
+        return self._wav_format(stdout)
+
+    async def ato_audio(self, speech: Union[PhonemeList, str],
+                        filename=None) -> bytes:
+        """Renders a str or a ``PhonemeList`` to a wave byte object, like
+        ``Voice.to_audio``."""
+        if not isinstance(speech, (str, PhonemeList)):
+            raise TypeError("Expecting a str or a PhonemeList, got %s"
+                            % str(type(speech)))
+
+        cache_key, wav = self._cached(speech)
+
+        if wav is None:
+            if not self._mbrola_exists():
+                raise RuntimeError("Can't synthesize sound: mbrola executable "
+                                   "is not present. "
+                                   "Install using apt get install mbrola or "
+                                   "from the official mbrola repository on "
+                                   "github")
+
+            async with self.semaphore:
+                if isinstance(speech, str):
+                    wav = await self._apipe_to_audio(speech)
+                else:
+                    wav = await self._aphonemes_to_audio(speech)
+            wav = self._convert_wav(wav)
+
+            if cache_key is not None:
+                self.cache.put(cache_key, wav)
+
+        if filename is not None:
+            with open(filename, "wb") as wavfile:
+                wavfile.write(wav)
+
+        return wav
+
@@ -0,0 +1,58 @@
+"""Concurrent rendering of batches of texts or phonemes"""
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Iterable, Iterator, NamedTuple, \
+    Optional, Set
+
+
+class BatchResult(NamedTuple):
+    """Outcome of one item of a batch: its position in the input, and either
+    its rendered value or the exception raised while rendering it."""
+    index: int
+    value: Any
+    error: Optional[Exception]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _render(func: Callable, index: int, item) -> BatchResult:
+    try:
+        return BatchResult(index, func(item), None)
+    except Exception as error:
+        return BatchResult(index, None, error)
+
+
+def map_batch(func: Callable, items: Iterable, max_workers: int = None,
+              as_completed: bool = False) -> Iterator[BatchResult]:
+    """Applies ``func`` to every item using ``max_workers`` threads, and
+    yields a ``BatchResult`` for each of them, either in input order or as
+    soon as they're done.
+
+    The actual work is done in espeak and mbrola subprocesses, so threads
+    are enough to keep all the cores busy. Only a bounded number of items
+    is in flight at any time, so that the input can be a lazy iterable."""
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = 2 * max_workers
+    items = iter(enumerate(items))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if as_completed:
+            pending: Set[Future] = set()
+            for index, item in items:
+                pending.add(executor.submit(_render, func, index, item))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from (future.result() for future in done)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+        else:
+            queue: Deque[Future] = deque()
+            for index, item in items:
+                queue.append(executor.submit(_render, func, index, item))
+                if len(queue) >= max_pending:
+                    yield queue.popleft().result()
+            while queue:
+                yield queue.popleft().result()
@@ -0,0 +1,231 @@
+"""A content-addressed cache for rendered phonemes and audio"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from subprocess import DEVNULL, PIPE, TimeoutExpired, run
+from typing import Optional, Union
+
+from .registry import find_binary
+
+
+def _file_stamp(path: Union[str, Path]) -> str:
+    """A file's path, along with its modification time and size if it
+    exists: it changes when the file is replaced"""
+    try:
+        stat = os.stat(str(path))
+    except OSError:
+        return str(path)
+    return "%s %d %d" % (path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=64)
+def _binary_version(binary_stamp: str, binary: str, version_flag: str) -> str:
+    try:
+        process = run([binary, version_flag], stdin=DEVNULL,
+                      stdout=PIPE, stderr=PIPE, timeout=10)
+    except (OSError, TimeoutExpired):
+        return ""
+    output = (process.stdout + process.stderr).decode("utf-8", "replace")
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    return lines[0] if lines else ""
+
+
+def binary_version(binary: str, version_flag: str) -> str:
+    """Returns the first line printed by the binary when asked for its
+    version, or an empty string if it can't be run. The binary is only run
+    again once it's been replaced (e.g., upgraded)."""
+    binary = binary.strip('"')
+    return _binary_version(_file_stamp(find_binary(binary) or binary),
+                           binary, version_flag)
+
+
+class MemoryCache:
+    """A least-recently-used mapping of keys to bytes, holding at most
+    ``max_bytes`` of values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DiskCache:
+    """Stores each value in its own file, named after its key, in ``folder``.
+    Writes are atomic (a temporary file is renamed to its final name), and the
+    least recently used files are removed once the folder holds more
+    than ``max_bytes``."""
+
+    def __init__(self, folder: Union[str, Path], max_bytes: int):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.size = sum(path.stat().st_size for path in self._files())
+
+    def _files(self):
+        return (path for path in self.folder.iterdir()
+                if path.is_file() and not path.name.startswith("."))
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.folder / key
+        try:
+            with open(str(path), "rb") as cached_file:
+                value = cached_file.read()
+        except FileNotFoundError:
+            return None
+        # the modification time is used as the last access time for eviction
+        try:
+            os.utime(str(path))
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=str(self.folder), prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(value)
+            with self._lock:
+                path = self.folder / key
+                if path.exists():
+                    self.size -= path.stat().st_size
+                os.replace(tmp_path, str(path))
+                self.size += len(value)
+                if self.size > self.max_bytes:
+                    self._evict(keep=key)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _evict(self, keep: str):
+        files = sorted(((path.stat().st_mtime, path)
+                        for path in self._files() if path.name != keep),
+                       key=lambda f: f[0])
+        for _, path in files:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                file_size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            self.size -= file_size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for path in self._files():
+                path.unlink()
+            self.size = 0
+
+
+class SynthesisCache:
+    """Caches the outputs of ``Voice.to_phonemes`` and ``Voice.to_audio``,
+    keyed on a hash of the rendered text (or ``PhonemeList``), the voice's
+    parameters and the versions of espeak and mbrola.
+
+    Entries are kept in a memory LRU of at most ``max_memory_bytes``, and if a
+    ``folder`` is given, in an on-disk store of at most ``max_disk_bytes``.
+    Disk hits are brought back into memory."""
+
+    def __init__(self, max_memory_bytes: int = 64 * 2 ** 20,
+                 folder: Union[str, Path] = None,
+                 max_disk_bytes: int = 2 ** 30):
+        self.memory = MemoryCache(max_memory_bytes)
+        self.disk = (DiskCache(folder, max_disk_bytes)
+                     if folder is not None else None)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind: str, speech: str, voice) -> str:
+        """Hashes everything that has an influence on the rendering of
+        ``speech`` by ``voice``"""
+        library = voice._loaded_espeak_library()
+        # the espeak library can be another version than the binary
+        espeak_version = ("library " + library.version if library is not None
+                          else binary_version(voice.espeak_binary, "--version"))
+        fields = [kind, speech, voice.lang, voice.voice_id, voice.speed,
+                  voice.pitch, voice.volume, espeak_version,
+                  binary_version(voice.mbrola_binary, "-h"),
+                  # a reinstalled (or another folder's) voice renders anew
+                  _file_stamp(voice._voice_database)]
+        if getattr(voice, "output_format", None) is not None:
+            fields.append(voice.output_format)
+        if getattr(voice, "strict", False):
+            # strict voices fail on unknown diphones instead of silencing them
+            fields.append("strict")
+        return hashlib.sha256(
+            "\0".join(map(str, fields)).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    @property
+    def evictions(self) -> int:
+        return self.memory.evictions + (self.disk.evictions
+                                        if self.disk is not None else 0)
+
+    def stats(self):
+        """Returns the hit, miss and eviction counters"""
+        return {"hits": self.hits, "misses": self.misses,
+                "memory_evictions": self.memory.evictions,
+                "disk_evictions": (self.disk.evictions
+                                   if self.disk is not None else 0)}
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
@@ -0,0 +1,231 @@
+"""Conversion of mbrola's output to other sample rates, channel counts and
+sample encodings"""
+from struct import pack, pack_into, unpack
+from typing import NamedTuple, Optional
+
+from .phonemes import _numpy
+
+WAV_HEADER_SIZE = 44
+STREAMING_WAV_SIZE = 0xFFFFFFFF
+
+# wave format code, size of a sample and numpy dtype of each encoding
+ENCODINGS = {"int16": (1, 2, '<i2'),
+             "float32": (3, 4, '<f4'),
+             "alaw": (6, 1, 'u1'),
+             "mulaw": (7, 1, 'u1')}
+
+# segment ends of the G.711 companding laws (as in Sun's reference g711.c)
+ALAW_SEGMENT_ENDS = [0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF]
+MULAW_SEGMENT_ENDS = [0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF]
+
+LOWPASS_TAPS = 63
+
+
+def wav_header(format_code: int, channels: int, sample_rate: int,
+               sample_size: int, data_size: int = None) -> bytes:
+    """A wave header for ``data_size`` bytes of frames (or a stream of
+    unknown length if it's ``None``, the sizes being ``0xFFFFFFFF``). The
+    formats other than PCM have a format chunk extension size and a fact
+    chunk, holding the number of frames, as the WAVE specification
+    requires."""
+    block_size = sample_size * channels
+    fmt = pack('<HHIIHH', format_code, channels, sample_rate,
+               sample_rate * block_size, block_size, 8 * sample_size)
+    if format_code == 1:
+        chunks = b'WAVEfmt ' + pack('<I', 16) + fmt
+    else:
+        frames = (STREAMING_WAV_SIZE if data_size is None
+                  else data_size // block_size)
+        chunks = (b'WAVEfmt ' + pack('<I', 18) + fmt + pack('<H', 0)
+                  + b'fact' + pack('<II', 4, frames))
+    if data_size is None:
+        return (b'RIFF' + pack('<I', STREAMING_WAV_SIZE) + chunks
+                + b'data' + pack('<I', STREAMING_WAV_SIZE))
+    return (b'RIFF' + pack('<I', len(chunks) + 8 + data_size) + chunks
+            + b'data' + pack('<I', data_size))
+
+
+def wav_header_size(header: bytes) -> int:
+    """The size of a wave header (of at least ``WAV_HEADER_SIZE`` bytes)
+    written by mbrola or ``wav_header``: the offset of its frames"""
+    data_chunk = 20 + unpack('<I', header[16:20])[0]
+    if header[data_chunk:data_chunk + 4] == b'fact':
+        data_chunk += 12
+    return data_chunk + 8
+
+
+def set_wav_sizes(header: bytearray, file_size: int):
+    """Sets the sizes of a wave header, in place, for a file of
+    ``file_size`` bytes"""
+    header_size = wav_header_size(header)
+    data_size = file_size - header_size
+    pack_into('<I', header, 4, file_size - 8)
+    pack_into('<I', header, header_size - 4, data_size)
+    if header[header_size - 20:header_size - 16] == b'fact':
+        block_size = unpack('<H', header[32:34])[0]
+        pack_into('<I', header, header_size - 12, data_size // block_size)
+
+
+class OutputFormat(NamedTuple):
+    """Format of the audio rendered by a ``Voice``: its sample rate (``None``
+    keeps the voice's native rate), its number of channels and its sample
+    encoding, among ``"int16"``, ``"float32"``, ``"mulaw"`` and ``"alaw"``."""
+    sample_rate: Optional[int] = None
+    channels: int = 1
+    encoding: str = "int16"
+
+    def validate(self):
+        """Raises a ``ValueError`` if audio can't be rendered in this
+        format"""
+        if self.encoding not in ENCODINGS:
+            raise ValueError("Unknown encoding %s, expecting one of %s"
+                             % (self.encoding, ", ".join(ENCODINGS)))
+        if self.sample_rate is not None and not (
+                isinstance(self.sample_rate, int) and self.sample_rate > 0):
+            raise ValueError("The sample rate must be a positive integer, "
+                             "not %r" % (self.sample_rate,))
+        if not (isinstance(self.channels, int) and self.channels > 0):
+            raise ValueError("The number of channels must be a positive "
+                             "integer, not %r" % (self.channels,))
+
+    def wav_header(self, sample_rate: int, data_size: int = None) -> bytes:
+        format_code, sample_size, _ = ENCODINGS[self.encoding]
+        return wav_header(format_code, self.channels, sample_rate,
+                          sample_size, data_size)
+
+    def converter(self, input_rate: int) -> 'Converter':
+        return Converter(input_rate, self)
+
+    def convert_wav(self, wav: bytes) -> bytes:
+        """Converts a mono 16 bits wav (mbrola's output) to this format"""
+        input_rate = unpack('<I', wav[24:28])[0]
+        converter = self.converter(input_rate)
+        data = (converter.process(memoryview(wav)[WAV_HEADER_SIZE:])
+                + converter.flush())
+        return self.wav_header(converter.output_rate, len(data)) + data
+
+
+def _lowpass_kernel(cutoff: float):
+    """Hamming-windowed sinc lowpass filter, ``cutoff`` being relative to
+    the sample rate"""
+    np = _numpy()
+    taps = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(LOWPASS_TAPS)
+    return kernel / kernel.sum()
+
+
+def _g711_encode(samples, segment_ends, shift: int, bias: int, clip: int,
+                 alaw: bool):
+    """Vectorized G.711 companding of int16 samples"""
+    np = _numpy()
+    values = samples.astype(np.int32) >> shift
+    negative = values < 0
+    if alaw:
+        mask = np.where(negative, 0x55, 0xD5)
+        values = np.where(negative, -values - 1, values)
+    else:
+        mask = np.where(negative, 0x7F, 0xFF)
+        values = np.minimum(np.abs(values), clip) + bias
+    segments = np.searchsorted(segment_ends, values, side='left')
+    if alaw:
+        mantissas = np.where(segments < 2, values >> 1,
+                             values >> np.maximum(segments, 1)) & 0x0F
+    else:
+        mantissas = (values >> (segments + 1)) & 0x0F
+    encoded = np.where(segments >= 8, 0x7F, (segments << 4) | mantissas)
+    return (encoded ^ mask).astype(np.uint8)
+
+
+class Converter:
+    """Converts a stream of mono 16 bits samples at ``input_rate`` to an
+    ``OutputFormat``, chunk by chunk. Resampling is done by linear
+    interpolation, after a lowpass filter when downsampling; the filter's
+    delay is compensated, so converting a whole buffer or the same buffer
+    in chunks gives the same output (once ``flush`` is called)."""
+
+    def __init__(self, input_rate: int, output_format: OutputFormat):
+        np = _numpy()
+        output_format.validate()
+        self.input_rate = input_rate
+        self.output_format = output_format
+        self.output_rate = output_format.sample_rate or input_rate
+        self._step = input_rate / self.output_rate
+        self._position = 0.
+        self._last_sample = None
+        self._remainder = b''
+        if self.output_rate < input_rate:
+            self._kernel = _lowpass_kernel(0.45 * self.output_rate / input_rate)
+            self._history = np.zeros(LOWPASS_TAPS - 1)
+            self._delay = (LOWPASS_TAPS - 1) // 2
+        else:
+            self._kernel = None
+            self._delay = 0
+
+    def _filter(self, samples):
+        np = _numpy()
+        if self._kernel is None:
+            return samples
+        padded = np.concatenate((self._history, samples))
+        self._history = padded[len(padded) - (LOWPASS_TAPS - 1):]
+        filtered = np.convolve(padded, self._kernel, mode='valid')
+        # the first outputs are the filter's delay
+        skipped = min(self._delay, len(filtered))
+        self._delay -= skipped
+        return filtered[skipped:]
+
+    def _resample(self, samples):
+        np = _numpy()
+        if self._step == 1:
+            return samples
+        if self._last_sample is not None:
+            samples = np.concatenate((self._last_sample, samples))
+        if len(samples) == 0:
+            return samples
+        last_index = len(samples) - 1
+        count = (int((last_index - self._position) // self._step) + 1
+                 if self._position <= last_index else 0)
+        positions = self._position + self._step * np.arange(count)
+        resampled = np.interp(positions, np.arange(len(samples)), samples)
+        # positions are kept relative to the last sample, which is the first
+        # one of the next chunk
+        self._position += count * self._step - last_index
+        self._last_sample = samples[-1:]
+        return resampled
+
+    def _encode(self, samples) -> bytes:
+        np = _numpy()
+        channels = self.output_format.channels
+        if channels > 1:
+            samples = np.repeat(samples, channels)
+        encoding = self.output_format.encoding
+        if encoding == "float32":
+            return (samples / 32768).astype('<f4').tobytes()
+        samples = np.clip(np.rint(samples), -32768, 32767).astype('<i2')
+        if encoding == "int16":
+            return samples.tobytes()
+        elif encoding == "mulaw":
+            return _g711_encode(samples, MULAW_SEGMENT_ENDS, 2, 0x21, 8159,
+                                alaw=False).tobytes()
+        return _g711_encode(samples, ALAW_SEGMENT_ENDS, 3, 0, 0,
+                            alaw=True).tobytes()
+
+    def _convert(self, samples) -> bytes:
+        return self._encode(self._resample(self._filter(samples)))
+
+    def process(self, pcm: bytes) -> bytes:
+        """Converts a chunk of PCM data, which may end in the middle of
+        a sample"""
+        np = _numpy()
+        pcm = self._remainder + bytes(pcm)
+        usable = len(pcm) - len(pcm) % 2
+        self._remainder = pcm[usable:]
+        samples = np.frombuffer(pcm[:usable], dtype='<i2').astype(np.float64)
+        return self._convert(samples)
+
+    def flush(self) -> bytes:
+        """Converts the samples still held back by the lowpass filter. The
+        converter shouldn't be fed anymore afterwards."""
+        np = _numpy()
+        if self._kernel is None:
+            return b''
+        return self._convert(np.zeros((LOWPASS_TAPS - 1) // 2))
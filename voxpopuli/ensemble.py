@@ -0,0 +1,123 @@
+"""Rendering of the same speech with several voices"""
+from collections import OrderedDict
+from struct import unpack
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+from .batch import map_batch
+from .conversion import wav_header_size
+from .main import Voice
+from .phonemes import PhonemeList, _numpy
+
+# value of a silent sample, by wave format code (mu-law and A-law
+# don't encode silence as zeros)
+SILENT_BYTES = {1: 0x00, 3: 0x00, 6: 0xD5, 7: 0xFF}
+
+
+class VoiceEnsemble:
+    """Renders the same texts with several voices. espeak only runs once for
+    all the voices sharing the same espeak parameters (language, speed, pitch
+    and espeak voice), and mbrola then runs for each voice concurrently, with
+    up to ``max_workers`` threads."""
+
+    def __init__(self, voices: Sequence[Voice], max_workers: int = None):
+        if not voices:
+            raise ValueError("An ensemble needs at least one voice")
+        self.voices = list(voices)
+        self.max_workers = max_workers
+
+    @classmethod
+    def for_lang(cls, lang: str, max_workers: int = None) -> 'VoiceEnsemble':
+        """An ensemble of all the voices installed for a language"""
+        return cls(Voice.get_voices_for_lang(lang), max_workers)
+
+    @staticmethod
+    def _phonemizer_key(voice: Voice) -> Tuple:
+        """The voices sharing this key get the same phonemes from espeak"""
+        return voice.lang, voice.speed, voice.pitch, voice.sex
+
+    def _groups(self) -> Dict[Tuple, List[Voice]]:
+        groups: Dict[Tuple, List[Voice]] = OrderedDict()
+        for voice in self.voices:
+            groups.setdefault(self._phonemizer_key(voice), []).append(voice)
+        return groups
+
+    def to_phonemes(self, text: str) -> Dict[Voice, PhonemeList]:
+        """Renders a str to a ``PhonemeList`` for each voice, running espeak
+        once per group of voices sharing its parameters"""
+        groups = list(self._groups().values())
+        phonemes = {}
+        for result in map_batch(lambda group: group[0].to_phonemes(text),
+                                groups, self.max_workers):
+            if not result.ok:
+                raise result.error
+            for voice in groups[result.index]:
+                phonemes[voice] = result.value
+        return {voice: phonemes[voice] for voice in self.voices}
+
+    def to_audio(self, speech: Union[PhonemeList, str]) -> Dict[Voice, bytes]:
+        """Renders a str or a ``PhonemeList`` to a wave byte object for each
+        voice, in the order of ``voices``"""
+        if isinstance(speech, str):
+            phonemes = self.to_phonemes(speech)
+        else:
+            phonemes = {voice: speech for voice in self.voices}
+        wavs = {}
+        for result in map_batch(lambda voice: voice.to_audio(phonemes[voice]),
+                                self.voices, self.max_workers):
+            if not result.ok:
+                raise result.error
+            wavs[self.voices[result.index]] = result.value
+        return {voice: wavs[voice] for voice in self.voices}
+
+    @staticmethod
+    def _common_format(wavs: Iterable[bytes]) -> bytes:
+        """Returns the format chunk shared by all the wavs"""
+        formats = {wav[20:36] for wav in wavs}
+        if len(formats) != 1:
+            raise ValueError("The voices don't render audio in the same "
+                             "format, set the same output format on all "
+                             "of them")
+        return formats.pop()
+
+    def to_audio_concatenated(self, speech: Union[PhonemeList, str],
+                              pause: float = 0.5) -> bytes:
+        """Renders a str or a ``PhonemeList`` with each voice, one after
+        the other in a single wave byte object, separated by ``pause``
+        seconds of silence"""
+        wavs = list(self.to_audio(speech).values())
+        audio_format = self._common_format(wavs)
+        format_code, _, rate, _, block_size = unpack('<HHIIH',
+                                                     audio_format[:14])
+        silence = bytes([SILENT_BYTES.get(format_code, 0)]) * (
+            int(pause * rate) * block_size)
+        wav = bytearray(wavs[0][:wav_header_size(wavs[0])])
+        for index, voice_wav in enumerate(wavs):
+            if index:
+                wav += silence
+            wav += memoryview(voice_wav)[wav_header_size(voice_wav):]
+        Voice._fix_wav_header(wav)
+        return bytes(wav)
+
+    def to_audio_mixed(self, speech: Union[PhonemeList, str]) -> bytes:
+        """Renders a str or a ``PhonemeList`` with all the voices at once,
+        their (16 bits or float) samples being averaged into a single wave
+        byte object as long as the longest rendering. Requires numpy."""
+        np = _numpy()
+        wavs = list(self.to_audio(speech).values())
+        format_code = unpack('<H', self._common_format(wavs)[:2])[0]
+        if format_code not in (1, 3):
+            raise ValueError("Only 16 bits and float samples can be mixed")
+        dtype = '<i2' if format_code == 1 else '<f4'
+        tracks = [np.frombuffer(memoryview(wav)[wav_header_size(wav):],
+                                dtype=dtype)
+                  for wav in wavs]
+        mixed = np.zeros(max(len(track) for track in tracks))
+        for track in tracks:
+            mixed[:len(track)] += track
+        mixed /= len(tracks)
+        if format_code == 1:
+            mixed = np.rint(mixed)
+        wav = bytearray(wavs[0][:wav_header_size(wavs[0])])
+        wav += mixed.astype(dtype).tobytes()
+        Voice._fix_wav_header(wav)
+        return bytes(wav)
@@ -0,0 +1,83 @@
+"""Failures of the espeak and mbrola runs, and the policy for retrying them.
+The exceptions are also available as attributes of ``Voice``."""
+import logging
+import re
+import time
+from typing import Callable, NamedTuple, Optional
+
+UNKNOWN_DIPHONE = re.compile(r"(?i)diphone|\S+-\S+ unknown")
+MISSING_VOICE = re.compile(r"(?i)failed to read voice|can'?t open|cannot open"
+                           r"|no such file|voice .*not found")
+
+
+class SynthesisError(Exception):
+    """espeak or mbrola failed, or returned an unusable output. ``stage``
+    is the failed stage, ``returncode`` the binary's return code (``None``
+    if it didn't exit) and ``stderr`` its decoded error output.
+    ``transient`` errors may go away when the call is retried."""
+    transient = True
+
+    def __init__(self, message: str, stage: str = None,
+                 returncode: Optional[int] = None, stderr: str = ""):
+        if stderr.strip():
+            message += ": " + stderr.strip()
+        super().__init__(message)
+        self.stage = stage
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class UnknownDiphone(SynthesisError):
+    """mbrola was given a pair of phonemes that its voice can't render"""
+    transient = False
+
+
+class MissingVoice(SynthesisError):
+    """espeak or mbrola couldn't load the voice"""
+    transient = False
+
+
+class SynthesisTimeout(SynthesisError):
+    """espeak or mbrola took longer than the voice's ``timeout``, and
+    was killed"""
+
+
+def check_run(stage: str, returncode: Optional[int], stderr: bytes,
+              no_audio: bool = False):
+    """Raises the ``SynthesisError`` matching a failed run: one with a
+    non-zero return code, or one that returned no audio (``no_audio``). The
+    error output of a successful run only holds warnings, and is ignored."""
+    if not returncode and not no_audio:
+        return
+    message = stderr.decode("utf-8", "replace")
+    if MISSING_VOICE.search(message):
+        raise MissingVoice("%s couldn't load its voice" % stage, stage,
+                           returncode, message)
+    if returncode:
+        error_class = (UnknownDiphone if UNKNOWN_DIPHONE.search(message)
+                       else SynthesisError)
+        raise error_class("%s failed with return code %d"
+                          % (stage, returncode), stage, returncode, message)
+    raise SynthesisError("%s returned no audio" % stage, stage, returncode,
+                         message)
+
+
+class RetryPolicy(NamedTuple):
+    """Retries a call failing with a transient ``SynthesisError`` up to
+    ``attempts`` times in total, waiting ``backoff`` seconds before the first
+    retry, and twice as long before each of the next ones"""
+    attempts: int = 3
+    backoff: float = 0.05
+
+    def call(self, func: Callable, *args, **kwargs):
+        delay = self.backoff
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except SynthesisError as error:
+                if not error.transient or attempt == self.attempts:
+                    raise
+                logging.debug("Retrying after %s (attempt %d)"
+                              % (error, attempt))
+            time.sleep(delay)
+            delay *= 2
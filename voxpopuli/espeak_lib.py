@@ -0,0 +1,171 @@
+"""In-process phonemization through the espeak-ng (or espeak) shared library,
+loaded once per process with ctypes, instead of an espeak run per call"""
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Optional, Tuple
+
+from .errors import MissingVoice, SynthesisError
+
+LIBRARY_NAMES = ("espeak-ng", "espeak")
+
+# constants of speak_lib.h
+AUDIO_OUTPUT_SYNCHRONOUS = 2
+INITIALIZE_DONT_EXIT = 0x8000
+RATE, PITCH = 1, 3
+CHARS_UTF8, PHONEMES, ENDPAUSE = 0x1, 0x100, 0x1000
+POS_CHARACTER = 1
+EE_OK = 0
+# phoneme trace mode of ``espeak --pho``, which writes mbrola's .pho format
+MBROLA_PHONEMES = 0x10
+
+READ_SIZE = 64 * 1024
+
+SYNTH_CALLBACK = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short),
+                                  ctypes.c_int, ctypes.c_void_p)
+
+
+class EspeakLibrary:
+    """The espeak shared library, initialized once. espeak has global state
+    (the current voice, its parameters and the phoneme trace file), so the
+    calls are serialized by a lock. The voice is only reloaded when a call
+    asks for another one.
+
+    The library has no quiet mode: the phoneme trace is written clause by
+    clause as espeak synthesizes, so each call still renders the audio (for
+    mbrola voices, espeak drives mbrola itself) and the synthesis can't be
+    cut short without truncating the trace. The audio is dropped, and the
+    samples dropped so far are counted in ``discarded_samples``."""
+
+    def __init__(self, library: ctypes.CDLL, libc: ctypes.CDLL):
+        self._lib = library
+        self._libc = libc
+        self._lock = threading.Lock()
+        self._voice_name: Optional[str] = None
+        self.discarded_samples = 0
+        # kept referenced: espeak holds on to the callback
+        self._callback = SYNTH_CALLBACK(self._discard_audio)
+
+        library.espeak_Initialize.argtypes = [ctypes.c_int, ctypes.c_int,
+                                              ctypes.c_char_p, ctypes.c_int]
+        library.espeak_Initialize.restype = ctypes.c_int
+        library.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+        library.espeak_SetVoiceByName.restype = ctypes.c_int
+        library.espeak_SetParameter.argtypes = [ctypes.c_int, ctypes.c_int,
+                                                ctypes.c_int]
+        library.espeak_SetParameter.restype = ctypes.c_int
+        library.espeak_SetPhonemeTrace.argtypes = [ctypes.c_int,
+                                                   ctypes.c_void_p]
+        library.espeak_SetPhonemeTrace.restype = None
+        library.espeak_SetSynthCallback.argtypes = [SYNTH_CALLBACK]
+        library.espeak_SetSynthCallback.restype = None
+        library.espeak_Synth.argtypes = [
+            ctypes.c_char_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p]
+        library.espeak_Synth.restype = ctypes.c_int
+        library.espeak_Synchronize.argtypes = []
+        library.espeak_Synchronize.restype = ctypes.c_int
+        library.espeak_Info.argtypes = [ctypes.c_void_p]
+        library.espeak_Info.restype = ctypes.c_char_p
+        libc.tmpfile.argtypes = []
+        libc.tmpfile.restype = ctypes.c_void_p
+        for function in (libc.fflush, libc.rewind, libc.fclose):
+            function.argtypes = [ctypes.c_void_p]
+        libc.fread.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                               ctypes.c_size_t, ctypes.c_void_p]
+        libc.fread.restype = ctypes.c_size_t
+
+        if library.espeak_Initialize(AUDIO_OUTPUT_SYNCHRONOUS, 0, None,
+                                     INITIALIZE_DONT_EXIT) < 0:
+            raise OSError("espeak's initialization failed")
+        self.version = library.espeak_Info(None).decode("utf-8", "replace")
+        library.espeak_SetSynthCallback(self._callback)
+
+    def _discard_audio(self, wave, sample_count: int, events) -> int:
+        # only the phoneme trace is used: returning 1 would abort the
+        # synthesis, and the trace with it
+        self.discarded_samples += sample_count
+        return 0
+
+    def _read_trace(self, trace: int) -> bytes:
+        libc = self._libc
+        libc.fflush(trace)
+        libc.rewind(trace)
+        buffer = ctypes.create_string_buffer(READ_SIZE)
+        chunks = []
+        while True:
+            size = libc.fread(buffer, 1, READ_SIZE, trace)
+            if not size:
+                return b"".join(chunks)
+            chunks.append(buffer.raw[:size])
+
+    def _set_voice(self, voice_name: str):
+        if voice_name == self._voice_name:
+            return
+        # a failed load leaves espeak without any voice
+        self._voice_name = None
+        if self._lib.espeak_SetVoiceByName(voice_name.encode("utf-8")) != EE_OK:
+            raise MissingVoice("espeak couldn't load its voice", "espeak",
+                               None, "voice %s not found" % voice_name)
+        self._voice_name = voice_name
+
+    def phonemize(self, text: str, voice_name: str, speed: int,
+                  pitch: int) -> bytes:
+        """Returns the same .pho output as ``espeak --pho``, with the same
+        voice (e.g., ``mb/mb-fr1``), speed and pitch. Unlike
+        ``espeak -q``, this runs a full synthesis, whose audio is dropped."""
+        library = self._lib
+        encoded = text.encode("utf-8") + b"\0"
+        with self._lock:
+            self._set_voice(voice_name)
+            library.espeak_SetParameter(RATE, speed, 0)
+            library.espeak_SetParameter(PITCH, pitch, 0)
+            trace = self._libc.tmpfile()
+            if not trace:
+                raise OSError("Couldn't create espeak's phoneme trace file")
+            try:
+                library.espeak_SetPhonemeTrace(MBROLA_PHONEMES, trace)
+                error = library.espeak_Synth(
+                    encoded, len(encoded), 0, POS_CHARACTER, 0,
+                    CHARS_UTF8 | PHONEMES | ENDPAUSE, None, None)
+                library.espeak_Synchronize()
+                library.espeak_SetPhonemeTrace(0, None)
+                if error != EE_OK:
+                    raise SynthesisError("espeak failed with error code %d"
+                                         % error, "espeak", error)
+                return self._read_trace(trace)
+            finally:
+                self._libc.fclose(trace)
+
+
+_library: Optional[EspeakLibrary] = None
+_load_attempted = False
+_load_lock = threading.Lock()
+
+
+def _find_libraries() -> Tuple[Optional[str], Optional[str]]:
+    for name in LIBRARY_NAMES:
+        path = ctypes.util.find_library(name)
+        if path is not None:
+            return path, ctypes.util.find_library("c")
+    return None, None
+
+
+def load() -> Optional[EspeakLibrary]:
+    """Returns the process' ``EspeakLibrary``, loading it on the first
+    call, or ``None`` if the library can't be found or loaded (the voices
+    then fall back to running espeak)"""
+    global _library, _load_attempted
+    with _load_lock:
+        if not _load_attempted:
+            _load_attempted = True
+            library_path, libc_path = _find_libraries()
+            if library_path is not None and libc_path is not None:
+                try:
+                    _library = EspeakLibrary(ctypes.CDLL(library_path),
+                                             ctypes.CDLL(libc_path))
+                except (OSError, AttributeError) as error:
+                    logging.warning("Couldn't load %s: %s"
+                                    % (library_path, error))
+        return _library
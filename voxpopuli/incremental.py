@@ -0,0 +1,123 @@
+"""Incremental re-rendering of a text being edited: only the parts whose
+phonemes changed go through mbrola again"""
+from typing import Dict, List, Optional
+
+from .batch import map_batch
+from .conversion import wav_header_size
+from .main import Voice
+from .phonemes import PAUSE, PhonemeList
+from .segment import split_sentences
+
+
+def _pause_halves(line: str):
+    """Splits a pause into two pauses of half its duration, so that it can
+    end a window and start the next one"""
+    duration = int(round(float(line.split("\t")[1])))
+    return ("%s\t%d" % (PAUSE, duration // 2),
+            "%s\t%d" % (PAUSE, duration - duration // 2))
+
+
+def split_windows(pho_lines: List[str]) -> List[str]:
+    """Splits the lines of a .pho file into windows (as .pho strings) that
+    can be rendered separately: each pause is split in two, its first half
+    ending a window and its second half starting the next one. Since the
+    diphones around a pause are joined with silence, the windows' audio can
+    be concatenated without any audible seam."""
+    windows, window = [], []
+    for line in pho_lines:
+        fields = line.split("\t", 2)
+        if fields[0] == PAUSE and len(fields) > 1 and window:
+            first_half, second_half = _pause_halves(line)
+            window.append(first_half)
+            windows.append("\n".join(window))
+            window = [second_half]
+        else:
+            window.append(line)
+    if window:
+        windows.append("\n".join(window))
+    return windows
+
+
+class IncrementalRenderer:
+    """Renders successive versions of a text, as an editor changes it,
+    redoing as little as possible: espeak only runs on the sentences that
+    changed since the previous version, and mbrola only on the windows
+    (runs of phonemes between two pauses) that changed. The audio of the
+    unchanged windows is spliced back in, so the rendering time is
+    proportional to the size of the edit instead of the size of the text.
+
+    Each window being rendered on its own, the audio matches a rendering of
+    the whole text up to the pauses' joins. ``reused`` and ``rendered``
+    count the windows of the last rendering that were spliced back in and
+    rendered again."""
+
+    def __init__(self, voice: Voice, max_workers: int = None,
+                 max_segment_length: int = 400):
+        self.voice = voice
+        self.max_workers = max_workers
+        self.max_segment_length = max_segment_length
+        self.phonemes: Optional[PhonemeList] = None
+        self.windows: List[str] = []
+        self.reused = 0
+        self.rendered = 0
+        self._sentence_phonemes: Dict[str, List[str]] = {}
+        self._window_pcm: Dict[str, bytes] = {}
+        self._header: Optional[bytes] = None
+
+    def _phonemize(self, sentences: List[str]) -> List[str]:
+        """Returns the .pho lines of the sentences, only running espeak on
+        the ones that weren't in the previous version"""
+        new_sentences = [sentence for sentence in dict.fromkeys(sentences)
+                         if sentence not in self._sentence_phonemes]
+        sentence_phonemes = {sentence: self._sentence_phonemes[sentence]
+                             for sentence in sentences
+                             if sentence in self._sentence_phonemes}
+        for result in map_batch(self.voice.to_phonemes, new_sentences,
+                                self.max_workers):
+            if not result.ok:
+                raise result.error
+            lines = str(result.value).split("\n") if len(result.value) else []
+            sentence_phonemes[new_sentences[result.index]] = lines
+        self._sentence_phonemes = sentence_phonemes
+        return [line for sentence in sentences
+                for line in sentence_phonemes[sentence]]
+
+    def _render_windows(self, windows: List[str]) -> Dict[str, bytes]:
+        """Returns the PCM of the windows, only running mbrola on the ones
+        that weren't in the previous version"""
+        new_windows = [window for window in dict.fromkeys(windows)
+                       if window not in self._window_pcm]
+        window_pcm = {window: self._window_pcm[window] for window in windows
+                      if window in self._window_pcm}
+        self.reused = len(windows) - sum(window not in window_pcm
+                                         for window in windows)
+        self.rendered = len(new_windows)
+        for result in map_batch(
+                lambda window: self.voice.to_audio(
+                    PhonemeList.from_pho_str(window)),
+                new_windows, self.max_workers):
+            if not result.ok:
+                raise result.error
+            wav = result.value
+            header_size = wav_header_size(wav)
+            self._header = wav[:header_size]
+            window_pcm[new_windows[result.index]] = wav[header_size:]
+        self._window_pcm = window_pcm
+        return window_pcm
+
+    def render(self, text: str) -> bytes:
+        """Renders a new version of the text to a wave byte object"""
+        sentences = split_sentences(text, self.max_segment_length)
+        pho_lines = self._phonemize(sentences)
+        self.phonemes = PhonemeList.from_pho_str("\n".join(pho_lines))
+        self.windows = split_windows(pho_lines)
+        if not self.windows:
+            self.reused, self.rendered = 0, 0
+            return self.voice.to_audio(text)
+
+        window_pcm = self._render_windows(self.windows)
+        wav = bytearray(self._header)
+        for window in self.windows:
+            wav += window_pcm[window]
+        Voice._fix_wav_header(wav)
+        return bytes(wav)
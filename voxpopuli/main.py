@@ -1,21 +1,34 @@
 """A lightweight Python wrapper of espeak and mbrola"""
-import fnmatch
-import io
 import logging
 import os
-import re
+import threading
+import time
 import wave
-from pathlib import Path
-from shlex import quote
-from shutil import which
-from struct import pack
-from subprocess import PIPE, run
+from struct import pack, unpack
+from subprocess import PIPE, CompletedProcess, Popen, TimeoutExpired, run
 from sys import platform
-from typing import List, Dict
+from typing import BinaryIO, List, Dict, Iterable, Iterator, Optional, Tuple
 from typing import Union
 
+from . import espeak_lib
+from .batch import BatchResult, map_batch
+from .cache import SynthesisCache
+from .conversion import ENCODINGS, OutputFormat, set_wav_sizes, \
+    wav_header_size
+from .errors import MissingVoice, RetryPolicy, SynthesisError, \
+    SynthesisTimeout, UnknownDiphone, check_run
+from .metrics import NOT_MEASURING, Instrumentation
+from .playback import PlaybackEngine, Utterance, WaveFormat
 from .phonemes import BritishEnglishPhonemes, GermanPhonemes, FrenchPhonemes, \
-    SpanishPhonemes, ItalianPhonemes, PhonemeList
+    SpanishPhonemes, ItalianPhonemes, PhonemeList, _numpy
+from .pool import ProcessPool
+from .registry import VoiceRegistry, find_binary, get_registry
+from .segment import Segment, SegmentedAudio, split_sentences
+from .timing import TimedAudio, TimingIndex
+
+WAV_HEADER_SIZE = 44
+# sizes used in the headers of streamed wave files, whose length isn't known
+STREAMING_WAV_SIZE = 0xFFFFFFFF
 
 
 class AudioPlayer:
@@ -47,6 +60,41 @@ class AudioPlayer:
             self.stream.write(data)
             data = self.wf.readframes(self.chunk)
 
+    def play_stream(self, chunks: Iterable[bytes]):
+        """Plays a wave file given as a stream of chunks, starting as soon as
+        its header has been received"""
+        if self.stream is not None:
+            self.stream.close()
+
+        chunks = iter(chunks)
+        header = b''
+        for chunk in chunks:
+            header += chunk
+            if (len(header) >= WAV_HEADER_SIZE
+                    and len(header) >= wav_header_size(header)):
+                break
+        if (len(header) < WAV_HEADER_SIZE
+                or len(header) < wav_header_size(header)):
+            return
+        wave_format = WaveFormat.from_header(header)
+        if wave_format.format_code == 3:
+            import pyaudio
+            sample_format = pyaudio.paFloat32
+        elif wave_format.format_code == 1:
+            sample_format = self.p.get_format_from_width(
+                wave_format.sample_width)
+        else:
+            raise ValueError("Can't play companded (mu-law or A-law) audio")
+        self.stream = self.p.open(
+            format=sample_format,
+            channels=wave_format.channels,
+            rate=wave_format.sample_rate,
+            output=True
+        )
+        self.stream.write(header[wav_header_size(header):])
+        for chunk in chunks:
+            self.stream.write(chunk)
+
     def close(self):
         """ Graceful shutdown """
         self.stream.stop_stream()
@@ -65,6 +113,11 @@ class Voice:
     class InvalidVoiceParameters(Exception):
         pass
 
+    SynthesisError = SynthesisError
+    UnknownDiphone = UnknownDiphone
+    MissingVoice = MissingVoice
+    Timeout = SynthesisTimeout
+
     if platform in ('linux', 'darwin'):
         espeak_binary = 'espeak'
         mbrola_binary = 'mbrola'
@@ -82,17 +135,53 @@ class Voice:
     else:
         raise ValueError('Unsupported system.')
 
+    # other folders where voices are looked for, after mbrola_voices_folder
+    extra_mbrola_voices_folders: List[str] = []
+
+    # plays the utterances of all the voices, created by the first say()
+    # if it isn't set beforehand
+    playback_engine: Optional[PlaybackEngine] = None
+    _playback_engine_lock = threading.Lock()
+
     volumes_presets = {'fr1': 1.17138, 'fr2': 1.60851, 'fr3': 1.01283,
                        'fr4': 1.0964, 'fr5': 2.64384, 'fr6': 1.35412,
                        'fr7': 1.96092, 'us1': 1.658, 'us2': 1.7486,
                        'us3': 3.48104, 'es1': 3.26885, 'es2': 1.84053}
 
     def __init__(self, speed: int = 160, pitch: int = 50, lang: str = "fr",
-                 voice_id: int = None, volume: float = None):
+                 voice_id: int = None, volume: float = None,
+                 pool: ProcessPool = None, cache: SynthesisCache = None,
+                 output_format: OutputFormat = None,
+                 instrumentation: Instrumentation = None,
+                 timeout: float = None, retry: RetryPolicy = None,
+                 strict: bool = False, espeak_library: bool = False):
         """All parameters are optional, but it's still advised that you pick
         a language, else it **will** default to French, which is a
         default to the most beautiful language on earth.
-        Any invalid parameter will raise an `InvalidVoiceParameter` exception."""
+        Any invalid parameter will raise an `InvalidVoiceParameter` exception.
+        If a ``ProcessPool`` is given, espeak and mbrola are run through its
+        warm workers instead of being started for each call, and if a
+        ``SynthesisCache`` is given, renderings are looked up in it before
+        running espeak or mbrola. An ``OutputFormat`` converts the rendered
+        audio to another sample rate, channel count or sample encoding
+        (which requires numpy), an invalid one raising a ``ValueError``.
+        An ``Instrumentation`` (such as a ``MetricsCollector``) is told about
+        the duration and sizes of each stage of the renderings, and about the
+        cache lookups.
+
+        Failed espeak or mbrola runs raise a ``Voice.SynthesisError`` (or one
+        of its subclasses ``Voice.UnknownDiphone``, ``Voice.MissingVoice``
+        and ``Voice.Timeout``, for runs taking more than ``timeout``
+        seconds), instead of returning an empty or truncated output. Runs
+        failing with a transient error are retried according to ``retry``
+        (a ``RetryPolicy``), be they pooled or part of a batch. Unless
+        ``strict`` is set, mbrola renders unknown diphones as silence
+        instead of failing.
+
+        If ``espeak_library`` is set, texts are phonemized in process by the
+        espeak-ng (or espeak) shared library, instead of by an espeak run per
+        call, falling back to running espeak if the library isn't
+        installed."""
 
         self.speed = speed
 
@@ -106,11 +195,10 @@ class Voice:
         voice_id = (voice_id if voice_id is not None
                     else self._find_existing_voiceid(lang))
         voice_name = lang + str(voice_id)
-        if (Path(self.mbrola_voices_folder)
-            / Path(voice_name)
-            / Path(voice_name)).is_file():
+        self._voice_database = self.registry().find(lang, voice_id)
+        if self._voice_database is not None:
             self.lang = lang
-            self.voice_id = voice_id
+            self.voice_id = int(voice_id)
         else:
             raise self.InvalidVoiceParameters(
                 "Voice %s not found. Check language and voice id, or install "
@@ -129,17 +217,32 @@ class Voice:
         except KeyError:
             self.phonemes = None
         self._player = None
+        self.pool = pool
+        self.cache = cache
+        if output_format is not None:
+            output_format.validate()
+        self.output_format = output_format
+        self.instrumentation = instrumentation
+        self.timeout = timeout
+        self.retry = retry
+        self.strict = strict
+        self.espeak_library = espeak_library
+
+    @classmethod
+    def registry(cls) -> VoiceRegistry:
+        """The registry of the voices installed in ``mbrola_voices_folder``
+        and ``extra_mbrola_voices_folders``, shared by all instances"""
+        return get_registry([cls.mbrola_voices_folder]
+                            + list(cls.extra_mbrola_voices_folders))
 
     def _find_existing_voiceid(self, lang: str):
         """Finds any possible voice id for a given language"""
-        for file in os.listdir(self.mbrola_voices_folder):
-            if fnmatch.fnmatch(file, lang + "[0-9]"):
-                return int(file.strip(lang))
+        voice_ids = self.registry().voice_ids(lang)
         # default to 1 if no voice are found (although it'll probably fail then)
-        return 1
+        return voice_ids[0] if voice_ids else 1
 
     def _mbrola_exists(self):
-        return which(self.mbrola_binary) is not None
+        return find_binary(self._executable(self.mbrola_binary)) is not None
 
     @property
     def player(self):
@@ -147,141 +250,586 @@ class Voice:
             self._player = AudioPlayer()
         return self._player
 
-    def _wav_format(self, wav: bytes):
-        """Reformats the wav returned by mbrola, which doesn't have the
+    def _wav_parts(self, wav: bytes) -> List[Union[bytes, memoryview]]:
+        """Splits the wav returned by mbrola, which doesn't have the
         right size headers, since mbrola doesn't know in advance
-        the size of the wav file."""
-        # the five terms of this bytes concatenation are the following:
-        # ["RIFF"] + [CHUNCK_SIZE] + [VARIOUS_HEADERS] + [SUBCHUNK_SIZE] + [ACTUAL_AUDIO_DATA]
+        the size of the wav file, into the parts of the fixed wav: its
+        header, and a view over the original bytes of the audio data."""
         # http://soundfile.sapp.org/doc/WaveFormat/ to get more details
-        return wav[:4] + pack('<I', len(wav) - 8) + wav[8:40] + pack('<I', len(
-            wav) - 44) + wav[44:]
+        view = memoryview(wav)
+        header_size = wav_header_size(wav)
+        header = bytearray(view[:header_size])
+        set_wav_sizes(header, len(wav))
+        return [header, view[header_size:]]
+
+    def _wav_format(self, wav: bytes) -> bytes:
+        """Reformats the wav returned by mbrola with the right size headers,
+        copying the audio data only once."""
+        return b"".join(self._wav_parts(wav))
+
+    def _measure(self, stage: str, bytes_in: int = 0):
+        """Times a stage for the voice's instrumentation, if it has one"""
+        if self.instrumentation is None:
+            return NOT_MEASURING
+        return self.instrumentation.measure(stage, bytes_in)
+
+    def _convert_wav(self, wav: bytes) -> bytes:
+        """Converts a rendered wav to the voice's output format, if any"""
+        if self.output_format is None:
+            return wav
+        with self._measure("conversion", len(wav)) as measure:
+            wav = self.output_format.convert_wav(wav)
+            measure.bytes_out = len(wav)
+        return wav
 
-    def _str_to_phonemes(self, text: str) -> PhonemeList:
+    @staticmethod
+    def _fix_wav_header(wav: bytearray):
+        """Sets the right size headers of a wav, in place"""
+        set_wav_sizes(wav, len(wav))
+
+    @staticmethod
+    def _write_wav(filename, parts: List[Union[bytes, memoryview]]):
+        """Writes the parts of a wav to a file with as few system calls as
+        possible, without joining them first"""
+        with open(filename, "wb") as wavfile:
+            if not hasattr(os, "writev"):
+                for part in parts:
+                    wavfile.write(part)
+                return
+            parts = [memoryview(part).cast('B') for part in parts if len(part)]
+            while parts:
+                written = os.writev(wavfile.fileno(), parts)
+                while parts and written >= len(parts[0]):
+                    written -= len(parts.pop(0))
+                if parts:
+                    parts[0] = parts[0][written:]
+
+    @staticmethod
+    def _executable(binary: str) -> str:
+        """Removes the quotes that were only needed by the shell"""
+        return binary.strip('"')
+
+    def _subprocess_env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        # Linux-specific memory management setting
+        # Tells Clib to ignore allocations problems (which happen but doesn't
+        # compromise espeak's outputs)
+        if platform in ('linux', 'darwin'):
+            env['MALLOC_CHECK_'] = '0'
+        return env
+
+    def _espeak_voice_name(self) -> str:
         espeak_voice_name_template = ('mb/mb-%s%d'
                                       if platform in ('linux', 'darwin')
                                       else 'mb-%s%d')
-        voice_filename = espeak_voice_name_template % (self.lang, self.sex)
+        return espeak_voice_name_template % (self.lang, self.sex)
+
+    @staticmethod
+    def _espeak_input(text: str) -> bytes:
+        # espeak's stdin reader drops the last byte of an input that doesn't
+        # end with a newline
+        return text.encode("utf-8") + b"\n"
+
+    def _espeak_args(self) -> List[str]:
+        voice_filename = self._espeak_voice_name()
 
         # Detailed explanation of options:
         # http://espeak.sourceforge.net/commands.html
-        phoneme_synth_args = [
-            self.espeak_binary,
+        return [
+            self._executable(self.espeak_binary),
             '-s', str(self.speed),
             '-p', str(self.pitch),
             '--pho',  # outputs mbrola phoneme data
             '-q',  # quiet mode
             '-v', voice_filename,
-            '%s' % text]
+            '--stdin']  # the text is read from stdin
 
-        # Linux-specific memory management setting
-        # Tells Clib to ignore allocations problems (which happen but doesn't
-        # compromise espeak's outputs)
-        if platform in ('linux', 'darwin'):
-            phoneme_synth_args.insert(0, 'MALLOC_CHECK_=0')
+    def _mbrola_args(self) -> List[str]:
+        voice_phonemic_db = str(self._voice_database)
 
-        logging.debug("Running espeak command %s"
-                      % " ".join(phoneme_synth_args))
-
-        # Since MALLOC_CHECK_ has to be used before anything else,
-        # we need to compile the full command as a single
-        # string and we need to use `shell=True`.
-        return PhonemeList.from_pho_str(
-            run(' '.join(phoneme_synth_args), shell=True, stdout=PIPE,
-                stderr=PIPE)
-                .stdout
-                .decode("utf-8")
-                .strip())
-
-    def _phonemes_to_audio(self, phonemes: PhonemeList) -> bytes:
-        voice_path_template = ('%s/%s%d/%s%d'
-                               if platform in ("linux", "darwin")
-                               else '%s\\%s%d\\%s%d')
-        voice_phonemic_db = (voice_path_template
-                             % (self.mbrola_voices_folder, self.lang,
-                                self.voice_id, self.lang, self.voice_id))
-
-        audio_synth_string = [
-            self.mbrola_binary,
-            '-v', str(self.volume),
-            '-e',  # ignores fatal errors on unknown diphone
+        return [
+            self._executable(self.mbrola_binary),
+            '-v', str(self.volume)] + (
+            [] if self.strict
+            else ['-e']) + [  # ignores fatal errors on unknown diphone
             voice_phonemic_db,
             '-',  # command or .pho file; `-` instead of a file means stdin
             '-.wav'  # output file; `-` instead of a file means stdout
         ]
 
-        if platform in ('linux', 'darwin'):
-            audio_synth_string.insert(0, 'MALLOC_CHECK_=0')
+    def _timeout_error(self, stage: str) -> SynthesisTimeout:
+        return SynthesisTimeout("%s took more than %s seconds"
+                                % (stage, self.timeout), stage)
+
+    @staticmethod
+    def _check_audio(stage: str, wav: bytes, stderr: bytes = b""):
+        """Raises a ``SynthesisError`` if mbrola's output isn't a wav, told
+        apart by its error output"""
+        if len(wav) < WAV_HEADER_SIZE or not wav.startswith(b'RIFF'):
+            check_run(stage, 0, stderr, no_audio=True)
+
+    def _retried(self, func, *args):
+        if self.retry is None:
+            return func(*args)
+        return self.retry.call(func, *args)
+
+    def _run(self, args: List[str], input: bytes, stage: str) -> bytes:
+        """Runs one of the binaries, without any shell, feeding ``input``
+        to its stdin, and returns its stdout, retrying it if the voice has
+        a retry policy"""
+        return self._retried(self._run_once, args, input, stage)
+
+    def _run_once(self, args: List[str], input: bytes, stage: str) -> bytes:
+        logging.debug("Running %s command %s" % (stage, " ".join(args)))
+        with self._measure(stage, len(input)) as measure:
+            try:
+                if self.pool is not None:
+                    process = self.pool.run(args, input, stage,
+                                            env=self._subprocess_env(),
+                                            timeout=self.timeout)
+                else:
+                    process = run(args, input=input, stdout=PIPE, stderr=PIPE,
+                                  env=self._subprocess_env(),
+                                  timeout=self.timeout)
+            except TimeoutExpired:
+                raise self._timeout_error(stage) from None
+            measure.bytes_out = len(process.stdout)
+            measure.stderr_bytes = len(process.stderr)
+            check_run(stage, process.returncode, process.stderr)
+            if stage == "mbrola":
+                self._check_audio(stage, process.stdout, process.stderr)
+        return process.stdout
+
+    def _parse_phonemes(self, pho: bytes) -> PhonemeList:
+        with self._measure("parse", len(pho)):
+            return PhonemeList.from_pho_str(pho.decode("utf-8").strip())
+
+    def _loaded_espeak_library(self) -> Optional[espeak_lib.EspeakLibrary]:
+        return espeak_lib.load() if self.espeak_library else None
+
+    def _phonemize_in_process(self, library: espeak_lib.EspeakLibrary,
+                              text: str) -> bytes:
+        with self._measure("espeak", len(text.encode("utf-8"))) as measure:
+            pho = library.phonemize(text, self._espeak_voice_name(),
+                                    self.speed, self.pitch)
+            measure.bytes_out = len(pho)
+        return pho
 
-        logging.debug(
-            "Running mbrola command %s" % " ".join(audio_synth_string))
-        return self._wav_format(
-            run(" ".join(audio_synth_string), shell=True, stdout=PIPE,
-                stderr=PIPE, input=str(phonemes).encode("utf-8")).stdout)
+    def _str_to_phonemes(self, text: str) -> PhonemeList:
+        library = self._loaded_espeak_library()
+        if library is not None:
+            return self._parse_phonemes(
+                self._retried(self._phonemize_in_process, library, text))
+        return self._parse_phonemes(
+            self._run(self._espeak_args(), self._espeak_input(text), "espeak"))
 
-    def _str_to_audio(self, text: str) -> bytes:
+    def _phonemes_to_audio(self, phonemes: PhonemeList) -> bytes:
+        """Returns mbrola's raw output, whose header sizes aren't set"""
+        return self._run(self._mbrola_args(), str(phonemes).encode("utf-8"),
+                         "mbrola")
 
-        phonemes_list = self._str_to_phonemes(text)
-        audio = self._phonemes_to_audio(phonemes_list)
+    def _str_to_audio(self, text: str) -> bytes:
+        """Returns mbrola's raw output, whose header sizes aren't set"""
+        if self.pool is not None or self._loaded_espeak_library() is not None:
+            # pooled workers are started before their input is known, and
+            # the espeak library runs in process: neither can be plugged
+            # into mbrola
+            return self._phonemes_to_audio(self._str_to_phonemes(text))
+
+        # espeak's output is plugged straight into mbrola's input
+        espeak_args, mbrola_args = self._espeak_args(), self._mbrola_args()
+        logging.debug("Running espeak command %s | mbrola command %s"
+                      % (" ".join(espeak_args), " ".join(mbrola_args)))
+        return self._retried(self._pipe, espeak_args, mbrola_args,
+                             self._espeak_input(text))
+
+    def _pipe(self, espeak_args: List[str], mbrola_args: List[str],
+              text: bytes) -> bytes:
+        """Runs espeak piped into mbrola, and returns mbrola's stdout"""
+        with self._measure("pipeline", len(text)) as measure:
+            espeak, mbrola = self._run_pipe(espeak_args, mbrola_args, text)
+            measure.bytes_out = len(mbrola.stdout)
+            measure.stderr_bytes = len(espeak.stderr) + len(mbrola.stderr)
+            if mbrola.returncode:
+                # espeak then dies of a broken pipe: mbrola's error is
+                # the actual cause
+                check_run("mbrola", mbrola.returncode, mbrola.stderr)
+            check_run("espeak", espeak.returncode, espeak.stderr)
+            check_run("mbrola", mbrola.returncode, mbrola.stderr)
+            self._check_audio("mbrola", mbrola.stdout, mbrola.stderr)
+        return mbrola.stdout
+
+    def _on_piped_stage(self, stage: str, process: CompletedProcess,
+                        seconds: float, bytes_in: int, bytes_out: int):
+        """Reports a process of the pipeline as its own stage. The bytes
+        going through the pipe aren't counted."""
+        if self.instrumentation is not None:
+            self.instrumentation.on_stage(stage, seconds, bytes_in, bytes_out,
+                                          len(process.stderr),
+                                          failed=process.returncode != 0)
+
+    def _run_pipe(self, espeak_args: List[str], mbrola_args: List[str],
+                  text: bytes) -> Tuple[CompletedProcess, CompletedProcess]:
+        env = self._subprocess_env()
+        started = time.perf_counter()
+        read_fd, write_fd = os.pipe()
+        try:
+            mbrola = Popen(mbrola_args, stdin=read_fd, stdout=PIPE,
+                           stderr=PIPE, env=env)
+            try:
+                espeak = Popen(espeak_args, stdin=PIPE, stdout=write_fd,
+                               stderr=PIPE, env=env)
+            except BaseException:
+                mbrola.kill()
+                mbrola.communicate()
+                raise
+        finally:
+            # the children hold their own copies of the pipe's ends
+            os.close(read_fd)
+            os.close(write_fd)
+        # espeak is fed from a thread while mbrola's output is being read
+        espeak_outputs = []
+
+        def feed():
+            espeak_outputs.extend(espeak.communicate(text))
+            espeak_outputs.append(time.perf_counter())
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            stdout, stderr = mbrola.communicate(timeout=self.timeout)
+        except TimeoutExpired:
+            for process in (espeak, mbrola):
+                process.kill()
+            mbrola.communicate()
+            feeder.join()
+            raise self._timeout_error("pipeline") from None
+        mbrola_ended = time.perf_counter()
+        feeder.join()
+        _, espeak_stderr, espeak_ended = (espeak_outputs or
+                                          [None, b"", time.perf_counter()])
+        espeak_run = CompletedProcess(espeak_args, espeak.returncode, None,
+                                      espeak_stderr)
+        mbrola_run = CompletedProcess(mbrola_args, mbrola.returncode, stdout,
+                                      stderr)
+        # both run concurrently: mbrola's time includes waiting on espeak
+        self._on_piped_stage("espeak", espeak_run, espeak_ended - started,
+                             len(text), 0)
+        self._on_piped_stage("mbrola", mbrola_run, mbrola_ended - started,
+                             0, len(stdout))
+        return espeak_run, mbrola_run
+
+    def _render(self, speech: Union[PhonemeList, str]) -> bytes:
+        """Renders a str or a ``PhonemeList`` to mbrola's raw output"""
+        if not self._mbrola_exists():
+            raise RuntimeError("Can't synthesize sound: mbrola executable "
+                               "is not present. "
+                               "Install using apt get install mbrola or "
+                               "from the official mbrola repository on "
+                               "github")
 
-        return audio
+        if isinstance(speech, str):
+            return self._str_to_audio(speech)
+        elif isinstance(speech, PhonemeList):
+            return self._phonemes_to_audio(speech)
+        raise TypeError("Expecting a str or a PhonemeList, got %s"
+                        % str(type(speech)))
+
+    def _cache_key(self, kind: str, speech: Union[PhonemeList, str]):
+        if self.cache is None:
+            return None
+        return self.cache.key(kind, str(speech), self)
+
+    def _cached(self, speech: Union[PhonemeList, str],
+                kind: str = None) -> Tuple[Optional[str], Optional[bytes]]:
+        """Returns the cache key of a rendering (``None`` without a
+        cache) and its cached value, if any. ``kind`` defaults to the kind of
+        audio rendering of ``speech``."""
+        if kind is None:
+            kind = ("text_audio" if isinstance(speech, str)
+                    else "phonemes_audio")
+        cache_key = self._cache_key(kind, speech)
+        if cache_key is None:
+            return None, None
+        value = self.cache.get(cache_key)
+        if self.instrumentation is not None:
+            self.instrumentation.on_cache(kind, value is not None)
+        return cache_key, value
 
     def to_phonemes(self, text: str) -> PhonemeList:
         """Renders a str to a ```PhonemeList`` object."""
-        return self._str_to_phonemes(quote(text))
+        cache_key, cached = self._cached(text, "phonemes")
+        if cached is not None:
+            return self._parse_phonemes(cached)
 
-    def to_audio(self, speech: Union[PhonemeList, str], filename=None) -> bytes:
+        phonemes = self._str_to_phonemes(text)
+        if cache_key is not None:
+            self.cache.put(cache_key, str(phonemes).encode("utf-8"))
+        return phonemes
+
+    def to_audio(self, speech: Union[PhonemeList, str], filename=None,
+                 timing: bool = False) -> Union[bytes, TimedAudio]:
         """Renders a str or a ``PhonemeList`` to a wave byte object.
         If a filename is specified, it saves the audio file to wave as well
-        Throws a `InvalidVoiceParameters` if the voice isn't found"""
+        Throws a `InvalidVoiceParameters` if the voice isn't found.
+        If ``timing`` is set, returns a ``TimedAudio``, holding the wave
+        and the ``TimingIndex`` of its phonemes and phrases."""
+        if timing:
+            return self._timed_audio(speech, filename)
+
+        cache_key, wav = self._cached(speech)
+
+        if wav is None:
+            raw_wav = self._convert_wav(self._render(speech))
+            if filename is not None:
+                self._write_wav(filename, self._wav_parts(raw_wav))
+            with self._measure("wav_fixup", len(raw_wav)) as measure:
+                wav = self._wav_format(raw_wav)
+                measure.bytes_out = len(wav)
+
+            if cache_key is not None:
+                self.cache.put(cache_key, wav)
+        elif filename is not None:
+            self._write_wav(filename, [wav])
 
-        if not self._mbrola_exists():
-            raise RuntimeError("Can't synthesize sound: mbrola executable is "
-                               "not present. "
-                               "Install using apt get install mbrola or from"
-                               "the official mbrola repository on github")
+        return wav
 
-        if isinstance(speech, str):
-            wav = self._str_to_audio(quote(speech))
-        elif isinstance(speech, PhonemeList):
-            wav = self._phonemes_to_audio(speech)
+    def _timed_audio(self, speech: Union[PhonemeList, str],
+                     filename=None) -> TimedAudio:
+        text = speech if isinstance(speech, str) else None
+        phonemes = self.to_phonemes(text) if text is not None else speech
+        wav = self.to_audio(phonemes, filename)
+        wave_format = WaveFormat.from_header(wav)
+        total_samples = ((len(wav) - wav_header_size(wav))
+                         // wave_format.block_size)
+        return TimedAudio(wav, TimingIndex(phonemes, wave_format.sample_rate,
+                                           total_samples, text))
+
+    def to_pcm(self, speech: Union[PhonemeList, str]) -> memoryview:
+        """Renders a str or a ``PhonemeList`` to its raw PCM samples
+        (16 bits, mono, at the voice's sample rate), as a view over the
+        output of mbrola, without any copy or parsing of the wav. If the
+        voice has an output format, the samples are in that format."""
+        if self.cache is not None or self.output_format is not None:
+            wav = self.to_audio(speech)
+            return memoryview(wav)[wav_header_size(wav):]
+        return memoryview(self._render(speech))[WAV_HEADER_SIZE:]
+
+    def to_numpy(self, speech: Union[PhonemeList, str]):
+        """Renders a str or a ``PhonemeList`` to a (read-only) ``np.int16``
+        array of its samples, sharing the memory of ``to_pcm``'s view. If the
+        voice has an output format, the array has its sample type (``uint8``
+        for companded samples) and one column per channel."""
+        np = _numpy()
+        if self.output_format is None:
+            return np.frombuffer(self.to_pcm(speech), dtype='<i2')
+        samples = np.frombuffer(self.to_pcm(speech),
+                                dtype=ENCODINGS[self.output_format.encoding][2])
+        if self.output_format.channels > 1:
+            samples = samples.reshape(-1, self.output_format.channels)
+        return samples
+
+    def to_phonemes_many(self, texts: Iterable[str], max_workers: int = None,
+                         as_completed: bool = False) -> Iterator[BatchResult]:
+        """Renders several str to ``PhonemeList`` objects concurrently,
+        using up to ``max_workers`` espeak processes at once (defaults
+        to the number of cores). Yields a ``BatchResult`` per text, in input
+        order, or as soon as they're rendered if ``as_completed`` is set.
+        An error on one of the texts is stored in its ``BatchResult``
+        instead of stopping the batch."""
+        return map_batch(self.to_phonemes, texts, max_workers, as_completed)
+
+    def to_audio_many(self, speeches: Iterable[Union[PhonemeList, str]],
+                      max_workers: int = None,
+                      as_completed: bool = False) -> Iterator[BatchResult]:
+        """Renders several str or ``PhonemeList`` to wave bytes objects
+        concurrently, the espeak and mbrola stages of different items running
+        at the same time. Yields a ``BatchResult`` per item, like
+        ``to_phonemes_many``."""
+        return map_batch(self.to_audio, speeches, max_workers, as_completed)
+
+    def to_audio_long(self, text: str, max_workers: int = None,
+                      max_segment_length: int = 400,
+                      filename=None) -> SegmentedAudio:
+        """Renders a long text to a wave byte object, sentence by sentence.
+        Segments are rendered concurrently (by up to ``max_workers``
+        threads), so that espeak runs on the next segments while mbrola
+        renders the previous ones, then joined into a single wave file.
+        Returns it along with the byte offsets of each segment."""
+        texts = split_sentences(text, max_segment_length)
+        header, frames, segments = None, bytearray(), []
+        for result in self.to_audio_many(texts, max_workers):
+            if not result.ok:
+                raise result.error
+            wav = result.value
+            header_size = wav_header_size(wav)
+            if header is None:
+                header = wav[:header_size]
+            start = len(header) + len(frames)
+            frames += wav[header_size:]
+            segments.append(Segment(texts[result.index], start,
+                                    len(header) + len(frames)))
+
+        if header is None:
+            wav = self.to_audio(text)
+        else:
+            wav = bytearray(header)
+            wav += frames
+            self._fix_wav_header(wav)
+            wav = bytes(wav)
 
         if filename is not None:
             with open(filename, "wb") as wavfile:
                 wavfile.write(wav)
 
-        return wav
+        return SegmentedAudio(wav, segments)
+
+    @staticmethod
+    def _feed(stdin: BinaryIO, data: bytes):
+        try:
+            stdin.write(data)
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+    def stream_audio(self, speech: Union[PhonemeList, str],
+                     chunk_size: int = 4096) -> Iterator[bytes]:
+        """Renders a str or a ``PhonemeList`` to a wave file, yielded in
+        chunks as mbrola produces them. The first chunk is the wave header,
+        whose sizes are set to ``0xFFFFFFFF`` since the length of the audio
+        isn't known yet, and the following ones hold at most ``chunk_size``
+        bytes of PCM frames. If the voice has an output format, the frames
+        are converted chunk by chunk, ``chunk_size`` then being the size of
+        mbrola's chunks. A failure of mbrola raises a ``Voice.SynthesisError``
+        as soon as it's detected (the voice's timeout doesn't apply to
+        streams)."""
+        cache_key, wav = self._cached(speech)
+        if wav is not None:
+            header_size = wav_header_size(wav)
+            yield wav[:header_size]
+            for start in range(header_size, len(wav), chunk_size):
+                yield wav[start:start + chunk_size]
+            return
+
+        if not self._mbrola_exists():
+            raise RuntimeError("Can't synthesize sound: mbrola executable "
+                               "is not present. "
+                               "Install using apt get install mbrola or "
+                               "from the official mbrola repository on "
+                               "github")
+
+        if isinstance(speech, str):
+            speech = self.to_phonemes(speech)
+        audio_synth_args = self._mbrola_args()
+        logging.debug("Running streamed mbrola command %s"
+                      % " ".join(audio_synth_args))
+        process = Popen(audio_synth_args, stdin=PIPE, stdout=PIPE,
+                        stderr=PIPE, env=self._subprocess_env())
+        # the phonemes are written from another thread, so that a long
+        # phoneme list can't deadlock with mbrola's output
+        feeder = threading.Thread(target=self._feed, daemon=True,
+                                  args=(process.stdin,
+                                        str(speech).encode("utf-8")))
+        feeder.start()
+        try:
+            header = b''
+            while len(header) < WAV_HEADER_SIZE:
+                data = process.stdout.read(WAV_HEADER_SIZE - len(header))
+                if not data:
+                    break
+                header += data
+            if len(header) < WAV_HEADER_SIZE:
+                process.wait()
+                stderr = process.stderr.read()
+                check_run("mbrola", process.returncode, stderr)
+                self._check_audio("mbrola", header, stderr)
+            converter = None
+            if self.output_format is not None and len(header) >= 28:
+                converter = self.output_format.converter(
+                    unpack('<I', header[24:28])[0])
+                yield self.output_format.wav_header(converter.output_rate)
+            else:
+                yield (header[:4] + pack('<I', STREAMING_WAV_SIZE)
+                       + header[8:40] + pack('<I', STREAMING_WAV_SIZE))
+            while True:
+                data = process.stdout.read1(chunk_size)
+                if not data:
+                    break
+                if converter is not None:
+                    data = converter.process(data)
+                    if not data:
+                        continue
+                yield data
+            # a failure halfway through is raised after the frames
+            # rendered so far
+            process.wait()
+            check_run("mbrola", process.returncode, process.stderr.read())
+            if converter is not None:
+                data = converter.flush()
+                if data:
+                    yield data
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.stderr.close()
+            process.wait()
+            feeder.join()
+
+    def stream_to_file(self, speech: Union[PhonemeList, str], filename,
+                       chunk_size: int = 4096) -> int:
+        """Writes the chunks of ``stream_audio`` to a file as they come,
+        then seeks back to set the right sizes in the wave header. Returns
+        the size of the written file."""
+        header = None
+        with open(filename, "wb") as wavfile:
+            for chunk in self.stream_audio(speech, chunk_size):
+                if header is None:
+                    # the first chunk is the whole header
+                    header = bytearray(chunk)
+                wavfile.write(chunk)
+            size = wavfile.tell()
+            set_wav_sizes(header, size)
+            wavfile.seek(0)
+            wavfile.write(header)
+        return size
+
+    @classmethod
+    def _playback(cls) -> PlaybackEngine:
+        with cls._playback_engine_lock:
+            if cls.playback_engine is None:
+                try:
+                    cls.playback_engine = PlaybackEngine()
+                except ImportError:
+                    raise ImportError(
+                        "You must install the pyaudio pip package to be able "
+                        "to use the say() method")
+            return cls.playback_engine
 
     def say(self, speech: Union[PhonemeList, str]):
         """Renders a string or a ``PhonemeList`` object to audio,
-        then plays it using the PyAudio lib"""
-        wav = self.to_audio(speech)
-        try:
-            self.player.set_file(io.BytesIO(wav))
-        except ImportError:
-            raise ImportError(
-                "You must install the pyaudio pip package to be able to "
-                "use the say() method")
-        else:
-            self.player.play()
-            self.player.close()
+        then plays it using the PyAudio lib, through the voices'
+        ``playback_engine``. The playback starts as soon as
+        mbrola outputs its first frames, and this returns once it's over."""
+        self._playback().say(self, speech)
+
+    def say_async(self, speech: Union[PhonemeList, str]) -> Utterance:
+        """Queues a string or a ``PhonemeList`` object on the voices'
+        ``playback_engine``, to be played after the utterances queued
+        before it, and returns without waiting for it"""
+        return self._playback().say_async(self, speech)
 
     @classmethod
     def list_voice_ids(cls) -> Dict[str, List]:
         """Returns a dictionary listing available voice id's for each language"""
-        langs: Dict[str, List] = {}
-        for file in os.listdir(cls.mbrola_voices_folder):
-            match = re.match(r"([a-z]{2})([0-9])", file)
-            if match is not None:
-                lang, voice_id = match.groups()
-                if lang not in langs:
-                    langs[lang] = []
-                langs[lang].append(voice_id)
-        return langs
+        return {lang: [str(voice_id) for voice_id in sorted(voices)]
+                for lang, voices in cls.registry().voices.items()}
 
     @classmethod
     def get_voices_for_lang(cls, lang: str) -> List['Voice']:
-        """Get instances of all the available voices for a particular language"""
-        voice_ids = cls.list_voice_ids()
-        return [Voice(voice_id=voice_id, lang=lang)
-                for voice_id in voice_ids[lang]]
+        """Get instances of all the available voices for a particular language.
+        The instances are new ones, which the caller can change freely:
+        they're cheap to create, since the installed voices are looked up
+        in the shared ``registry``."""
+        return [cls(voice_id=voice_id, lang=lang)
+                for voice_id in cls.registry().voice_ids(lang)]
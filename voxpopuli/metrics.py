@@ -0,0 +1,188 @@
+"""Instrumentation hooks of the synthesis stages, and an in-process
+metrics collector"""
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# upper bounds (in seconds) of the latency histograms' buckets, from 50µs
+# to about 100s, each twice as wide as the previous one
+LATENCY_BUCKETS = [0.00005 * 2 ** exponent for exponent in range(22)]
+
+
+class StageMeasure:
+    """What is known of a stage while it runs, filled in by the code being
+    measured"""
+    __slots__ = ("stage", "bytes_in", "bytes_out", "stderr_bytes", "start")
+
+    def __init__(self, stage: str, bytes_in: int = 0):
+        self.stage = stage
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+        self.stderr_bytes = 0
+        self.start = time.perf_counter()
+
+
+class _Measuring:
+    """Times a stage, and reports it to the instrumentation on exit"""
+    __slots__ = ("instrumentation", "measure")
+
+    def __init__(self, instrumentation: 'Instrumentation', stage: str,
+                 bytes_in: int):
+        self.instrumentation = instrumentation
+        self.measure = StageMeasure(stage, bytes_in)
+
+    def __enter__(self) -> StageMeasure:
+        self.measure.start = time.perf_counter()
+        return self.measure
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        measure = self.measure
+        self.instrumentation.on_stage(measure.stage,
+                                      time.perf_counter() - measure.start,
+                                      measure.bytes_in, measure.bytes_out,
+                                      measure.stderr_bytes,
+                                      failed=exc_type is not None)
+
+
+class _NotMeasuring:
+    """Stands in for ``_Measuring`` on voices without instrumentation"""
+
+    def __enter__(self) -> StageMeasure:
+        return StageMeasure("")
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NOT_MEASURING = _NotMeasuring()
+
+
+class Instrumentation:
+    """Receives the measurements of the voices it's given to (as their
+    ``instrumentation`` parameter). Its methods do nothing: override the ones
+    you're interested in. They're called from the rendering threads, so they
+    should be quick and thread-safe.
+
+    The measured stages are ``"espeak"`` and ``"mbrola"`` (each binary's run,
+    input fed and output read), ``"pipeline"`` (espeak piped straight into
+    mbrola), ``"parse"`` (espeak's output into a ``PhonemeList``),
+    ``"conversion"`` (to the voice's output format) and ``"wav_fixup"``
+    (setting the sizes of mbrola's wave header).
+
+    A pipeline is also reported as an ``"espeak"`` and an ``"mbrola"``
+    stage, each lasting from the start of the pipeline to the exit of its
+    process. They overlap, mbrola's time includes waiting on espeak's output,
+    and the phonemes going through the pipe are counted in neither's
+    bytes."""
+
+    def on_stage(self, stage: str, seconds: float, bytes_in: int,
+                 bytes_out: int, stderr_bytes: int, failed: bool = False):
+        """Called after each stage, with its duration and the size of its
+        input, output and error output"""
+
+    def on_cache(self, kind: str, hit: bool):
+        """Called after each cache lookup, ``kind`` being ``"phonemes"``,
+        ``"text_audio"`` or ``"phonemes_audio"``"""
+
+    def measure(self, stage: str, bytes_in: int = 0) -> _Measuring:
+        """A context manager timing a stage, which yields a
+        ``StageMeasure`` whose ``bytes_out`` and ``stderr_bytes`` can be set
+        before it exits"""
+        return _Measuring(self, stage, bytes_in)
+
+
+class Histogram:
+    """Counts of values in exponential buckets, along with their count, sum,
+    minimum and maximum"""
+
+    def __init__(self, bounds: List[float] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        # the last bucket holds the values above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Upper bound of the bucket holding the given percentile (or the
+        maximum, if it's lower)"""
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = (self.bounds[index] if index < len(self.bounds)
+                         else self.max)
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.min, "max": self.max,
+                "p50": self.percentile(50), "p95": self.percentile(95),
+                "p99": self.percentile(99)}
+
+
+class MetricsCollector(Instrumentation):
+    """Collects the measurements of one or several voices in memory: a
+    latency histogram, byte counters and a failure count per stage, and
+    hit and miss counters per kind of cache lookup."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latencies: Dict[str, Histogram] = defaultdict(Histogram)
+            self.bytes_in: Dict[str, int] = defaultdict(int)
+            self.bytes_out: Dict[str, int] = defaultdict(int)
+            self.stderr_bytes: Dict[str, int] = defaultdict(int)
+            self.failures: Dict[str, int] = defaultdict(int)
+            self.cache_hits: Dict[str, int] = defaultdict(int)
+            self.cache_misses: Dict[str, int] = defaultdict(int)
+
+    def on_stage(self, stage: str, seconds: float, bytes_in: int,
+                 bytes_out: int, stderr_bytes: int, failed: bool = False):
+        with self._lock:
+            self.latencies[stage].add(seconds)
+            self.bytes_in[stage] += bytes_in
+            self.bytes_out[stage] += bytes_out
+            self.stderr_bytes[stage] += stderr_bytes
+            if failed:
+                self.failures[stage] += 1
+
+    def on_cache(self, kind: str, hit: bool):
+        with self._lock:
+            if hit:
+                self.cache_hits[kind] += 1
+            else:
+                self.cache_misses[kind] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Returns the summary of each stage's latencies (in seconds) and
+        counters, and the cache counters"""
+        with self._lock:
+            stages = {stage: dict(histogram.summary(),
+                                  bytes_in=self.bytes_in[stage],
+                                  bytes_out=self.bytes_out[stage],
+                                  stderr_bytes=self.stderr_bytes[stage],
+                                  failures=self.failures[stage])
+                      for stage, histogram in self.latencies.items()}
+            cache = {kind: {"hits": self.cache_hits[kind],
+                            "misses": self.cache_misses[kind]}
+                     for kind in set(self.cache_hits) | set(self.cache_misses)}
+        return {"stages": stages, "cache": cache}
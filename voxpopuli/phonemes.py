@@ -1,6 +1,50 @@
 """Objects and functions used for parsing and manipulating mbrola phonemes"""
+import io
+import threading
+from array import array
 from collections.abc import MutableSequence
-from typing import Tuple, List, Union, Iterable
+from itertools import accumulate, islice
+from pathlib import Path
+from types import MappingProxyType
+from typing import (Tuple, List, Union, Iterable, Dict, Sequence, IO,
+                    Iterator, FrozenSet, Type)
+
+# Phoneme names are interned to integer codes, shared by all the phoneme
+# lists of the process (languages share most of their SAMPA codes). The
+# codes are stored on 32 bits: malformed .pho input can bring any number
+# of distinct names.
+_phoneme_names: List[str] = []
+_phoneme_codes: Dict[str, int] = {}
+_interning_lock = threading.Lock()
+
+# the mbrola pause, valid in any language
+PAUSE = "_"
+
+
+def intern_phoneme(name: str) -> int:
+    """Returns the integer code of a phoneme name"""
+    try:
+        return _phoneme_codes[name]
+    except KeyError:
+        with _interning_lock:
+            if name not in _phoneme_codes:
+                _phoneme_codes[name] = len(_phoneme_names)
+                _phoneme_names.append(name)
+            return _phoneme_codes[name]
+
+
+# string forms of the small integers found in pitch points
+_integer_strings: List[str] = []
+
+
+def _int_strings(maximum: int) -> List[str]:
+    """Returns the list of the string forms of the integers, up
+    to ``maximum`` at least"""
+    if maximum >= len(_integer_strings):
+        with _interning_lock:
+            _integer_strings.extend(map(str, range(len(_integer_strings),
+                                                   maximum + 1)))
+    return _integer_strings
 
 
 def pairwise(iterable):
@@ -9,22 +53,352 @@ def pairwise(iterable):
     return zip(a, a)
 
 
+def _line_batches(pho_file: IO, batch_size: int) -> Iterator[List[str]]:
+    """Reads a text or binary file by batches of lines"""
+    while True:
+        lines = list(islice(pho_file, batch_size))
+        if not lines:
+            return
+        if isinstance(lines[0], bytes):
+            lines = b"".join(lines).decode("utf-8").split("\n")
+        yield lines
+
+
+def iter_pho(pho_file: IO, batch_size: int = 4096) -> Iterator['PhonemeList']:
+    """Parses a .pho file (a text or binary file object) lazily, yielding
+    ``PhonemeList`` objects of at most ``batch_size`` phonemes, which makes it
+    possible to go through very large files in constant memory."""
+    for lines in _line_batches(pho_file, batch_size):
+        phonemes = PhonemeList.from_pho_str("")
+        phonemes._rows.extend(phonemes._store.extend_pho_lines(lines))
+        if phonemes:
+            yield phonemes
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("You must install the numpy pip package to be able "
+                          "to use this method")
+    return numpy
+
+
+def _is_compact(value, maximum: int) -> bool:
+    return type(value) is int and 0 <= value <= maximum
+
+
+def _pho_line(name: str, duration, pitch_mods: List[Tuple[int, int]]) -> str:
+    return (name + "\t" + str(duration) + "\t"
+            + " ".join([str(percent) + " " + str(pitch)
+                        for percent, pitch in pitch_mods]))
+
+
+class _PhonemeStore:
+    """Columnar storage for the phonemes of a ``PhonemeList``: one row per
+    phoneme, holding its name code, its duration and the offset and count of
+    its pitch points in the flat percent and pitch arrays.
+
+    Rows are never moved, so that ``Phoneme`` views stay valid when the list
+    is modified: the rows (and pitch points) a list no longer uses are only
+    reclaimed when it's copied. Values that don't fit in the arrays (floats,
+    typically) are kept as is in sparse dictionaries."""
+    __slots__ = ('codes', 'durations', 'pitch_offsets', 'pitch_counts',
+                 'percents', 'pitches', 'exact_durations', 'exact_pitches')
+
+    def __init__(self):
+        self.codes = array('I')
+        self.durations = array('I')
+        self.pitch_offsets = array('I')
+        self.pitch_counts = array('H')
+        self.percents = array('H')
+        self.pitches = array('H')
+        self.exact_durations: Dict[int, float] = {}
+        self.exact_pitches: Dict[int, List[Tuple[float, float]]] = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, name: str, duration: int,
+               pitch_mods: List[Tuple[int, int]]) -> int:
+        row = len(self.codes)
+        self.codes.append(intern_phoneme(name))
+        self.durations.append(0)
+        self.pitch_offsets.append(len(self.percents))
+        self.pitch_counts.append(0)
+        self.set_duration(row, duration)
+        self.set_pitch_modifiers(row, pitch_mods)
+        return row
+
+    def append_from(self, store: '_PhonemeStore', row: int) -> int:
+        return self.append(store.name(row), store.duration(row),
+                           store.pitch_modifiers(row))
+
+    def copy_rows(self, store: '_PhonemeStore', rows: Sequence[int]) -> array:
+        """Copies rows of another store at the end of this one, in bulk, and
+        returns their new rows. Only the pitch points of these rows are
+        copied, and a row found several times is copied once, so that it's
+        still the same phoneme."""
+        first_row = len(self.codes)
+        if (not first_row and len(rows) == len(store)
+                and sum(store.pitch_counts) == len(store.percents)
+                and array('I', rows) == array('I', range(len(store)))):
+            # the whole store is used, in order: its arrays are copied as is
+            for attribute in ('codes', 'durations', 'pitch_offsets',
+                              'pitch_counts', 'percents', 'pitches'):
+                setattr(self, attribute, getattr(store, attribute)[:])
+            self.exact_durations = dict(store.exact_durations)
+            self.exact_pitches = {row: list(pitch_mods) for row, pitch_mods
+                                  in store.exact_pitches.items()}
+            return array('I', rows)
+
+        distinct = list(dict.fromkeys(rows))
+        counts = array('H', map(store.pitch_counts.__getitem__, distinct))
+        offsets = array('I', accumulate([len(self.percents)] + counts.tolist()))
+        del offsets[-1]
+        self.codes.extend(map(store.codes.__getitem__, distinct))
+        self.durations.extend(map(store.durations.__getitem__, distinct))
+        self.pitch_offsets.extend(offsets)
+        self.pitch_counts.extend(counts)
+        percents, pitches = self.percents, self.pitches
+        for offset, count in zip(map(store.pitch_offsets.__getitem__, distinct),
+                                 counts):
+            if count:
+                percents += store.percents[offset:offset + count]
+                pitches += store.pitches[offset:offset + count]
+
+        new_rows = range(first_row, first_row + len(distinct))
+        if (len(distinct) == len(rows) and not store.exact_durations
+                and not store.exact_pitches):
+            return array('I', new_rows)
+        new_rows = dict(zip(distinct, new_rows))
+        for row, duration in store.exact_durations.items():
+            if row in new_rows:
+                self.exact_durations[new_rows[row]] = duration
+        for row, pitch_mods in store.exact_pitches.items():
+            if row in new_rows:
+                self.exact_pitches[new_rows[row]] = list(pitch_mods)
+        return array('I', map(new_rows.__getitem__, rows))
+
+    def name(self, row: int) -> str:
+        return _phoneme_names[self.codes[row]]
+
+    def set_name(self, row: int, name: str):
+        self.codes[row] = intern_phoneme(name)
+
+    def duration(self, row: int):
+        if row in self.exact_durations:
+            return self.exact_durations[row]
+        return self.durations[row]
+
+    def set_duration(self, row: int, duration):
+        if _is_compact(duration, 0xFFFFFFFF):
+            self.durations[row] = duration
+            self.exact_durations.pop(row, None)
+        else:
+            self.exact_durations[row] = duration
+
+    def pitch_modifiers(self, row: int) -> List[Tuple[int, int]]:
+        if row in self.exact_pitches:
+            return list(self.exact_pitches[row])
+        offset = self.pitch_offsets[row]
+        end = offset + self.pitch_counts[row]
+        return list(zip(self.percents[offset:end], self.pitches[offset:end]))
+
+    def set_pitch_modifiers(self, row: int, pitch_mods: List[Tuple[int, int]]):
+        pitch_mods = list(pitch_mods)
+        if not all(_is_compact(percent, 0xFFFF) and _is_compact(pitch, 0xFFFF)
+                   for percent, pitch in pitch_mods):
+            self.exact_pitches[row] = list(pitch_mods)
+            self.pitch_counts[row] = 0
+            return
+
+        self.exact_pitches.pop(row, None)
+        count = len(pitch_mods)
+        if count > self.pitch_counts[row]:
+            # the previous points can't be overwritten in place
+            self.pitch_offsets[row] = len(self.percents)
+            self.percents.extend(percent for percent, _ in pitch_mods)
+            self.pitches.extend(pitch for _, pitch in pitch_mods)
+        else:
+            offset = self.pitch_offsets[row]
+            for i, (percent, pitch) in enumerate(pitch_mods, offset):
+                self.percents[i] = percent
+                self.pitches[i] = pitch
+        self.pitch_counts[row] = count
+
+    def pho_line(self, row: int) -> str:
+        if row in self.exact_durations or row in self.exact_pitches:
+            return _pho_line(self.name(row), self.duration(row),
+                             self.pitch_modifiers(row))
+        offset = self.pitch_offsets[row]
+        end = offset + self.pitch_counts[row]
+        return (_phoneme_names[self.codes[row]] + "\t"
+                + str(self.durations[row]) + "\t"
+                + " ".join([str(percent) + " " + str(pitch)
+                            for percent, pitch in zip(self.percents[offset:end],
+                                                      self.pitches[offset:end])]))
+
+    def pho_lines(self, rows: Sequence[int]) -> List[str]:
+        if self.exact_durations or self.exact_pitches:
+            return [self.pho_line(row) for row in rows]
+        if not rows:
+            return []
+        # the pitch points of these rows are formatted in one pass over the
+        # span of the arrays that holds them
+        offsets, counts = self.pitch_offsets, self.pitch_counts
+        start = min([offsets[row] for row in rows])
+        end = max([offsets[row] + counts[row] for row in rows])
+        values = array('H', bytes(4 * (end - start)))
+        values[0::2] = self.percents[start:end]
+        values[1::2] = self.pitches[start:end]
+        numbers = _int_strings(max(values) if values else 0)
+        values = list(map(numbers.__getitem__, values))
+        durations = [self.durations[row] for row in rows]
+        if max(durations) < len(numbers):
+            durations = list(map(numbers.__getitem__, durations))
+        else:
+            durations = list(map(str, durations))
+        names, codes = _phoneme_names, self.codes
+        return [names[codes[row]] + "\t" + duration + "\t"
+                + " ".join(values[2 * (offsets[row] - start):
+                                  2 * (offsets[row] - start + counts[row])])
+                for row, duration in zip(rows, durations)]
+
+    def extend_pho_lines(self, lines: Iterable[str]) -> range:
+        """Appends a row for each non-empty line of a .pho file. The numbers
+        of all the lines are converted in bulk, straight into the arrays.
+        Returns the range of the new rows."""
+        first_row = len(self.codes)
+        names, durations, counts, points = [], [], [], []
+        for line in lines:
+            tokens = line.split()
+            if tokens:
+                names.append(tokens[0])
+                durations.append(tokens[1])
+                count = (len(tokens) - 2) // 2
+                counts.append(count)
+                points += tokens[2:2 + 2 * count]
+        try:
+            new_durations = array('I', map(int, durations))
+            new_percents = array('H', map(int, points[0::2]))
+            new_pitches = array('H', map(int, points[1::2]))
+        except OverflowError:
+            # some values don't fit in the arrays: rows are added one by one
+            point = 0
+            for name, duration, count in zip(names, durations, counts):
+                self.append(name, int(duration),
+                            [(int(percent), int(pitch)) for percent, pitch
+                             in pairwise(points[point:point + 2 * count])])
+                point += 2 * count
+            return range(first_row, len(self.codes))
+
+        offsets = array('I', accumulate([len(self.percents)] + counts))
+        del offsets[-1]
+        self.codes.extend(map(intern_phoneme, names))
+        self.durations.extend(new_durations)
+        self.pitch_offsets.extend(offsets)
+        self.pitch_counts.extend(array('H', counts))
+        self.percents.extend(new_percents)
+        self.pitches.extend(new_pitches)
+        return range(first_row, len(self.codes))
+
+
 class Phoneme:
     """Stores the phonetic data for a single phoneme:
 
     - the name of the phoneme in SAMPA notation (depends on the language)
     - its duration (in milliseconds)
-    - its pitch modifications (as a list of `(percentage, pitch)` tuples)"""
+    - its pitch modifications (as a list of `(percentage, pitch)` tuples)
+
+    The phonemes of a ``PhonemeList`` are lightweight views over its
+    storage: modifying them modifies the list. Two views of the same
+    phoneme are equal (they stand for the same object). A phoneme that isn't
+    part of a list holds its own values, until it's added to one."""
+    __slots__ = ('_store', '_row', '_name', '_duration', '_pitch_mods')
 
     def __init__(self, name: str, duration: int, pitch_mods: List[Tuple[int, int]] = None):
-        self.name = name
-        self.duration = duration
-        self.pitch_modifiers = pitch_mods if pitch_mods is not None else []
+        self._store = None
+        self._row = 0
+        self._name = name
+        self._duration = duration
+        self._pitch_mods = list(pitch_mods) if pitch_mods is not None else []
+
+    @classmethod
+    def _view(cls, store: _PhonemeStore, row: int) -> 'Phoneme':
+        phoneme = cls.__new__(cls)
+        phoneme._store = store
+        phoneme._row = row
+        return phoneme
+
+    def _bind(self, store: _PhonemeStore, row: int):
+        """Turns a standalone phoneme into a view over the row it was
+        copied to"""
+        self._store, self._row = store, row
+        del self._name, self._duration, self._pitch_mods
+
+    @property
+    def name(self) -> str:
+        store = self._store
+        if store is None:
+            return self._name
+        return _phoneme_names[store.codes[self._row]]
+
+    @name.setter
+    def name(self, name: str):
+        if self._store is None:
+            self._name = name
+        else:
+            self._store.set_name(self._row, name)
+
+    @property
+    def duration(self) -> int:
+        store = self._store
+        if store is None:
+            return self._duration
+        if store.exact_durations and self._row in store.exact_durations:
+            return store.exact_durations[self._row]
+        return store.durations[self._row]
+
+    @duration.setter
+    def duration(self, duration: int):
+        if self._store is None:
+            self._duration = duration
+        else:
+            self._store.set_duration(self._row, duration)
+
+    def __eq__(self, other):
+        if not isinstance(other, Phoneme):
+            return NotImplemented
+        if self._store is None or other._store is None:
+            return self is other
+        return self._store is other._store and self._row == other._row
+
+    def __hash__(self):
+        if self._store is None:
+            return hash(id(self))
+        return hash((id(self._store), self._row))
+
+    def _pitch_list(self) -> List[Tuple[int, int]]:
+        if self._store is None:
+            return list(self._pitch_mods)
+        return self._store.pitch_modifiers(self._row)
+
+    @property
+    def pitch_modifiers(self) -> 'PitchModifiers':
+        return PitchModifiers(self)
+
+    @pitch_modifiers.setter
+    def pitch_modifiers(self, pitch_mods: List[Tuple[int, int]]):
+        if self._store is None:
+            self._pitch_mods = list(pitch_mods)
+        else:
+            self._store.set_pitch_modifiers(self._row, pitch_mods)
 
     def __str__(self):
-        return self.name + "\t" \
-               + str(self.duration) + "\t" \
-               + " ".join([str(percent) + " " + str(pitch) for percent, pitch in self.pitch_modifiers])
+        if self._store is None:
+            return _pho_line(self._name, self._duration, self._pitch_mods)
+        return self._store.pho_line(self._row)
 
     @classmethod
     def from_str(cls, pho_str):
@@ -41,14 +415,66 @@ class Phoneme:
         self.pitch_modifiers = [(i * segment_length, pitch) for i, pitch in enumerate(pitch_list)]
 
 
+class PitchModifiers(MutableSequence):
+    """The ``(percentage, pitch)`` pitch modifiers of a phoneme, as a list
+    whose modifications are written back to the phoneme"""
+    __slots__ = ('_phoneme',)
+
+    def __init__(self, phoneme: Phoneme):
+        self._phoneme = phoneme
+
+    def _list(self) -> List[Tuple[int, int]]:
+        return self._phoneme._pitch_list()
+
+    def _modify(self, method: str, *args):
+        pitch_mods = self._list()
+        getattr(pitch_mods, method)(*args)
+        self._phoneme.pitch_modifiers = pitch_mods
+
+    def __len__(self) -> int:
+        return len(self._list())
+
+    def __getitem__(self, index):
+        return self._list()[index]
+
+    def __setitem__(self, index, value):
+        self._modify("__setitem__", index, value)
+
+    def __delitem__(self, index):
+        self._modify("__delitem__", index)
+
+    def insert(self, index, value: Tuple[int, int]):
+        self._modify("insert", index, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (PitchModifiers, list, tuple)):
+            return self._list() == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self._list())
+
+
 class PhonemeList(MutableSequence):
-    """A list of phonemes. Can be printed into a .pho string formatted file"""
+    """A list of phonemes. Can be printed into a .pho string formatted file.
+
+    The phonemes are stored column-wise in compact arrays (name codes,
+    durations and pitch points), the ``Phoneme`` objects it returns being
+    views over these arrays.
+
+    A list made of the phonemes of another list (a slice of it, or the list
+    concatenated to itself) shares its storage: its phonemes are the same
+    objects, as in a list of objects. The phonemes of an unrelated list are
+    copied into this one's storage, in bulk when a whole ``PhonemeList``
+    is added."""
 
     def __init__(self, blocks: Union[Phoneme, Iterable[Phoneme]]):
+        self._store = _PhonemeStore()
+        self._rows = array('I')
         if isinstance(blocks, Phoneme):
-            self._pho_list = [blocks]
+            self.append(blocks)
         elif isinstance(blocks, Iterable):
-            self._pho_list = list(blocks)
+            self.extend(blocks)
         else:
             raise ValueError(f"Expecting a list of blocks or a phonemes, "
                              f"got {str(type(blocks))}")
@@ -57,65 +483,335 @@ class PhonemeList(MutableSequence):
     def from_pho_str(cls, pho_str_list: str):
         """Build a ``PhonemeList`` from a string corresponding to a .pho file typically
         produced by Espeak."""
-        return cls([Phoneme.from_str(pho_str)
-                    for pho_str in pho_str_list.split("\n") if pho_str.strip()])
+        phonemes = cls([])
+        phonemes._rows.extend(
+            phonemes._store.extend_pho_lines(pho_str_list.split("\n")))
+        return phonemes
+
+    @classmethod
+    def from_pho_bytes(cls, pho_bytes: Union[bytes, bytearray, memoryview]):
+        """Build a ``PhonemeList`` from the utf-8 encoded content of
+        a .pho file"""
+        return cls.from_pho_str(str(pho_bytes, "utf-8"))
+
+    @classmethod
+    def from_pho_file(cls, pho_file: Union[str, Path, IO],
+                      batch_size: int = 65536):
+        """Build a ``PhonemeList`` from a .pho file, given as a path or as a
+        text or binary file object. The file is parsed ``batch_size`` lines
+        at a time, so it's never held in memory as a whole."""
+        if isinstance(pho_file, (str, Path)):
+            with open(str(pho_file), encoding="utf-8") as opened_file:
+                return cls.from_pho_file(opened_file, batch_size)
+
+        phonemes = cls([])
+        for lines in _line_batches(pho_file, batch_size):
+            phonemes._rows.extend(phonemes._store.extend_pho_lines(lines))
+        return phonemes
+
+    def write_pho(self, pho_file: IO, batch_size: int = 65536):
+        """Writes the ``PhonemeList`` as a .pho file (the same content as
+        ``str()``) to a text or binary file object, ``batch_size``
+        phonemes at a time."""
+        binary = not isinstance(pho_file, io.TextIOBase)
+        for start in range(0, len(self._rows), batch_size):
+            chunk = "\n".join(self._store.pho_lines(
+                self._rows[start:start + batch_size]))
+            if start:
+                chunk = "\n" + chunk
+            pho_file.write(chunk.encode("utf-8") if binary else chunk)
+
+    def to_pho_bytes(self) -> bytes:
+        """Output the ``PhonemeList`` as an utf-8 encoded .pho file"""
+        buffer = io.BytesIO()
+        self.write_pho(buffer)
+        return buffer.getvalue()
+
+    def _share(self, store: _PhonemeStore) -> bool:
+        """Whether phonemes of ``store`` can be added as they are, an empty
+        list taking the storage of the first phonemes it's given"""
+        if store is not self._store and not self._rows:
+            self._store = store
+        return store is self._store
+
+    def _add_row(self, value: Phoneme) -> int:
+        assert isinstance(value, Phoneme)
+        store = value._store
+        if store is None:
+            # a standalone phoneme becomes a view over the list's storage,
+            # as it would be the same object in a list of objects
+            row = self._store.append(value._name, value._duration,
+                                     value._pitch_mods)
+            value._bind(self._store, row)
+            return row
+        if self._share(store):
+            return value._row
+        return self._store.append_from(store, value._row)
 
     def __len__(self) -> int:
         """Number of phonemes in ``PhonemeList``"""
-        return len(self._pho_list)
+        return len(self._rows)
 
     def __delitem__(self, index: int):
         """Remove a phoneme at index i in ``PhonemeList``"""
-        del self._pho_list[index]
+        del self._rows[index]
 
     def insert(self, index, value: Phoneme):
         """Insert a phoneme at index i in ``PhonemeList``"""
-        assert isinstance(value, Phoneme)
-        self._pho_list.insert(index, value)
+        self._rows.insert(index, self._add_row(value))
 
     def append(self, value: Phoneme):
         """Append a phoneme to ``PhonemeList``"""
-        assert isinstance(value, Phoneme)
-        self._pho_list.append(value)
+        self._rows.append(self._add_row(value))
+
+    def extend(self, values: Iterable[Phoneme]):
+        """Append phonemes to ``PhonemeList``, those of another
+        ``PhonemeList`` in bulk"""
+        if not isinstance(values, PhonemeList):
+            for value in values:
+                self.append(value)
+        elif self._share(values._store):
+            self._rows.extend(values._rows[:])
+        else:
+            self._rows.extend(self._store.copy_rows(values._store,
+                                                    values._rows))
+
+    def reverse(self):
+        """Reverse the order of the phonemes in place"""
+        self._rows.reverse()
 
     def __setitem__(self, index: int, value: Phoneme):
         """Set phoneme in ``PhonemeList`` at index i"""
-        assert isinstance(value, Phoneme)
-        self._pho_list[index] = value
+        self._rows[index] = self._add_row(value)
 
     def __getitem__(self, index: int) -> Phoneme:
         """Get phoneme in ``PhonemeList``"""
-        return self._pho_list[index]
+        if isinstance(index, slice):
+            return [Phoneme._view(self._store, row)
+                    for row in self._rows[index]]
+        return Phoneme._view(self._store, self._rows[index])
 
     def __iter__(self) -> Iterable[Phoneme]:
         """Iterate over ``PhonemeList``"""
-        return iter(self._pho_list)
+        # the views are built inline, most loops over a list going through here
+        store, new = self._store, Phoneme.__new__
+        for row in self._rows:
+            phoneme = new(Phoneme)
+            phoneme._store = store
+            phoneme._row = row
+            yield phoneme
 
     def __add__(self, other: 'PhonemeList'):
         """Concatenate two ``PhonemeList``"""
         assert self.__class__ == other.__class__
-        return PhonemeList(list(self._pho_list) + list(other._pho_list))
+        phonemes = self.__class__([])
+        if self._store is other._store:
+            phonemes._store = self._store
+            phonemes._rows = self._rows + other._rows
+        else:
+            # both are copied, in bulk, to a storage of their own
+            phonemes._rows = phonemes._store.copy_rows(self._store, self._rows)
+            phonemes._rows.extend(phonemes._store.copy_rows(other._store,
+                                                            other._rows))
+        return phonemes
 
     def __str__(self):
-        return "\n".join([str(phoneme) for phoneme in self])
+        return "\n".join(self._store.pho_lines(self._rows))
+
+    def classify(self, lang: Union[str, Type['AbstractPhonemeGroup']]) -> array:
+        """Returns the class bits (see the phoneme group's ``CLASS_BITS``) of
+        each phoneme, for a language code or a phoneme group. Pauses get no
+        bits, and phonemes that aren't part of the group get -1."""
+        group = LANG_PHONEMES[lang] if isinstance(lang, str) else lang
+        code_masks = group.code_masks()
+        codes = self._store.codes
+        return array('q', [code_masks[codes[row]] for row in self._rows])
+
+    def validate(self, lang: Union[str, Type['AbstractPhonemeGroup']]) -> List[int]:
+        """Returns the positions of the phonemes that aren't part of the
+        language's phoneme group (an empty list if they all are)"""
+        return [index for index, mask in enumerate(self.classify(lang))
+                if mask < 0]
+
+    def durations(self) -> List[Union[int, float]]:
+        """The duration of each phoneme, in milliseconds"""
+        store = self._store
+        if store.exact_durations:
+            return [store.duration(row) for row in self._rows]
+        return list(map(store.durations.__getitem__, self._rows))
+
+    def names(self) -> List[str]:
+        """The name of each phoneme"""
+        return list(map(_phoneme_names.__getitem__,
+                        map(self._store.codes.__getitem__, self._rows)))
 
     @property
     def phonemes_str(self):
         """Output the ``PhonemeList`` as a .pho compatible string."""
-        return "".join([str(phoneme.name) for phoneme in self])
+        codes = self._store.codes
+        return "".join([_phoneme_names[codes[row]] for row in self._rows])
+
+    def copy(self) -> 'PhonemeList':
+        """Returns an independent copy of the ``PhonemeList``, whose storage
+        only holds its phonemes"""
+        phonemes = self.__class__([])
+        phonemes._rows = phonemes._store.copy_rows(self._store, self._rows)
+        return phonemes
+
+    # Prosody transforms, done in place with NumPy over the whole list
+
+    def _selected_rows(self, group: Iterable[str] = None):
+        """Rows of the phonemes whose name is in ``group`` (all of them if
+        it's ``None``), in list order"""
+        np = _numpy()
+        rows = np.frombuffer(self._rows, dtype=np.uint32)
+        if group is None:
+            return rows
+        group_codes = [_phoneme_codes[name] for name in group
+                       if name in _phoneme_codes]
+        codes = np.frombuffer(self._store.codes, dtype=np.uint32)
+        return rows[np.isin(codes[rows], group_codes)]
+
+    def _pitch_points(self, rows):
+        """Indexes, in the flat pitch arrays, of the pitch points of ``rows``"""
+        np = _numpy()
+        store = self._store
+        offsets = np.frombuffer(store.pitch_offsets, dtype=np.uint32)[rows]
+        counts = np.frombuffer(store.pitch_counts, dtype=np.uint16)[rows]
+        counts = counts.astype(np.int64)
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        return (np.repeat(offsets.astype(np.int64), counts)
+                + np.arange(counts.sum()) - starts)
+
+    def _map_durations(self, func, group: Iterable[str] = None):
+        np = _numpy()
+        store = self._store
+        rows = self._selected_rows(group)
+        exact_rows = [row for row in rows.tolist()
+                      if row in store.exact_durations]
+        durations = np.frombuffer(store.durations, dtype=np.uint32)
+        new_durations = np.rint(func(durations[rows].astype(np.float64)))
+        durations[rows] = np.clip(new_durations, 0, 0xFFFFFFFF)
+        for row in exact_rows:
+            store.exact_durations[row] = func(store.exact_durations[row])
+
+    def _map_pitches(self, func, group: Iterable[str] = None):
+        np = _numpy()
+        store = self._store
+        rows = self._selected_rows(group)
+        pitches = np.frombuffer(store.pitches, dtype=np.uint16)
+        points = self._pitch_points(rows)
+        pitches[points] = np.clip(
+            np.rint(func(pitches[points].astype(np.float64))), 0, 0xFFFF)
+        for row in rows.tolist():
+            if row in store.exact_pitches:
+                store.exact_pitches[row] = [
+                    (percent, func(pitch))
+                    for percent, pitch in store.exact_pitches[row]]
+
+    def scale_durations(self, factor: float, group: Iterable[str] = None):
+        """Multiplies the duration of the phonemes by ``factor``. If a
+        ``group`` of phoneme names is given (e.g., ``FrenchPhonemes.VOWELS``),
+        only these phonemes are stretched."""
+        self._map_durations(lambda durations: durations * factor, group)
+
+    def set_durations(self, duration: int, group: Iterable[str] = None):
+        """Sets the duration of the phonemes (or of the phonemes in
+        ``group``) to ``duration``"""
+        self._map_durations(lambda durations: durations * 0 + duration, group)
+
+    def shift_pitch(self, shift: float, group: Iterable[str] = None):
+        """Adds ``shift`` (in Hz) to all the pitch points of the phonemes (or
+        of the phonemes in ``group``)"""
+        self._map_pitches(lambda pitches: pitches + shift, group)
+
+    def scale_pitch(self, factor: float, group: Iterable[str] = None):
+        """Multiplies all the pitch points of the phonemes (or of the
+        phonemes in ``group``) by ``factor``"""
+        self._map_pitches(lambda pitches: pitches * factor, group)
+
+    def fit_pitch_contour(self, contour: Sequence[float],
+                          times: Sequence[float] = None):
+        """Sets every pitch point to the value of the ``contour`` (a list of
+        frequencies) at the time of that point. The contour's values are
+        spread evenly over the utterance, unless their ``times`` (in
+        milliseconds from the start of the utterance) are given."""
+        np = _numpy()
+        store = self._store
+        if any(row in store.exact_durations or row in store.exact_pitches
+               for row in self._rows):
+            raise ValueError("Can't fit a contour over non-integer durations "
+                             "or pitch points")
+        rows = self._selected_rows()
+        durations = np.frombuffer(store.durations,
+                                  dtype=np.uint32)[rows].astype(np.float64)
+        starts = np.cumsum(durations) - durations
+        counts = np.frombuffer(store.pitch_counts, dtype=np.uint16)[rows]
+        points = self._pitch_points(rows)
+        percents = np.frombuffer(store.percents, dtype=np.uint16)[points]
+        point_times = (np.repeat(starts, counts)
+                       + np.repeat(durations, counts) * percents / 100)
+        contour = np.asarray(contour, dtype=np.float64)
+        if times is None:
+            times = np.linspace(0, durations.sum(), len(contour))
+        pitches = np.frombuffer(store.pitches, dtype=np.uint16)
+        pitches[points] = np.clip(
+            np.rint(np.interp(point_times, times, contour)), 0, 0xFFFF)
 
 
 class PhonemeGroupMeta(type):
+    """Builds, once per phoneme group, the frozen lookup tables used to
+    check and classify phoneme names: ``CLASS_BITS`` maps each class of the
+    group (its upper case set attributes, e.g. ``VOWELS``) to a bit, and
+    ``MASKS`` maps each phoneme of the group to the bits of its classes."""
+
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        cls._all_names = frozenset(cls._all | cls.STRESSES)
+        class_names = sorted(
+            attribute for attribute in dir(cls)
+            if attribute.isupper() and attribute != "STRESSES"
+            and isinstance(getattr(cls, attribute), (set, frozenset)))
+        cls.CLASS_BITS = MappingProxyType(
+            {class_name: 1 << bit for bit, class_name in enumerate(class_names)})
+        cls.MASKS = MappingProxyType(
+            {phoneme: sum(bit for class_name, bit in cls.CLASS_BITS.items()
+                          if phoneme in getattr(cls, class_name))
+             for phoneme in cls._all})
+        cls._stress_table = str.maketrans("", "", "".join(cls.STRESSES))
+        # masks of the interned phoneme codes, filled as new codes show up
+        cls._code_masks = array('q')
 
     @property
-    def all(cls):
-        return cls._all | cls.STRESSES
+    def all(cls) -> FrozenSet[str]:
+        return cls._all_names
 
     def __contains__(self, item):
-        return item in self.all
+        return item in self._all_names
 
     def __iter__(self):
-        return iter(self.all)
+        return iter(self._all_names)
+
+    def mask(cls, name: str) -> int:
+        """Class bits of a phoneme name, once stripped of its stress marks
+        if it isn't in the group as is: 0 for a pause or a lone stress
+        mark, -1 if the phoneme isn't part of the group"""
+        if name in cls.MASKS:
+            return cls.MASKS[name]
+        stripped = name.translate(cls._stress_table)
+        if stripped in cls.MASKS:
+            return cls.MASKS[stripped]
+        return 0 if stripped in ("", PAUSE) else -1
+
+    def code_masks(cls) -> array:
+        """The masks of all the interned phoneme codes, indexed by code"""
+        code_masks = cls._code_masks
+        if len(code_masks) < len(_phoneme_names):
+            with _interning_lock:
+                code_masks.extend(
+                    cls.mask(name)
+                    for name in _phoneme_names[len(code_masks):])
+        return code_masks
 
 
 class AbstractPhonemeGroup(metaclass=PhonemeGroupMeta):
@@ -123,11 +819,11 @@ class AbstractPhonemeGroup(metaclass=PhonemeGroupMeta):
     _all = set()
 
     @property
-    def all(self):
-        return self._all | self.STRESSES
+    def all(self) -> FrozenSet[str]:
+        return self._all_names
 
     def __contains__(self, item):
-        return item in self.all
+        return item in self._all_names
 
     def __iter__(self):
         return iter(self._all)
@@ -218,7 +914,7 @@ class GermanPhonemes(AbstractPhonemeGroup):
     _all = VOWELS | SCHWA | CENTRING_DIPHTONGS | CONSONANTS
 
 
-class ItalianPhonemes:
+class ItalianPhonemes(AbstractPhonemeGroup):
     SINGLE_PLOSIVES = {'p', 'b', 't', 'd', 'k', 'g'}
     GEMINATE_PLOSIVES = {'pp', 'bb', 'tt', 'dd', 'kk', 'gg'}
     PLOSIVES = SINGLE_PLOSIVES | GEMINATE_PLOSIVES
@@ -264,3 +960,15 @@ class ArabicPhonemes(AbstractPhonemeGroup):
     CONSONANTS = PLOSIVES | FRICATIVES | NASALS | TRILL | LATERAL | SEMIVOWELS
     VOWELS = {"i", "a", "u", "i:", "a:", "u:"}
     _all = VOWELS | CONSONANTS
+
+
+LANG_PHONEMES: Dict[str, Type[AbstractPhonemeGroup]] = {
+    "fr": FrenchPhonemes,
+    "en": BritishEnglishPhonemes,
+    "us": AmericanEnglishPhonemes,
+    "es": SpanishPhonemes,
+    "pt": PortuguesePhonemes,
+    "de": GermanPhonemes,
+    "it": ItalianPhonemes,
+    "gr": GreekPhonemes,
+    "ar": ArabicPhonemes}
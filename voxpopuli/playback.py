@@ -0,0 +1,465 @@
+"""Real-time playback of rendered speech: a persistent engine playing queued
+utterances through a ring buffer, as their audio is being synthesized"""
+import queue
+import threading
+import time
+from collections import deque
+from struct import unpack
+from typing import Callable, Deque, Iterable, Iterator, NamedTuple, \
+    Optional, Tuple, Union
+
+from .conversion import WAV_HEADER_SIZE, set_wav_sizes, wav_header, \
+    wav_header_size
+
+# a sink's pull function: takes a number of bytes and a timeout (0 to not
+# wait at all), and returns at most that many bytes of audio
+Pull = Callable[[int, float], bytes]
+
+
+class WaveFormat(NamedTuple):
+    """The format of the frames of a wave file"""
+    format_code: int
+    channels: int
+    sample_rate: int
+    sample_width: int
+
+    @classmethod
+    def from_header(cls, header: bytes) -> 'WaveFormat':
+        format_code, channels, sample_rate = unpack('<HHI', header[20:28])
+        sample_width = unpack('<H', header[34:36])[0] // 8
+        return cls(format_code, channels, sample_rate, sample_width)
+
+    @property
+    def block_size(self) -> int:
+        return self.channels * self.sample_width
+
+    def header(self) -> bytes:
+        return wav_header(self.format_code, self.channels, self.sample_rate,
+                          self.sample_width)
+
+
+class RingBuffer:
+    """A fixed size FIFO of bytes between a writer thread, which blocks while
+    it's full, and a reader, which can choose not to wait for data. It also
+    counts the bytes that went through it, so that positions in the stream
+    can be tracked."""
+
+    def __init__(self, capacity: int):
+        self._data = bytearray(capacity)
+        self._start = 0
+        self.size = 0
+        self.written = 0
+        self.read_total = 0
+        self._condition = threading.Condition()
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def write(self, data: bytes,
+              should_stop: Callable[[], bool] = lambda: False) -> int:
+        """Writes all of ``data``, waiting for room as needed, unless
+        ``should_stop`` returns ``True``. Returns the written size."""
+        view = memoryview(data).cast('B')
+        written = 0
+        with self._condition:
+            while written < len(view):
+                while self.size == self.capacity and not should_stop():
+                    self._condition.wait(0.05)
+                if should_stop():
+                    break
+                end = (self._start + self.size) % self.capacity
+                length = min(len(view) - written, self.capacity - self.size,
+                             self.capacity - end)
+                self._data[end:end + length] = view[written:written + length]
+                self.size += length
+                self.written += length
+                written += length
+                self._condition.notify_all()
+        return written
+
+    def read(self, size: int, timeout: float = 0) -> bytes:
+        """Reads at most ``size`` bytes, waiting at most ``timeout`` seconds
+        for some data if there isn't any"""
+        with self._condition:
+            if not self.size and timeout:
+                self._condition.wait(timeout)
+            length = min(size, self.size)
+            first = min(length, self.capacity - self._start)
+            data = (bytes(self._data[self._start:self._start + first])
+                    + bytes(self._data[:length - first]))
+            self._start = (self._start + length) % self.capacity
+            self.size -= length
+            self.read_total += length
+            self._condition.notify_all()
+            return data
+
+    def clear(self):
+        """Drops the buffered data"""
+        with self._condition:
+            self.read_total += self.size
+            self._start, self.size = 0, 0
+            self._condition.notify_all()
+
+    def wait_empty(self, should_stop: Callable[[], bool] = lambda: False):
+        with self._condition:
+            while self.size and not should_stop():
+                self._condition.wait(0.05)
+
+
+class Sink:
+    """Where the engine's audio goes. ``open`` starts pulling frames of the
+    given format, ``close`` stops it, and ``terminate`` releases the
+    sink for good."""
+
+    def open(self, wave_format: WaveFormat, pull: Pull):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        self.close()
+
+
+class PyAudioSink(Sink):
+    """Plays the audio on the sound card, through a PyAudio stream in
+    callback mode. PyAudio is only initialized once, and a stream is only
+    reopened when the format of the audio changes."""
+
+    def __init__(self, frames_per_buffer: int = 1024):
+        import pyaudio
+        self._pyaudio_module = pyaudio
+        self._pyaudio = pyaudio.PyAudio()
+        self.frames_per_buffer = frames_per_buffer
+        self._stream = None
+
+    def open(self, wave_format: WaveFormat, pull: Pull):
+        pyaudio = self._pyaudio_module
+        if wave_format.format_code == 3:
+            sample_format = pyaudio.paFloat32
+        elif wave_format.format_code == 1:
+            sample_format = self._pyaudio.get_format_from_width(
+                wave_format.sample_width)
+        else:
+            raise ValueError("Can't play companded (mu-law or A-law) audio")
+        block_size = wave_format.block_size
+
+        def callback(in_data, frame_count, time_info, status):
+            size = frame_count * block_size
+            data = pull(size, 0)
+            # the sound card can't wait: an underflow is played as silence
+            return data + bytes(size - len(data)), pyaudio.paContinue
+
+        self._stream = self._pyaudio.open(
+            format=sample_format, channels=wave_format.channels,
+            rate=wave_format.sample_rate, output=True,
+            frames_per_buffer=self.frames_per_buffer,
+            stream_callback=callback)
+        self._stream.start_stream()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+    def terminate(self):
+        self.close()
+        self._pyaudio.terminate()
+
+
+class NullSink(Sink):
+    """Consumes the audio without playing it, in real time if ``realtime``
+    is set, else as fast as possible. ``played`` counts the consumed
+    bytes."""
+
+    chunk_duration = 0.02
+
+    def __init__(self, realtime: bool = False):
+        self.realtime = realtime
+        self.played = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def _consume(self, data: bytes):
+        self.played += len(data)
+
+    def _run(self, wave_format: WaveFormat, pull: Pull):
+        chunk_frames = max(int(wave_format.sample_rate * self.chunk_duration),
+                           1)
+        chunk_size = chunk_frames * wave_format.block_size
+        while not self._stopped.is_set():
+            data = pull(chunk_size, 0.05)
+            if data:
+                self._consume(data)
+                if self.realtime:
+                    time.sleep(len(data) / wave_format.block_size
+                               / wave_format.sample_rate)
+
+    def open(self, wave_format: WaveFormat, pull: Pull):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        args=(wave_format, pull))
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+
+class FileSink(NullSink):
+    """Writes the consumed audio to a wave file, whose header sizes are set
+    when the sink is terminated. All the audio must have the same format."""
+
+    def __init__(self, filename, realtime: bool = False):
+        super().__init__(realtime)
+        self.filename = filename
+        self._file = None
+        self._format: Optional[WaveFormat] = None
+
+    def _consume(self, data: bytes):
+        super()._consume(data)
+        self._file.write(data)
+
+    def open(self, wave_format: WaveFormat, pull: Pull):
+        if self._file is None:
+            self._file = open(self.filename, "wb")
+            self._file.write(wave_format.header())
+            self._format = wave_format
+        elif wave_format != self._format:
+            raise ValueError("All the audio written to a file must have "
+                             "the same format")
+        super().open(wave_format, pull)
+
+    def terminate(self):
+        self.close()
+        if self._file is not None:
+            size = self._file.tell()
+            header = bytearray(self._format.header())
+            set_wav_sizes(header, size)
+            self._file.seek(0)
+            self._file.write(header)
+            self._file.close()
+            self._file = None
+
+
+class Utterance:
+    """A queued piece of audio. ``wait`` blocks until it's been played (or
+    interrupted), and raises the error that stopped its synthesis, if any."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = chunks
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        finished = self._done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return finished
+
+
+class PlaybackEngine:
+    """Plays queued utterances one after the other through a ``Sink``
+    (defaults to the sound card, via PyAudio). A thread pulls the wave
+    chunks of each utterance into a ring buffer of ``buffer_seconds`` of
+    audio, from which the sink plays, so that playback starts with the first
+    chunks of a streamed synthesis and keeps going while the next ones
+    (and the next utterances) are being rendered."""
+
+    def __init__(self, sink: Sink = None, buffer_seconds: float = 2.):
+        self.sink = sink if sink is not None else PyAudioSink()
+        self.buffer_seconds = buffer_seconds
+        self._buffer: Optional[RingBuffer] = None
+        self._format: Optional[WaveFormat] = None
+        self._queue: "queue.Queue[Optional[Utterance]]" = queue.Queue()
+        # utterances whose audio is (at least partly) in the buffer, with
+        # the stream position at which they end (None while being fed)
+        self._playing: Deque[Tuple[Utterance, Optional[int]]] = deque()
+        self._feeding: Optional[Utterance] = None
+        self._pending = 0
+        self._lock = threading.Condition()
+        self._closed = False
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+    def _pull(self, size: int, timeout: float) -> bytes:
+        data = self._buffer.read(size, timeout)
+        if data:
+            self._complete()
+        return data
+
+    def _complete(self):
+        """Marks the utterances whose audio has all been read as done"""
+        with self._lock:
+            while self._playing:
+                utterance, end = self._playing[0]
+                if end is None or end > self._buffer.read_total:
+                    break
+                self._playing.popleft()
+                self._finish(utterance)
+
+    def _finish(self, utterance: Utterance):
+        # called with the lock held
+        utterance._done.set()
+        self._pending -= 1
+        self._lock.notify_all()
+
+    def _switch_format(self, wave_format: WaveFormat,
+                       utterance: Utterance):
+        """(Re)opens the sink for another audio format, once the audio of
+        the previous format has been played"""
+        if self._buffer is not None:
+            self._buffer.wait_empty(lambda: utterance.cancelled)
+            self._complete()
+        self.sink.close()
+        # if the sink can't be opened, the next utterance reopens it
+        self._format = None
+        capacity = int(self.buffer_seconds * wave_format.sample_rate)
+        self._buffer = RingBuffer(max(capacity, 1) * wave_format.block_size)
+        self.sink.open(wave_format, self._pull)
+        self._format = wave_format
+
+    def _play(self, utterance: Utterance):
+        chunks = iter(utterance.chunks)
+        try:
+            header = b''
+            for chunk in chunks:
+                header += chunk
+                if utterance.cancelled or (
+                        len(header) >= WAV_HEADER_SIZE
+                        and len(header) >= wav_header_size(header)):
+                    break
+            if (utterance.cancelled or len(header) < WAV_HEADER_SIZE
+                    or len(header) < wav_header_size(header)):
+                return
+            wave_format = WaveFormat.from_header(header)
+            if wave_format != self._format:
+                self._switch_format(wave_format, utterance)
+            with self._lock:
+                self._playing.append((utterance, None))
+            self._buffer.write(header[wav_header_size(header):],
+                               lambda: utterance.cancelled)
+            for chunk in chunks:
+                if utterance.cancelled:
+                    break
+                self._buffer.write(chunk, lambda: utterance.cancelled)
+        finally:
+            # stops the synthesis if the utterance was interrupted
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+    def _feed(self):
+        while True:
+            utterance = self._queue.get()
+            if utterance is None:
+                break
+            with self._lock:
+                if utterance.cancelled:
+                    self._finish(utterance)
+                    continue
+                self._feeding = utterance
+            try:
+                self._play(utterance)
+            except BaseException as error:
+                # the utterance fails, the engine goes on with the next ones
+                utterance.error = error
+            if utterance.cancelled and self._buffer is not None:
+                # drops what was written after the interruption
+                self._buffer.clear()
+            with self._lock:
+                self._feeding = None
+                for index, (playing, end) in enumerate(self._playing):
+                    if playing is utterance:
+                        self._playing[index] = (utterance,
+                                                self._buffer.written)
+                        break
+                else:
+                    # nothing of it made it to the buffer
+                    self._finish(utterance)
+            self._complete()
+
+    def play(self, chunks: Union[bytes, Iterable[bytes]]) -> Utterance:
+        """Queues a wave file, given whole or as an iterable of chunks, and
+        returns its ``Utterance`` without waiting for it to be played"""
+        if isinstance(chunks, (bytes, bytearray, memoryview)):
+            chunks = [bytes(chunks)]
+        utterance = Utterance(chunks)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The playback engine is closed")
+            self._pending += 1
+        self._queue.put(utterance)
+        return utterance
+
+    def say_async(self, voice, speech, chunk_size: int = 4096) -> Utterance:
+        """Queues the streamed rendering of a str or a ``PhonemeList`` by
+        a voice, which only starts when the previous utterances have
+        been rendered"""
+        return self.play(voice.stream_audio(speech, chunk_size))
+
+    def say(self, voice, speech, chunk_size: int = 4096):
+        """Renders and plays a str or a ``PhonemeList``, returning once it's
+        been played"""
+        self.say_async(voice, speech, chunk_size).wait()
+
+    def interrupt(self):
+        """Stops the audio being played and synthesized right now; the
+        queued utterances are played next"""
+        with self._lock:
+            interrupted = [utterance for utterance, _ in self._playing]
+            if self._feeding is not None:
+                interrupted.append(self._feeding)
+            for utterance in interrupted:
+                utterance.cancelled = True
+            # the feeder marks the utterance it's feeding as done
+            for utterance, end in list(self._playing):
+                if end is not None:
+                    self._playing.remove((utterance, end))
+                    self._finish(utterance)
+        if self._buffer is not None:
+            self._buffer.clear()
+
+    def flush(self):
+        """Drops all the queued utterances, and interrupts the current one"""
+        with self._lock:
+            while True:
+                try:
+                    utterance = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if utterance is None:
+                    # keeps the closing request
+                    self._queue.put(None)
+                    break
+                utterance.cancelled = True
+                self._finish(utterance)
+        self.interrupt()
+
+    def drain(self, timeout: float = None) -> bool:
+        """Waits until all the queued utterances have been played"""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self):
+        """Stops the playback and releases the sink"""
+        with self._lock:
+            self._closed = True
+        self.flush()
+        self._queue.put(None)
+        self._feeder.join()
+        self.sink.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
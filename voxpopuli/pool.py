@@ -0,0 +1,162 @@
+"""A pool of warm espeak and mbrola processes, started ahead of the calls
+that will use them"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from subprocess import PIPE, CompletedProcess, Popen, TimeoutExpired
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+
+
+class ProcessPool:
+    """Keeps standby espeak and mbrola processes, already started and blocked
+    on their stdin, for each command line that has been run through the pool.
+
+    Since the command line of a voice holds all of its parameters (language,
+    voice id, speed, pitch, volume), there is one set of warm workers for
+    each voice configuration. Mbrola loads its diphone database before
+    reading any phoneme, so a call only pays for feeding its input and reading
+    the output: the process startup and the database loading of the
+    replacement worker happen while the current one is working.
+
+    Workers are kept for the ``max_commands`` most recently run command
+    lines: the workers of the others are killed. Workers that died while
+    waiting are replaced, and a worker killed by a signal during a call is
+    retried once on a fresh process. The latency of each call is recorded
+    per stage (``"espeak"`` or ``"mbrola"``)."""
+
+    def __init__(self, size: int = 1, latency_window: int = 1000,
+                 max_commands: int = 16):
+        if size < 1:
+            raise ValueError("The pool needs at least one worker per voice")
+        self.size = size
+        self.max_commands = max_commands
+        self.restarts = 0
+        self.latencies: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=latency_window))
+        # from the least to the most recently used command line
+        self._standby: "OrderedDict[Tuple[str, ...], Deque[Popen]]" = \
+            OrderedDict()
+        # workers being started for each command line, which aren't on
+        # standby yet
+        self._spawning: Dict[Tuple[str, ...], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _spawn(args: List[str], env: Optional[Mapping[str, str]]) -> Popen:
+        return Popen(args, stdin=PIPE, stdout=PIPE, stderr=PIPE, env=env)
+
+    @staticmethod
+    def _kill(processes: List[Popen]):
+        for process in processes:
+            process.kill()
+            process.communicate()
+
+    def _evict(self) -> List[Popen]:
+        """Removes the workers of the least recently used command lines
+        beyond ``max_commands``, and returns them to be killed (called with
+        the lock held)"""
+        evicted = []
+        while len(self._standby) > self.max_commands:
+            _, standby = self._standby.popitem(last=False)
+            evicted.extend(standby)
+        return evicted
+
+    def _acquire(self, args: List[str],
+                 env: Optional[Mapping[str, str]]) -> Popen:
+        with self._lock:
+            standby = self._standby.get(tuple(args), ())
+            while standby:
+                process = standby.popleft()
+                if process.poll() is None:
+                    return process
+                # the worker died while waiting for an input
+                self.restarts += 1
+                logging.debug("Replacing dead worker %s" % " ".join(args))
+        return self._spawn(args, env)
+
+    def _refill(self, args: List[str], env: Optional[Mapping[str, str]]):
+        key = tuple(args)
+        with self._lock:
+            standby = self._standby.setdefault(key, deque())
+            self._standby.move_to_end(key)
+            evicted = self._evict()
+            # the workers other calls are starting count as already there
+            missing = self.size - len(standby) - self._spawning[key]
+            self._spawning[key] += max(missing, 0)
+        self._kill(evicted)
+        for _ in range(missing):
+            process = None
+            try:
+                process = self._spawn(args, env)
+            finally:
+                with self._lock:
+                    self._spawning[key] -= 1
+                    if not self._spawning[key]:
+                        del self._spawning[key]
+                    if process is not None and key in self._standby:
+                        self._standby[key].append(process)
+                        process = None
+            if process is not None:
+                # its command line was evicted in the meantime
+                self._kill([process])
+
+    def _record(self, stage: str, start: float):
+        with self._lock:
+            self.latencies[stage].append(time.perf_counter() - start)
+
+    def run(self, args: List[str], input: bytes, stage: str,
+            env: Optional[Mapping[str, str]] = None,
+            timeout: float = None) -> CompletedProcess:
+        """Feeds ``input`` to a warm worker running ``args`` and returns
+        the completed process, like ``subprocess.run``. A worker still
+        running after ``timeout`` seconds is killed, and ``TimeoutExpired``
+        is raised."""
+        start = time.perf_counter()
+        for attempt in range(2):
+            process = self._acquire(args, env)
+            # the replacement starts up while this worker is processing
+            self._refill(args, env)
+            try:
+                stdout, stderr = process.communicate(input, timeout)
+            except BrokenPipeError:
+                process.kill()
+                stdout, stderr = process.communicate()
+            except TimeoutExpired:
+                process.kill()
+                process.communicate()
+                self._record(stage, start)
+                raise
+            if process.returncode is not None and process.returncode >= 0:
+                break
+            with self._lock:
+                self.restarts += 1
+            logging.debug("Worker %s was killed (%d), restarting it"
+                          % (" ".join(args), process.returncode))
+        self._record(stage, start)
+        return CompletedProcess(args, process.returncode, stdout, stderr)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Returns the number of recorded calls and their mean and maximum
+        latency (in seconds) for each stage"""
+        with self._lock:
+            recorded = {stage: list(latencies) for stage, latencies
+                              in self.latencies.items()}
+        return {stage: {"calls": len(latencies),
+                        "mean": sum(latencies) / len(latencies),
+                        "max": max(latencies)}
+                for stage, latencies in recorded.items() if latencies}
+
+    def close(self):
+        """Kills all the standby workers"""
+        with self._lock:
+            standby = [process for processes in self._standby.values()
+                       for process in processes]
+            self._standby.clear()
+        self._kill(standby)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,117 @@
+"""Discovery of the installed mbrola voices and binaries, cached across
+``Voice`` instances"""
+import os
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from shutil import which
+from typing import Dict, List, Optional, Sequence, Tuple
+
+VOICE_FOLDER_NAME = re.compile(r"([a-z]{2})([0-9]+)")
+
+
+@lru_cache(maxsize=None)
+def find_binary(binary: str) -> Optional[str]:
+    """Cached ``shutil.which``"""
+    return which(binary)
+
+
+class VoiceRegistry:
+    """Lists the mbrola voices installed in a sequence of folders, which are
+    searched in order. The folders are scanned once, then only
+    rescanned when the modification time of one of them changes, or
+    when ``refresh`` is called. Voice folders that don't hold their database
+    yet (while it's being installed) are watched as well."""
+
+    def __init__(self, folders: Sequence[str]):
+        self.folders = [Path(folder) for folder in folders]
+        self.version = 0
+        self._voices: Dict[str, Dict[int, Path]] = {}
+        self._mtimes: Optional[Tuple[float, ...]] = None
+        # voice folders without a database, the last time they were scanned
+        self._incomplete: List[Path] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _mtime(folder: Path) -> float:
+        try:
+            return os.stat(str(folder)).st_mtime
+        except OSError:
+            return -1
+
+    def _folder_mtimes(self) -> Tuple[float, ...]:
+        return tuple(map(self._mtime, self.folders + self._incomplete))
+
+    def _scan(self) -> Tuple[Dict[str, Dict[int, Path]],
+                             List[Tuple[Path, float]]]:
+        """Returns the voices found in the folders, and the voice folders
+        that don't hold their database, along with their modification time
+        (taken before looking for the database)"""
+        voices: Dict[str, Dict[int, Path]] = {}
+        incomplete = []
+        # the folders are scanned in reverse, so that the first folders
+        # take precedence
+        for folder in reversed(self.folders):
+            try:
+                entries = os.listdir(str(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                match = VOICE_FOLDER_NAME.fullmatch(entry)
+                if match is None:
+                    continue
+                voice_folder = folder / entry
+                mtime = self._mtime(voice_folder)
+                database = voice_folder / entry
+                if database.is_file():
+                    lang, voice_id = match.groups()
+                    voices.setdefault(lang, {})[int(voice_id)] = database
+                elif voice_folder.is_dir():
+                    incomplete.append((voice_folder, mtime))
+        return voices, incomplete
+
+    @property
+    def voices(self) -> Dict[str, Dict[int, Path]]:
+        """Path of the diphone database of each voice, by language and
+        voice id"""
+        mtimes = self._folder_mtimes()
+        if mtimes != self._mtimes:
+            with self._lock:
+                if mtimes != self._mtimes:
+                    # the mtimes are taken before the scan, so that a change
+                    # during the scan triggers another one
+                    top_mtimes = tuple(map(self._mtime, self.folders))
+                    self._voices, incomplete = self._scan()
+                    self._incomplete = [folder for folder, _ in incomplete]
+                    self._mtimes = top_mtimes + tuple(
+                        mtime for _, mtime in incomplete)
+                    self.version += 1
+        return self._voices
+
+    def refresh(self):
+        """Forgets the scanned voices and the resolved binaries"""
+        with self._lock:
+            self._mtimes = None
+        find_binary.cache_clear()
+
+    def find(self, lang: str, voice_id: int) -> Optional[Path]:
+        """Returns the path of the voice's diphone database, or ``None`` if
+        it isn't installed"""
+        return self.voices.get(lang, {}).get(int(voice_id))
+
+    def voice_ids(self, lang: str) -> List[int]:
+        return sorted(self.voices.get(lang, {}))
+
+
+_registries: Dict[Tuple[str, ...], VoiceRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(folders: Sequence[str]) -> VoiceRegistry:
+    """Returns the registry shared by all the voices looking in ``folders``"""
+    key = tuple(str(folder) for folder in folders)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = VoiceRegistry(key)
+        return _registries[key]
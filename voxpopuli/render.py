@@ -0,0 +1,185 @@
+"""Rendering of corpora of texts (or .pho strings) to wave files, across
+worker processes, with a manifest of the renderings"""
+import csv
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, NamedTuple, Set, Union
+
+from .conversion import wav_header_size
+from .main import Voice
+from .phonemes import PhonemeList
+from .playback import WaveFormat
+
+VOICE_FIELDS = {"lang": str, "voice_id": int, "speed": int, "pitch": int,
+                "volume": float}
+
+
+def _error_item(line: int, error: Exception,
+                item_id: Any = None) -> Dict[str, Any]:
+    return {"id": item_id, "line": line,
+            "error": "%s: %s" % (type(error).__name__, error)}
+
+
+def _csv_items(corpus_file: IO) -> Iterator[Dict[str, Any]]:
+    reader = csv.DictReader(corpus_file)
+    for row in reader:
+        item = {field: value for field, value in row.items() if value}
+        try:
+            for field, field_type in VOICE_FIELDS.items():
+                if field in item:
+                    item[field] = field_type(item[field])
+        except ValueError as error:
+            yield _error_item(reader.line_num, error, item.get("id"))
+            continue
+        yield item
+
+
+def _json_items(corpus_file: IO) -> Iterator[Dict[str, Any]]:
+    for line_number, line in enumerate(corpus_file, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("Not a JSON object")
+        except ValueError as error:
+            yield _error_item(line_number, error)
+            continue
+        yield item
+
+
+def read_corpus(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Reads the items of a corpus one at a time, from a CSV file (if its
+    name ends with ``.csv``) or a JSON lines file. Each item has an ``id``,
+    either a ``text`` or a ``pho`` string, and optionally some of the
+    voice's parameters (``lang``, ``voice_id``, ``speed``, ``pitch`` and
+    ``volume``). A line that can't be read (malformed JSON, or voice
+    parameters of the wrong type) is yielded as an item holding its
+    ``line`` number and the ``error``, which ``render_corpus`` records as a
+    failure."""
+    with open(str(path), encoding="utf-8", newline="") as corpus_file:
+        if str(path).endswith(".csv"):
+            yield from _csv_items(corpus_file)
+        else:
+            yield from _json_items(corpus_file)
+
+
+def output_path(folder: Union[str, Path], item_id: str) -> Path:
+    item_id = str(item_id)
+    if (not item_id or item_id in (".", "..") or "/" in item_id
+            or os.sep in item_id):
+        raise ValueError("Invalid corpus id %r" % item_id)
+    return Path(folder) / (item_id + ".wav")
+
+
+def write_atomically(path: Path, data: bytes):
+    """Writes to a temporary file, renamed once complete, so that the file
+    is either absent or whole even if the rendering is interrupted"""
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=".")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# the voices of a worker process, kept across its items
+_voices: Dict[tuple, Voice] = {}
+
+
+def render_item(item: Dict[str, Any], folder: Union[str, Path],
+                defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """Renders one item of a corpus to ``folder``, and returns its manifest
+    record: its ``id``, ``path``, ``size`` (in bytes), ``duration`` (in
+    seconds) and the rendering time (``seconds``), or the ``error`` it
+    failed with"""
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"id": item.get("id")}
+    try:
+        path = output_path(folder, item["id"])
+        params = dict(defaults)
+        params.update((field, item[field]) for field in VOICE_FIELDS
+                      if item.get(field) is not None)
+        key = tuple(sorted(params.items()))
+        if key not in _voices:
+            _voices[key] = Voice(**params)
+        speech = (PhonemeList.from_pho_str(item["pho"]) if "pho" in item
+                  else item["text"])
+        wav = _voices[key].to_audio(speech)
+        write_atomically(path, wav)
+        wave_format = WaveFormat.from_header(wav)
+        record.update(path=str(path), size=len(wav),
+                      duration=(len(wav) - wav_header_size(wav))
+                      / (wave_format.sample_rate * wave_format.block_size))
+    except Exception as error:
+        record["error"] = "%s: %s" % (type(error).__name__, error)
+    record["seconds"] = round(time.perf_counter() - start, 6)
+    return record
+
+
+class RenderSummary(NamedTuple):
+    rendered: int
+    skipped: int
+    failed: int
+
+
+def render_corpus(corpus: Iterable[Dict[str, Any]], folder: Union[str, Path],
+                  manifest: IO, max_workers: int = None,
+                  defaults: Dict[str, Any] = None,
+                  resume: bool = True) -> RenderSummary:
+    """Renders the items of a corpus to ``<folder>/<id>.wav`` with up to
+    ``max_workers`` processes, writing a JSON line to the ``manifest`` text
+    file for each item as soon as it's done (see ``render_item``). The
+    items holding an ``error`` (see ``read_corpus``) are written as is, as
+    failures.
+
+    Only a bounded number of items is read ahead, so that the memory used
+    doesn't depend on the size of the corpus. The files are written
+    atomically, so if ``resume`` is set, the items whose file exists were
+    completely rendered by a previous run, and are skipped."""
+    defaults = defaults or {}
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    rendered = skipped = failed = 0
+    pending: Set[Future] = set()
+
+    def write_records(done: Set[Future]):
+        nonlocal rendered, failed
+        for future in done:
+            record = future.result()
+            if "error" in record:
+                failed += 1
+            else:
+                rendered += 1
+            manifest.write(json.dumps(record) + "\n")
+        manifest.flush()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for item in corpus:
+            if "error" in item:
+                # a line of the corpus that couldn't be read
+                failed += 1
+                manifest.write(json.dumps(item) + "\n")
+                continue
+            try:
+                path = output_path(folder, item.get("id", ""))
+            except ValueError:
+                path = None
+            if resume and path is not None and path.exists():
+                skipped += 1
+                continue
+            pending.add(executor.submit(render_item, item, folder, defaults))
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_records(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            write_records(done)
+    return RenderSummary(rendered, skipped, failed)
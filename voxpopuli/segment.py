@@ -0,0 +1,49 @@
+"""Splitting of long texts into segments that can be synthesized separately"""
+import re
+from typing import List, NamedTuple
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+CLAUSE_END = re.compile(r'(?<=[,;:])\s+')
+
+
+class Segment(NamedTuple):
+    """A piece of the rendered text, and the byte range of its frames in the
+    wave file (header included in the offsets)"""
+    text: str
+    start: int
+    end: int
+
+
+class SegmentedAudio(NamedTuple):
+    """A wave file rendered segment by segment, with the position of each
+    segment in it"""
+    wav: bytes
+    segments: List[Segment]
+
+
+def _group(clauses: List[str], max_length: int) -> List[str]:
+    groups = []
+    for clause in clauses:
+        if groups and len(groups[-1]) + len(clause) + 1 <= max_length:
+            groups[-1] += " " + clause
+        else:
+            groups.append(clause)
+    return groups
+
+
+def split_sentences(text: str, max_length: int = 400) -> List[str]:
+    """Splits a text into sentences. Sentences longer than ``max_length``
+    characters are split further at clause boundaries (commas, colons and
+    semicolons), the resulting clauses being grouped back up
+    to ``max_length``."""
+    segments = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(sentence) > max_length:
+            segments += _group([clause for clause in CLAUSE_END.split(sentence)
+                                if clause], max_length)
+        else:
+            segments.append(sentence)
+    return segments
@@ -0,0 +1,446 @@
+"""A local synthesis server, shared by several processes, and its client.
+
+The server speaks HTTP over a localhost port or a Unix socket. Requests
+are JSON objects holding the voice's parameters and a text or a .pho string:
+
+- ``POST /phonemes`` with ``{"voice": {...}, "text": ...}`` returns the .pho
+  string of the text
+- ``POST /audio`` with ``{"voice": {...}, "text": ...}`` (or ``"pho"``
+  instead of ``"text"``) returns a wave file, or streams it in chunks if
+  ``"stream"`` is set
+
+Failures are returned as a JSON object with an ``error`` (the name of the
+exception's class) and a ``message``."""
+import itertools
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.client import HTTPConnection, HTTPResponse, IncompleteRead
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import (Any, Dict, Iterator, List, NamedTuple, Optional, Tuple,
+                    Union)
+
+from .batch import map_batch
+from .cache import SynthesisCache
+from .errors import (MissingVoice, SynthesisError, SynthesisTimeout,
+                     UnknownDiphone)
+from .main import Voice
+from .phonemes import PhonemeList
+from .pool import ProcessPool
+
+Address = Union[Tuple[str, int], str]
+
+ERRORS = {error_class.__name__: error_class
+          for error_class in (SynthesisError, UnknownDiphone, MissingVoice,
+                              SynthesisTimeout, Voice.InvalidVoiceParameters)}
+
+
+class VoiceKey(NamedTuple):
+    """The parameters of a voice, as sent in the requests"""
+    lang: str = "fr"
+    voice_id: Optional[int] = None
+    speed: int = 160
+    pitch: int = 50
+    volume: Optional[float] = None
+
+    @classmethod
+    def from_json(cls, params: Dict[str, Any]) -> 'VoiceKey':
+        unknown_params = set(params) - set(cls._fields)
+        if unknown_params:
+            raise Voice.InvalidVoiceParameters(
+                "Unknown voice parameters %s" % ", ".join(unknown_params))
+        return cls(**params)
+
+
+class MicroBatcher:
+    """Renders the requests for one voice in batches: once a request comes
+    in, the ones arriving in the next ``max_delay`` seconds (up to
+    ``max_batch`` of them) are rendered along with it, the identical ones
+    only once, by up to ``max_workers`` concurrent renderings."""
+
+    def __init__(self, voice: Voice, max_batch: int = 32,
+                 max_delay: float = 0.005, max_workers: int = None):
+        self.voice = voice
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+        self.batches = 0
+        self.renderings = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, speech: str) -> Future:
+        """Queues a ``"phonemes"`` (text to .pho), ``"text"`` or ``"pho"``
+        (to wave) rendering, whose result is set on the returned future.
+        Once the batcher is closed, the rendering is done right away."""
+        future = Future()
+        with self._lock:
+            if not self._closed:
+                self._queue.put((kind, speech, future))
+                return future
+        try:
+            future.set_result(self._render((kind, speech)))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def close(self):
+        """Renders the queued requests, then stops the batcher's thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> Optional[List[Tuple[str, str, Future]]]:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                # stops after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _render(self, request: Tuple[str, str]) -> Union[str, bytes]:
+        kind, speech = request
+        if kind == "phonemes":
+            return str(self.voice.to_phonemes(speech))
+        if kind == "pho":
+            speech = PhonemeList.from_pho_str(speech)
+        return self.voice.to_audio(speech)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            futures: Dict[Tuple[str, str], List[Future]] = {}
+            for kind, speech, future in batch:
+                futures.setdefault((kind, speech), []).append(future)
+            requests = list(futures)
+            self.batches += 1
+            self.renderings += len(requests)
+            for result in map_batch(self._render, requests, self.max_workers):
+                for future in futures[requests[result.index]]:
+                    if result.ok:
+                        future.set_result(result.value)
+                    else:
+                        future.set_exception(result.error)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: Union['_TCPServer', '_UnixServer']
+
+    def address_string(self) -> str:
+        # Unix sockets have no client address
+        return (self.client_address[0] if isinstance(self.client_address, tuple)
+                else "unix")
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s" % (self.address_string(), format % args))
+
+    def _send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, error: Exception):
+        error_json = {"error": type(error).__name__, "message": str(error)}
+        if isinstance(error, SynthesisError):
+            error_json.update(stage=error.stage, returncode=error.returncode)
+        self._send(status, "application/json",
+                   json.dumps(error_json).encode("utf-8"))
+
+    def _send_stream(self, chunks: Iterator[bytes]):
+        """Sends the chunks with the chunked transfer encoding. The first
+        chunk is rendered before the response's headers are sent, so that a
+        failure to start is sent as an error; a failure halfway through cuts
+        the connection before the last chunk."""
+        chunks = iter(chunks)
+        first_chunk = next(chunks, b"")
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/wav")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in itertools.chain([first_chunk], chunks):
+                if chunk:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        except Exception as error:
+            logging.warning("Streamed rendering failed: %s" % error)
+            self.close_connection = True
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, "text/plain", b"ok")
+        else:
+            self._send_error(404, ValueError("No such resource %s" % self.path))
+
+    def do_POST(self):
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            request = json.loads(body.decode("utf-8"))
+            if not isinstance(request, dict):
+                raise ValueError("The request must be a JSON object")
+            key = VoiceKey.from_json(request.get("voice", {}))
+            synthesis = self.server.synthesis
+            if self.path == "/phonemes":
+                kind, speech = "phonemes", request["text"]
+            elif self.path == "/audio":
+                kind = "pho" if "pho" in request else "text"
+                speech = request[kind]
+            else:
+                self._send_error(404, ValueError("No such resource %s"
+                                                 % self.path))
+                return
+            if request.get("stream") and kind != "phonemes":
+                voice = synthesis.voice(key)
+                if kind == "pho":
+                    speech = PhonemeList.from_pho_str(speech)
+                self._send_stream(voice.stream_audio(speech))
+                return
+            future = synthesis.batcher(key).submit(kind, speech)
+            result = future.result()
+        except (ValueError, KeyError, TypeError,
+                Voice.InvalidVoiceParameters) as error:
+            self._send_error(400, error)
+        except SynthesisError as error:
+            self._send_error(500, error)
+        except Exception as error:
+            # the client still gets an answer instead of a dropped connection
+            logging.exception("Request to %s failed" % self.path)
+            self._send_error(500, error)
+        else:
+            if kind == "phonemes":
+                self._send(200, "text/plain; charset=utf-8",
+                           result.encode("utf-8"))
+            else:
+                self._send(200, "audio/wav", result)
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SynthesisServer:
+    """Renders the requests of any number of client processes with shared
+    voices, their warm espeak and mbrola workers (``pool_size`` per voice)
+    and a shared ``SynthesisCache``. Requests for the same voice parameters
+    are grouped by a ``MicroBatcher``. Only the ``max_voices`` most recently
+    used voices are kept, along with their batchers.
+
+    ``address`` is either a ``(host, port)`` tuple (port 0 picks a free port,
+    see ``address`` once the server is created) or the path of a Unix
+    socket."""
+
+    def __init__(self, address: Address = ("localhost", 8999),
+                 pool_size: int = 1, cache: SynthesisCache = None,
+                 timeout: float = None, max_batch: int = 32,
+                 max_delay: float = 0.005, max_workers: int = None,
+                 max_voices: int = 32):
+        self.pool = ProcessPool(pool_size)
+        self.cache = cache
+        self.timeout = timeout
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_workers = max_workers
+        self.max_voices = max_voices
+        self._voices: 'OrderedDict[VoiceKey, Voice]' = OrderedDict()
+        self._batchers: Dict[VoiceKey, MicroBatcher] = {}
+        self._lock = threading.Lock()
+        if isinstance(address, str):
+            # a socket left over by a previous server is replaced
+            if (os.path.exists(address)
+                    and stat.S_ISSOCK(os.stat(address).st_mode)):
+                os.unlink(address)
+            self._server = _UnixServer(address, _RequestHandler)
+        else:
+            self._server = _TCPServer(address, _RequestHandler)
+        self._server.synthesis = self
+
+    @property
+    def address(self) -> Address:
+        address = self._server.server_address
+        return address if isinstance(address, str) else tuple(address[:2])
+
+    def _voice(self, key: VoiceKey) -> Tuple[Voice, List[MicroBatcher]]:
+        """Returns the key's voice, and the batchers of the least recently
+        used voices it evicted, which the caller closes once the lock is
+        released (closing waits for their queued requests)"""
+        evicted = []
+        if key in self._voices:
+            self._voices.move_to_end(key)
+        else:
+            self._voices[key] = Voice(**key._asdict(), pool=self.pool,
+                                      cache=self.cache, timeout=self.timeout)
+            while len(self._voices) > self.max_voices:
+                evicted_key, _ = self._voices.popitem(last=False)
+                if evicted_key in self._batchers:
+                    evicted.append(self._batchers.pop(evicted_key))
+        return self._voices[key], evicted
+
+    def voice(self, key: VoiceKey) -> Voice:
+        with self._lock:
+            voice, evicted = self._voice(key)
+        for batcher in evicted:
+            batcher.close()
+        return voice
+
+    def batcher(self, key: VoiceKey) -> MicroBatcher:
+        with self._lock:
+            voice, evicted = self._voice(key)
+            if key not in self._batchers:
+                self._batchers[key] = MicroBatcher(
+                    voice, self.max_batch, self.max_delay, self.max_workers)
+            batcher = self._batchers[key]
+        for evicted_batcher in evicted:
+            evicted_batcher.close()
+        return batcher
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stops ``serve_forever`` (from another thread)"""
+        self._server.shutdown()
+
+    def close(self):
+        self._server.server_close()
+        with self._lock:
+            batchers = list(self._batchers.values())
+            self._batchers.clear()
+            self._voices.clear()
+        for batcher in batchers:
+            batcher.close()
+        self.pool.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _UnixHTTPConnection(HTTPConnection):
+
+    def __init__(self, path: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class VoiceClient:
+    """Renders through a ``SynthesisServer`` at ``address``, with the same
+    rendering methods as a ``Voice`` with the same parameters. The server's
+    errors are raised as the matching ``Voice`` exceptions."""
+
+    def __init__(self, address: Address = ("localhost", 8999),
+                 speed: int = 160, pitch: int = 50, lang: str = "fr",
+                 voice_id: int = None, volume: float = None,
+                 timeout: float = None):
+        self.address = address
+        self.key = VoiceKey(lang, voice_id, speed, pitch, volume)
+        self.timeout = timeout
+
+    def _connection(self) -> HTTPConnection:
+        if isinstance(self.address, str):
+            return _UnixHTTPConnection(self.address, self.timeout)
+        host, port = self.address
+        return HTTPConnection(host, port, timeout=self.timeout)
+
+    @staticmethod
+    def _raise(response: HTTPResponse):
+        error_json = json.loads(response.read().decode("utf-8"))
+        error_class = ERRORS.get(error_json["error"], SynthesisError)
+        if issubclass(error_class, SynthesisError):
+            raise error_class(error_json["message"], error_json.get("stage"),
+                              error_json.get("returncode"))
+        raise error_class(error_json["message"])
+
+    def _post(self, path: str, request: Dict[str, Any]) -> HTTPResponse:
+        """Sends a request, returning the response once its headers are
+        read. The connection is closed along with the response."""
+        request["voice"] = self.key._asdict()
+        connection = self._connection()
+        connection.request("POST", path, json.dumps(request).encode("utf-8"),
+                           {"Content-Type": "application/json",
+                            "Connection": "close"})
+        response = connection.getresponse()
+        if response.status != 200:
+            with response:
+                self._raise(response)
+        return response
+
+    @staticmethod
+    def _speech_request(speech: Union[PhonemeList, str]) -> Dict[str, Any]:
+        if isinstance(speech, PhonemeList):
+            return {"pho": str(speech)}
+        return {"text": speech}
+
+    def to_phonemes(self, text: str) -> PhonemeList:
+        with self._post("/phonemes", {"text": text}) as response:
+            return PhonemeList.from_pho_bytes(response.read())
+
+    def to_audio(self, speech: Union[PhonemeList, str], filename=None) -> bytes:
+        with self._post("/audio", self._speech_request(speech)) as response:
+            wav = response.read()
+        if filename is not None:
+            with open(filename, "wb") as wavfile:
+                wavfile.write(wav)
+        return wav
+
+    def stream_audio(self, speech: Union[PhonemeList, str],
+                     chunk_size: int = 4096) -> Iterator[bytes]:
+        """Yields the wave file in chunks as the server renders it, the
+        header's sizes being set to ``0xFFFFFFFF`` as in
+        ``Voice.stream_audio``"""
+        request = dict(self._speech_request(speech), stream=True)
+        with self._post("/audio", request) as response:
+            try:
+                while True:
+                    chunk = response.read1(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            except IncompleteRead:
+                raise SynthesisError("The server's rendering failed", "mbrola")
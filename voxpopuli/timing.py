@@ -0,0 +1,186 @@
+"""Where each phoneme, word and phrase of a rendering falls in its audio,
+computed from the phonemes' durations"""
+import re
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from .phonemes import PAUSE, PhonemeList, _numpy
+
+# espeak makes a pause at each of these
+PHRASE_END = re.compile(r"[,;:.!?…]+")
+WORD = re.compile(r"\w[\w'’-]*")
+
+
+def _sample_offsets(durations: List[Union[int, float]], sample_rate: int,
+                    total_samples: Optional[int]) -> array:
+    """The first sample of each phoneme, followed by the end of the last
+    one. mbrola's output doesn't exactly last the sum of the durations: the
+    offsets are stretched to ``total_samples`` if it's given."""
+    try:
+        np = _numpy()
+    except ImportError:
+        offsets_ms = list(accumulate([0] + durations))
+        scale = sample_rate / 1000
+        if total_samples is not None and offsets_ms[-1]:
+            scale = total_samples / offsets_ms[-1]
+        return array('I', [int(round(offset * scale))
+                           for offset in offsets_ms])
+    offsets_ms = np.zeros(len(durations) + 1, dtype=np.float64)
+    np.cumsum(durations, out=offsets_ms[1:])
+    scale = sample_rate / 1000
+    if total_samples is not None and offsets_ms[-1]:
+        scale = total_samples / offsets_ms[-1]
+    starts = array('I')
+    starts.frombytes(np.rint(offsets_ms * scale).astype(starts.typecode)
+                     .tobytes())
+    return starts
+
+
+def _word_bounds(phonemes: Sequence[int],
+                 words: List[str]) -> List[Tuple[int, int]]:
+    """Splits a run of phonemes (given by their indices) among its words, in
+    proportion to their number of letters, each word getting at least one
+    phoneme if there are enough. Returns the first and last (excluded)
+    phoneme of each word."""
+    letters = list(accumulate(len(word) for word in words))
+    count = len(phonemes)
+    bounds = [0]
+    for index, word_letters in enumerate(letters):
+        bound = int(round(count * word_letters / letters[-1]))
+        if count >= len(words):
+            bound = min(max(bound, bounds[-1] + 1),
+                        count - (len(words) - index - 1))
+        bounds.append(bound)
+    spans = []
+    for start, end in zip(bounds, bounds[1:]):
+        if start < end:
+            spans.append((phonemes[start], phonemes[end - 1] + 1))
+        else:
+            first = phonemes[start] if start < count else phonemes[-1] + 1
+            spans.append((first, first))
+    return spans
+
+
+class TimingIndex:
+    """The sample offsets of the phonemes of a rendering, and of its
+    phrases: the runs of phonemes between two of espeak's pauses, which
+    espeak makes at punctuation. The offsets are held in compact arrays, and
+    looking up the phoneme or phrase playing at a given sample is a binary
+    search.
+
+    ``starts`` holds the first sample of each phoneme, followed by the end
+    of the last one. Phrase ``i`` spans the phonemes ``phrase_starts[i]`` to
+    ``phrase_ends[i]`` (excluded), and ``phrase_texts`` holds the text of
+    each phrase, if the text is known and splitting it at punctuation gives
+    as many phrases as espeak's pauses did.
+
+    Word ``i`` likewise spans the phonemes ``word_starts[i]`` to
+    ``word_ends[i]`` (excluded), and its text is ``word_texts[i]``. The
+    words are known only if the text is: espeak's phonemes don't mark the
+    word boundaries, so they come from its pauses if it made one between each
+    word. Otherwise, the words of each phrase share its phonemes in
+    proportion to their number of letters (an estimate), or if the phrases
+    aren't known, the words of the text share all the spoken phonemes."""
+
+    def __init__(self, phonemes: PhonemeList, sample_rate: int,
+                 total_samples: int = None, text: str = None):
+        self.phonemes = phonemes
+        self.sample_rate = sample_rate
+        self.starts = _sample_offsets(phonemes.durations(), sample_rate,
+                                      total_samples)
+
+        names = phonemes.names()
+        self.phrase_starts, self.phrase_ends = array('I'), array('I')
+        in_phrase = False
+        for index, name in enumerate(names):
+            if (name != PAUSE) != in_phrase:
+                in_phrase = not in_phrase
+                (self.phrase_starts if in_phrase
+                 else self.phrase_ends).append(index)
+        if in_phrase:
+            self.phrase_ends.append(len(phonemes))
+
+        self.phrase_texts: Optional[List[str]] = None
+        if text is not None:
+            phrases = [phrase.strip() for phrase in PHRASE_END.split(text)
+                       if phrase.strip()]
+            if len(phrases) == len(self.phrase_starts):
+                self.phrase_texts = phrases
+
+        self.word_starts, self.word_ends = array('I'), array('I')
+        self.word_texts: Optional[List[str]] = None
+        if text is not None:
+            words = WORD.findall(text)
+            phrases = list(zip(self.phrase_starts, self.phrase_ends))
+            if len(phrases) == len(words):
+                groups = [(range(*phrase), [word])
+                          for phrase, word in zip(phrases, words)]
+            elif self.phrase_texts is not None:
+                groups = [(range(*phrase), WORD.findall(phrase_text))
+                          for phrase, phrase_text
+                          in zip(phrases, self.phrase_texts)]
+            else:
+                groups = [([index for index, name in enumerate(names)
+                            if name != PAUSE], words)]
+            self.word_texts = []
+            for spoken, words in groups:
+                if not spoken or not words:
+                    continue
+                self.word_texts.extend(words)
+                for start, end in _word_bounds(spoken, words):
+                    self.word_starts.append(start)
+                    self.word_ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self.starts) - 1
+
+    @property
+    def total_samples(self) -> int:
+        return self.starts[-1]
+
+    def phoneme_at(self, sample: int) -> int:
+        """Index of the phoneme playing at a sample, -1 if it's past the
+        last phoneme"""
+        index = bisect_right(self.starts, sample) - 1
+        return index if index < len(self) else -1
+
+    def phoneme_span(self, index: int) -> Tuple[int, int]:
+        """First and last (excluded) samples of a phoneme"""
+        return self.starts[index], self.starts[index + 1]
+
+    def phrase_at(self, sample: int) -> int:
+        """Index of the phrase playing at a sample, -1 during a pause"""
+        phoneme = self.phoneme_at(sample)
+        phrase = bisect_right(self.phrase_starts, phoneme) - 1
+        if phoneme < 0 or phrase < 0 or phoneme >= self.phrase_ends[phrase]:
+            return -1
+        return phrase
+
+    def phrase_span(self, index: int) -> Tuple[int, int]:
+        """First and last (excluded) samples of a phrase"""
+        return (self.starts[self.phrase_starts[index]],
+                self.starts[self.phrase_ends[index]])
+
+    def word_at(self, sample: int) -> int:
+        """Index of the word playing at a sample, -1 during a pause"""
+        phoneme = self.phoneme_at(sample)
+        word = bisect_right(self.word_starts, phoneme) - 1
+        if phoneme < 0 or word < 0 or phoneme >= self.word_ends[word]:
+            return -1
+        return word
+
+    def word_span(self, index: int) -> Tuple[int, int]:
+        """First and last (excluded) samples of a word"""
+        return (self.starts[self.word_starts[index]],
+                self.starts[self.word_ends[index]])
+
+    def seconds(self, sample: int) -> float:
+        return sample / self.sample_rate
+
+
+class TimedAudio(NamedTuple):
+    """A wave file, along with the timing of its phonemes"""
+    wav: bytes
+    timing: TimingIndex
@@ -1,10 +1,16 @@
 import argparse
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from os import makedirs
 from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
 from urllib import request
+from urllib.error import HTTPError
 
 BASE_URL = "https://github.com/numediart/MBROLA-voices/raw/master/data/%s/%s"
 MBROLA_FOLDER = Path("/usr/share/mbrola/")
+CHUNK_SIZE = 64 * 1024
 
 LANG_FILES = {'cn': [1],
               'ir': [1],
@@ -45,6 +51,10 @@ LANG_FILES = {'cn': [1],
               'pl': [1]}
 
 
+class ChecksumMismatch(Exception):
+    pass
+
+
 def create_folder_and_extract(voice_name, zfile):
     try:
         makedirs(MBROLA_FOLDER + voice_name + "/")
@@ -53,24 +63,133 @@ def create_folder_and_extract(voice_name, zfile):
     zfile.extract(voice_name, MBROLA_FOLDER + voice_name + "/")
 
 
-def install_voices(lang="fr"):
-    """Automatically downloads and extracts all the voices for one language in the /usr/share/mbrola folder"""
-    for voice_id in LANG_FILES[lang]:
-        voice_name = lang + str(voice_id)
-        print("Downloading MBROLA language file for voice %s" % voice_name)
-        voice_data = request.urlopen(BASE_URL % (voice_name, voice_name)).read()
-        # creating folder for the language file
-        print("Writing data for language %s" % voice_name)
-        voice_folder = MBROLA_FOLDER / Path(voice_name)
-        voice_folder.mkdir(parents=True, exist_ok=True)
-        lang_path = voice_folder / Path(voice_name)
-        with open(str(lang_path), "wb") as lang_file:
-            lang_file.write(voice_data)
+def read_checksums(source: str) -> Dict[str, str]:
+    """Reads the sha256 of the voices from a file (or URL) in the format of
+    ``sha256sum``, where each line is a checksum followed by a voice name"""
+    if os.path.exists(source):
+        with open(source, "rb") as checksums_file:
+            content = checksums_file.read()
+    else:
+        content = request.urlopen(source).read()
+    checksums = {}
+    for line in content.decode("utf-8").splitlines():
+        if line.strip():
+            checksum, name = line.split(maxsplit=1)
+            checksums[Path(name.strip().lstrip("*")).name] = checksum.lower()
+    return checksums
+
+
+def sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(str(path), "rb") as voice_file:
+        for chunk in iter(lambda: voice_file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_source(voice_name: str, mirror: Optional[str],
+                offset: int) -> Tuple[BinaryIO, bool]:
+    """Opens the voice file at the mirror (a folder laid out like the
+    ``data`` folder of the voices repository, or the URL of such a folder),
+    starting at ``offset`` if possible. Returns the stream, and whether it
+    does start at ``offset`` (else it starts at the beginning)."""
+    if mirror is not None and os.path.isdir(mirror):
+        source = open(os.path.join(mirror, voice_name, voice_name), "rb")
+        source.seek(offset)
+        return source, True
+    url = (BASE_URL if mirror is None
+           else mirror.rstrip("/") + "/%s/%s") % (voice_name, voice_name)
+    voice_request = request.Request(url)
+    if offset:
+        voice_request.add_header("Range", "bytes=%d-" % offset)
+    try:
+        response = request.urlopen(voice_request)
+    except HTTPError as error:
+        if error.code != 416:
+            raise
+        # the range starts at the end of the file: the partial download
+        # is complete
+        error.close()
+        return open(os.devnull, "rb"), True
+    return response, response.status == 206
+
+
+def download(voice_name: str, partial_path: Path, mirror: Optional[str]):
+    """Downloads a voice to ``partial_path``, resuming from what it already
+    holds"""
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    source, resumed = open_source(voice_name, mirror, offset)
+    with source, open(str(partial_path), "ab" if resumed else "wb") as output:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            output.write(chunk)
+
+
+def install_voice(voice_name: str, folder: Union[str, Path] = MBROLA_FOLDER,
+                  mirror: str = None, checksum: str = None,
+                  force: bool = False) -> bool:
+    """Downloads a voice into ``folder``, unless it's already there (with
+    the right checksum, if one is given). The download goes to a partial file,
+    from which it's resumed if interrupted, and which is renamed to the
+    voice's name once complete and verified. Returns whether the voice was
+    downloaded."""
+    voice_folder = Path(folder) / voice_name
+    voice_path = voice_folder / voice_name
+    if (not force and voice_path.is_file()
+            and (checksum is None or sha256(voice_path) == checksum)):
+        print("Voice %s is already installed" % voice_name)
+        return False
+
+    voice_folder.mkdir(parents=True, exist_ok=True)
+    partial_path = voice_folder / ("." + voice_name + ".part")
+    print("Downloading MBROLA language file for voice %s" % voice_name)
+    download(voice_name, partial_path, mirror)
+    if checksum is not None and sha256(partial_path) != checksum:
+        # the partial file may have been stale: starts over once
+        partial_path.unlink()
+        download(voice_name, partial_path, mirror)
+        if sha256(partial_path) != checksum:
+            partial_path.unlink()
+            raise ChecksumMismatch("The download of voice %s doesn't match "
+                                   "its checksum" % voice_name)
+    os.replace(str(partial_path), str(voice_path))
+    return True
+
+
+def install_voices(lang="fr", folder: Union[str, Path] = MBROLA_FOLDER,
+                   mirror: str = None, max_workers: int = 4,
+                   checksums: Dict[str, str] = None,
+                   force: bool = False) -> List[str]:
+    """Automatically downloads all the voices for one language in the
+    /usr/share/mbrola folder (or ``folder``), ``max_workers`` at a time.
+    Returns the names of the downloaded voices."""
+    return install_voice_names([lang + str(voice_id)
+                                for voice_id in LANG_FILES[lang]],
+                               folder, mirror, max_workers, checksums, force)
+
+
+def install_voice_names(voice_names: List[str],
+                        folder: Union[str, Path] = MBROLA_FOLDER,
+                        mirror: str = None, max_workers: int = 4,
+                        checksums: Dict[str, str] = None,
+                        force: bool = False) -> List[str]:
+    checksums = checksums or {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(install_voice, voice_name, folder, mirror,
+                                   checksums.get(voice_name), force)
+                   for voice_name in voice_names]
+        # raises the first error, after all the downloads are done
+        return [voice_name for voice_name, future in zip(voice_names, futures)
+                if future.result()]
 
 
 argparser = argparse.ArgumentParser()
-argparser.add_argument("languages", nargs="+", choices=list(LANG_FILES.keys()), type=str, help="Languages to install")
+argparser.add_argument("languages", nargs="*", type=str, help="Languages to install, among %s" % ", ".join(LANG_FILES))
 argparser.add_argument("--all", action="store_true", help="Download all language files")
+argparser.add_argument("--folder", default=str(MBROLA_FOLDER), help="Folder the voices are installed in")
+argparser.add_argument("--mirror", help="Folder or URL to download the voices from, laid out like the voices repository's data folder")
+argparser.add_argument("--workers", type=int, default=4, help="Number of concurrent downloads")
+argparser.add_argument("--checksums", help="File or URL of the voices' sha256 checksums, in the sha256sum format")
+argparser.add_argument("--force", action="store_true", help="Download the voices even if they're already installed")
 
 if __name__ == "__main__":
     args = argparser.parse_args()
@@ -78,6 +197,14 @@ if __name__ == "__main__":
         languages = list(LANG_FILES.keys())
     else:
         languages = args.languages
-    for lang in languages:
-        print("Installing voices for languages %s" % lang)
-        install_voices(lang)
\ No newline at end of file
+    if not languages:
+        argparser.error("Pick some languages, or --all of them")
+    unknown_languages = [lang for lang in languages if lang not in LANG_FILES]
+    if unknown_languages:
+        argparser.error("No voices for languages %s" % ", ".join(unknown_languages))
+    print("Installing voices for languages %s" % ", ".join(languages))
+    install_voice_names([lang + str(voice_id) for lang in languages
+                         for voice_id in LANG_FILES[lang]],
+                        args.folder, args.mirror, args.workers,
+                        read_checksums(args.checksums) if args.checksums
+                        else None, args.force)